@@ -29,8 +29,12 @@ from binascii import (
 )
 
 from base64 import (
+    b64encode as _b64encode,
     b64decode as _b64decode,
 )
+from sqlite3 import (
+    Binary,
+)
 
 _b64decode_validator = _compile(b'^[A-Za-z0-9-_]*={0,2}$')
 
@@ -41,3 +45,27 @@ def urlsafe_b64decode(s):
     if not _b64decode_validator.match(s):
         raise Error('Non-base64 digit found')
     return _b64decode(s, altchars=b"-_")
+
+
+def b64_to_blob(text):
+    """
+    Convert the base64-encoded form of a token, as used everywhere outside of
+    the database, to the raw bytes stored in the database.
+
+    :param unicode text: The base64-encoded token.
+
+    :return: A value suitable for use as a parameter for a BLOB column.
+    """
+    return Binary(_b64decode(text.encode("ascii")))
+
+
+def blob_to_b64(blob):
+    """
+    Convert the raw bytes of a token read from the database to its
+    base64-encoded form.
+
+    :param buffer blob: The value read from a BLOB column.
+
+    :return unicode: The base64-encoded token.
+    """
+    return _b64encode(bytes(blob)).decode("ascii")
@@ -0,0 +1,48 @@
+# Copyright 2020 PrivateStorage.io, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+This module implements helpers for code which must work with results that
+may or may not be ``Deferred``.
+"""
+
+from __future__ import (
+    absolute_import,
+)
+
+from twisted.internet.defer import (
+    Deferred,
+)
+
+
+def then(result, f, *args, **kwargs):
+    """
+    Call a function with a result as soon as the result is available.
+
+    This lets code work the same way with a ``VoucherStore``, which computes
+    its results synchronously, and with an ``AsyncVoucherStore``, which
+    computes them in another thread.  Synchronous results stay synchronous.
+
+    :param result: A value or a ``Deferred`` which will fire with a value.
+
+    :param f: A function to call with the value as its first argument.
+        Additional positional and keyword arguments are passed along as well.
+
+    :return: The result of ``f`` if ``result`` is not a ``Deferred``.
+        Otherwise, a ``Deferred`` which fires with the result of ``f``.
+    """
+    if isinstance(result, Deferred):
+        return result.addCallback(f, *args, **kwargs)
+    return f(result, *args, **kwargs)
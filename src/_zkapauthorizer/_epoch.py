@@ -0,0 +1,66 @@
+# Copyright 2020 PrivateStorage.io, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+This module implements the representation of times in the database as
+integer numbers of microseconds since the epoch.
+"""
+
+from __future__ import (
+    absolute_import,
+)
+
+from time import (
+    mktime,
+)
+from datetime import (
+    datetime,
+    timedelta,
+)
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def datetime_to_epoch(when):
+    """
+    :param datetime when: A time.  A time with no timezone is taken to be
+        UTC.
+
+    :return int: The number of microseconds from the epoch to ``when``.
+    """
+    offset = when.utcoffset()
+    if offset is not None:
+        when = when.replace(tzinfo=None) - offset
+    delta = when - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def local_datetime_to_epoch(when):
+    """
+    :param datetime when: A time with no timezone which is taken to be local
+        time (as given by ``datetime.now``).
+
+    :return int: The number of microseconds from the epoch to ``when``.
+    """
+    return int(mktime(when.timetuple())) * 1000000 + when.microsecond
+
+
+def epoch_to_datetime(microseconds):
+    """
+    :param int microseconds: A number of microseconds from the epoch.
+
+    :return datetime: The time that many microseconds after the epoch, with
+        no timezone.
+    """
+    return _EPOCH + timedelta(microseconds=microseconds)
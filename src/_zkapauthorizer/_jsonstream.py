@@ -0,0 +1,198 @@
+# Copyright 2020 PrivateStorage.io, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+This module implements incremental decoding of JSON documents which are too
+large to comfortably decode all at once.
+"""
+
+from __future__ import (
+    absolute_import,
+)
+
+from codecs import (
+    getincrementaldecoder,
+)
+from json import (
+    JSONDecoder,
+)
+
+_WHITESPACE = u" \t\n\r"
+_NUMBER = u"0123456789+-.eE"
+
+
+class _Buffer(object):
+    """
+    Hold the part of a document which has been read but not yet decoded.
+
+    :ivar _read: A one-argument callable like ``file.read``.
+
+    :ivar int _chunk_size: The number of bytes to read at once.
+
+    :ivar unicode _text: Text which has been read.
+
+    :ivar int _position: The index into ``_text`` of the first character
+        which has not been decoded.
+
+    :ivar bool _eof: ``True`` once ``_read`` has returned no bytes.
+    """
+    def __init__(self, read, chunk_size):
+        self._read = read
+        self._chunk_size = chunk_size
+        self._utf8 = getincrementaldecoder("utf-8")()
+        self._decoder = JSONDecoder()
+        self._text = u""
+        self._position = 0
+        self._eof = False
+
+    def _more(self):
+        """
+        Read another chunk of the document.
+
+        :return bool: ``True`` if more text is available, ``False`` if the end
+            of the document has been reached.
+        """
+        if self._eof:
+            return False
+        data = self._read(self._chunk_size)
+        if not data:
+            self._eof = True
+        text = self._utf8.decode(data, final=self._eof)
+        self._text = self._text[self._position:] + text
+        self._position = 0
+        return bool(text) or not self._eof
+
+    def _skip_whitespace(self):
+        while True:
+            while (
+                self._position < len(self._text) and
+                self._text[self._position] in _WHITESPACE
+            ):
+                self._position += 1
+            if self._position < len(self._text) or not self._more():
+                return
+
+    def peek(self):
+        """
+        :return unicode: The next character which is not whitespace, without
+            consuming it, or the empty string at the end of the document.
+        """
+        self._skip_whitespace()
+        return self._text[self._position:self._position + 1]
+
+    def expect(self, character):
+        """
+        Consume the next character which is not whitespace.
+
+        :raise ValueError: If it is not ``character``.
+        """
+        found = self.peek()
+        if found != character:
+            raise ValueError(
+                "Expected {!r} but found {!r}".format(character, found),
+            )
+        self._position += 1
+
+    def value(self):
+        """
+        Decode and consume the next JSON value.
+
+        :raise ValueError: If there is no complete, valid JSON value next.
+        """
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._text, self._position)
+            except ValueError:
+                if not self._more():
+                    raise
+            else:
+                # A number which runs up to the end of the text or which is
+                # followed by something which cannot follow a number might
+                # continue in the next chunk.
+                complete = (
+                    end < len(self._text) and
+                    self._text[end] not in _NUMBER
+                )
+                if complete or not self._more():
+                    self._position = end
+                    return value
+
+    def end(self):
+        """
+        :raise ValueError: If anything other than whitespace remains.
+        """
+        if self.peek():
+            raise ValueError("Extra data after the end of the document")
+
+
+def iter_array(read, key, chunk_size=2 ** 16):
+    """
+    Decode the elements of an array which is a property of a JSON object, one
+    at a time, without reading the whole document into memory.  The other
+    properties of the object are decoded and discarded.
+
+    :param read: A one-argument callable like ``file.read`` which returns
+        UTF-8 encoded bytes of the document.
+
+    :param unicode key: The name of the property holding the array.
+
+    :param int chunk_size: The number of bytes to read at once.
+
+    :raise ValueError: While iterating, if the document is not valid JSON or
+        does not have the expected structure.  Elements before the error are
+        produced first.
+
+    :return: An iterator of the decoded elements of the array.
+    """
+    buf = _Buffer(read, chunk_size)
+    buf.expect(u"{")
+    found = False
+    if buf.peek() != u"}":
+        while True:
+            name = buf.value()
+            if not isinstance(name, unicode):
+                raise ValueError("Expected a property name but found {!r}".format(name))
+            buf.expect(u":")
+            if name != key:
+                buf.value()
+            elif found:
+                raise ValueError("Found property {!r} more than once".format(key))
+            else:
+                found = True
+                for element in _iter_elements(buf):
+                    yield element
+            if buf.peek() == u"}":
+                break
+            buf.expect(u",")
+    buf.expect(u"}")
+    buf.end()
+    if not found:
+        raise ValueError("Expected property {!r} but found none".format(key))
+
+
+def _iter_elements(buf):
+    """
+    Decode and consume the elements of the array which comes next in ``buf``.
+    """
+    buf.expect(u"[")
+    if buf.peek() == u"]":
+        buf.expect(u"]")
+        return
+    while True:
+        yield buf.value()
+        if buf.peek() == u"]":
+            buf.expect(u"]")
+            return
+        buf.expect(u",")
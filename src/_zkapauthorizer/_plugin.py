@@ -65,7 +65,9 @@ from .api import (
 )
 
 from .model import (
+    SHARD_DB_NAME,
     VoucherStore,
+    AsyncVoucherStore,
 )
 
 from .resource import (
@@ -74,12 +76,20 @@ from .resource import (
 from .storage_common import (
     BYTES_PER_PASS,
     get_configured_pass_value,
+    get_configured_database_thread,
+    get_configured_token_reservoir_size,
+    get_configured_token_reservoir_latency,
+    get_configured_token_commit_latency,
+    get_configured_token_shards,
 )
 from .controller import (
     get_redeemer,
 )
 from .spending import (
     SpendingController,
+    TokenReservoir,
+    TokenStateJournal,
+    ShardedTokenPool,
 )
 
 from .lease_maintenance import (
@@ -90,6 +100,10 @@ from .lease_maintenance import (
 
 _log = Logger()
 
+# The smallest number of tokens moved from the main database to a token shard
+# at once.  See ``ShardedTokenPool``.
+_SHARD_BATCH_SIZE = 256
+
 @implementer(IAnnounceableStorageServer)
 @attr.s
 class AnnounceableStorageServer(object):
@@ -111,24 +125,123 @@ class ZKAPAuthorizer(object):
         same would be true) probably reflects an error in the interface which
         forces different methods to use instance state to share a database
         connection.
+
+    :ivar WeakValueDictionary _token_sources: A mapping from node directories
+        to the ``TokenReservoir``, ``TokenStateJournal`` or
+        ``ShardedTokenPool`` shared by all storage clients for those nodes.
     """
     name = attr.ib(default=u"privatestorageio-zkapauthz-v1")
     _stores = attr.ib(default=attr.Factory(WeakValueDictionary))
+    _token_sources = attr.ib(default=attr.Factory(WeakValueDictionary))
 
-    def _get_store(self, node_config):
+    def _get_store(self, node_config, reactor=None):
         """
-        :return VoucherStore: The database for the given node.  At most one
-            connection is made to the database per ``ZKAPAuthorizer`` instance.
+        :return VoucherStore|AsyncVoucherStore: The database for the given
+            node.  At most one connection is made to the database per
+            ``ZKAPAuthorizer`` instance.  If the node is configured to use a
+            database thread then the store performs its work there and
+            returns ``Deferred`` results.  ``reactor`` is passed on to
+            ``_open_store``.
         """
         key =  node_config.get_config_path()
         try:
             s = self._stores[key]
         except KeyError:
-            s = VoucherStore.from_node_config(node_config, datetime.now)
+            s = self._open_store(node_config, reactor)
             self._stores[key] = s
         return s
 
 
+    def _open_store(self, node_config, reactor=None, **kw):
+        """
+        :param reactor: The reactor which receives results from the database
+            thread, if one is used, and stops it at shutdown.  If ``None``,
+            the global reactor.
+
+        :return VoucherStore|AsyncVoucherStore: A new connection to one of the
+            node's databases, doing its work in a dedicated thread if the
+            node is configured to use one.  Keyword arguments are passed on
+            to ``from_node_config``.
+        """
+        if get_configured_database_thread(node_config):
+            if reactor is None:
+                from twisted.internet import reactor
+            store = AsyncVoucherStore.from_node_config(
+                node_config,
+                datetime.utcnow,
+                reactor,
+                **kw
+            )
+            # Rewriting an older database so that deleted rows can be given
+            # back to the filesystem is slow, so only do it where it does not
+            # hold up the reactor.
+            switching = store.enable_incremental_vacuum()
+            switching.addErrback(
+                lambda reason: _log.failure(
+                    "Enabling incremental vacuuming of {path}",
+                    reason,
+                    path=store.database_path,
+                ),
+            )
+            return store
+        return VoucherStore.from_node_config(node_config, datetime.utcnow, **kw)
+
+
+    def _get_token_source(self, node_config, reactor):
+        """
+        :return: The object from which storage clients for the given node take
+            tokens to spend.  This is the node's store unless a token state
+            journal, token reservoir, or token shards are configured.
+        """
+        source = self._get_store(node_config, reactor)
+        commit_latency = get_configured_token_commit_latency(node_config)
+        reservoir_size = get_configured_token_reservoir_size(node_config)
+        shards = get_configured_token_shards(node_config)
+        if commit_latency == 0 and reservoir_size == 0 and shards == 0:
+            return source
+
+        key = node_config.get_config_path()
+        try:
+            return self._token_sources[key]
+        except KeyError:
+            pass
+
+        if shards > 0:
+            # Each shard has its own connection (and its own thread, if
+            # configured) so that spending from one does not wait for
+            # another.
+            source = ShardedTokenPool(
+                source,
+                list(
+                    self._open_store(
+                        node_config,
+                        reactor,
+                        name=SHARD_DB_NAME.format(n),
+                    )
+                    for n
+                    in range(shards)
+                ),
+                _SHARD_BATCH_SIZE,
+            )
+
+        # Both of these record outstanding changes before the process exits.
+        # The journal's trigger is added first so that it records changes
+        # from the reservoir's trigger without waiting.
+        if commit_latency > 0:
+            source = TokenStateJournal(source, reactor, commit_latency)
+            reactor.addSystemEventTrigger("before", "shutdown", source.stop)
+        if reservoir_size > 0:
+            source = TokenReservoir(
+                source,
+                reactor,
+                reservoir_size,
+                get_configured_token_reservoir_latency(node_config),
+            )
+            reactor.addSystemEventTrigger("before", "shutdown", source.stop)
+        self._token_sources[key] = source
+        return source
+
+
     def _get_redeemer(self, node_config, announcement, reactor):
         """
         :return IRedeemer: The voucher redeemer indicated by the given
@@ -173,10 +286,9 @@ class ZKAPAuthorizer(object):
         """
         from twisted.internet import reactor
         redeemer = self._get_redeemer(node_config, announcement, reactor)
-        store = self._get_store(node_config)
         controller = SpendingController.for_store(
             tokens_to_passes=redeemer.tokens_to_passes,
-            store=store,
+            store=self._get_token_source(node_config, reactor),
        )
         return ZKAPAuthorizerStorageClient(
             get_configured_pass_value(node_config),
@@ -196,7 +308,7 @@ class ZKAPAuthorizer(object):
             from twisted.internet import reactor
         return resource_from_configuration(
             node_config,
-            store=self._get_store(node_config),
+            store=self._get_store(node_config, reactor),
             redeemer=self._get_redeemer(node_config, None, reactor),
             clock=reactor,
         )
@@ -258,7 +370,7 @@ def _create_maintenance_service(reactor, node_config, client_node):
     from twisted.plugins.zkapauthorizer import (
         storage_server,
     )
-    store = storage_server._get_store(node_config)
+    store = storage_server._get_store(node_config, reactor)
 
     # Create the operation which performs the lease maintenance job when
     # called.
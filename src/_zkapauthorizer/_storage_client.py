@@ -24,6 +24,9 @@ from __future__ import (
     absolute_import,
 )
 
+from sys import (
+    exc_info,
+)
 from functools import (
     partial,
     wraps,
@@ -55,6 +58,9 @@ from allmydata.interfaces import (
     IStorageServer,
 )
 
+from ._deferred import (
+    then,
+)
 from .eliot import (
     SIGNATURE_CHECK_FAILED,
     CALL_WITH_PASSES,
@@ -92,6 +98,7 @@ class IncorrectStorageServerReference(Exception):
         )
 
 
+@inline_callbacks
 def invalidate_rejected_passes(passes, more_passes_required):
     """
     Return a new ``IPassGroup`` with all rejected passes removed from it.
@@ -102,9 +109,11 @@ def invalidate_rejected_passes(passes, more_passes_required):
     :param MorePassesRequired more_passes_required: An exception possibly
         detailing the rejection of some passes from the group.
 
-    :return: ``None`` if no passes in the group were rejected and so there is
-        nothing to replace.  Otherwise, a new ``IPassGroup`` created from
-        ``passes`` but with rejected passes replaced with new ones.
+    :return: A ``Deferred`` that fires with ``None`` if no passes in the
+        group were rejected and so there is nothing to replace.  Otherwise, it
+        fires with a new ``IPassGroup`` created from ``passes`` but with
+        rejected passes replaced with new ones, once the rejected passes have
+        been marked invalid.
     """
     num_failed = len(more_passes_required.signature_check_failed)
     if num_failed == 0:
@@ -118,10 +127,10 @@ def invalidate_rejected_passes(passes, more_passes_required):
         #
         # We *could* just `raise` here and only be called from an `except`
         # suite... but let's not be so vulgar.
-        return None
+        returnValue(None)
     SIGNATURE_CHECK_FAILED.log(count=num_failed)
     rejected_passes, okay_passes = passes.split(more_passes_required.signature_check_failed)
-    rejected_passes.mark_invalid(u"signature check failed")
+    yield rejected_passes.mark_invalid(u"signature check failed")
 
     # It would be great to just expand okay_passes right here.  However, if
     # that fails (eg because we don't have enough tokens remaining) then the
@@ -129,7 +138,7 @@ def invalidate_rejected_passes(passes, more_passes_required):
     # it needs to reset. :/ So, instead, pass back the complete okay set.  The
     # caller can figure out by how much to expand it by considering its size
     # and the original number of passes it requested.
-    return okay_passes
+    returnValue(okay_passes)
 
 
 @inline_callbacks
@@ -148,8 +157,8 @@ def call_with_passes_with_manual_spend(method, num_passes, get_passes, on_succes
 
     :param int num_passes: The number of passes to pass to the call.
 
-    :param (int -> IPassGroup) get_passes: A function for getting
-        passes.
+    :param (int -> IPassGroup|Deferred[IPassGroup]) get_passes: A function
+        for getting passes.
 
     :param (object -> IPassGroup -> None) on_success: A function to call when
         ``method`` succeeds.  The first argument is the result of ``method``.
@@ -166,33 +175,39 @@ def call_with_passes_with_manual_spend(method, num_passes, get_passes, on_succes
         that trigger a retry).
     """
     with CALL_WITH_PASSES(count=num_passes):
-        pass_group = get_passes(num_passes)
+        pass_group = yield get_passes(num_passes)
         try:
             # Try and repeat as necessary.
             while True:
                 try:
                     result = yield method(pass_group)
                 except MorePassesRequired as e:
-                    okay_pass_group = invalidate_rejected_passes(
+                    # Waiting for the rejected passes to be marked invalid
+                    # may clobber the exception so hold on to it.
+                    info = exc_info()
+                    okay_pass_group = yield invalidate_rejected_passes(
                         pass_group,
                         e,
                     )
                     if okay_pass_group is None:
-                        raise
+                        raise info[0], info[1], info[2]
                     else:
                         # Update the local in case we end up going to the
                         # except suite below.
                         pass_group = okay_pass_group
                         # Add the necessary number of new passes.  This might
                         # fail if we don't have enough tokens.
-                        pass_group = pass_group.expand(num_passes - len(pass_group.passes))
+                        pass_group = yield pass_group.expand(num_passes - len(pass_group.passes))
                 else:
-                    on_success(result, pass_group)
+                    yield on_success(result, pass_group)
                     break
         except:
-            # Something went wrong that we can't address with a retry.
-            pass_group.reset()
-            raise
+            # Something went wrong that we can't address with a retry.  Hold
+            # on to the exception while the passes are reset since waiting
+            # for that may clobber it.
+            info = exc_info()
+            yield pass_group.reset()
+            raise info[0], info[1], info[2]
 
     # Give the operation's result to the caller.
     returnValue(result)
@@ -332,8 +347,10 @@ class ZKAPAuthorizerStorageClient(object):
             [allocated_size] * len(bucketwriters),
         )
         to_spend, to_reset = pass_group.split(range(actual_passes))
-        to_spend.mark_spent()
-        to_reset.reset()
+        return then(
+            to_spend.mark_spent(),
+            lambda ignored: to_reset.reset(),
+        )
 
     @with_rref
     def allocate_buckets(
@@ -0,0 +1,317 @@
+# Copyright 2020 PrivateStorage.io, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+This module implements a compact binary format for backups of unblinded
+tokens.
+
+A backup is a header followed by the raw bytes of each token, in the order
+the tokens will be used, optionally compressed with zlib.  The header is::
+
+    magic       8 bytes   b"ZKAPBKUP"
+    version     1 byte    1
+    flags       1 byte    1 if the tokens are compressed, otherwise 0
+    count       8 bytes   the number of tokens, big-endian
+    checksum   32 bytes   the SHA-256 of the uncompressed tokens
+    key count   2 bytes   the number of public keys which follow, big-endian
+
+Each public key is a two byte big-endian length followed by that many bytes
+of the UTF-8 encoded key.
+"""
+
+from __future__ import (
+    absolute_import,
+)
+
+from struct import (
+    Struct,
+)
+from hashlib import (
+    sha256,
+)
+from zlib import (
+    compressobj,
+    decompressobj,
+    error as ZlibError,
+)
+
+import attr
+
+MAGIC = b"ZKAPBKUP"
+VERSION = 1
+
+# The number of bytes in an unblinded token.
+TOKEN_SIZE = 96
+
+_COMPRESSED = 1
+
+_HEADER = Struct(">8sBBQ32sH")
+_KEY_LENGTH = Struct(">H")
+
+
+@attr.s(frozen=True)
+class BackupHeader(object):
+    """
+    The description of the tokens in a backup.
+
+    :ivar bool compressed: Whether the tokens are compressed.
+
+    :ivar int count: The number of tokens.
+
+    :ivar bytes checksum: The SHA-256 digest of the tokens.
+
+    :ivar list[unicode] public_keys: The public keys of the issuers which
+        signed the tokens.
+    """
+    compressed = attr.ib()
+    count = attr.ib()
+    checksum = attr.ib()
+    public_keys = attr.ib()
+
+    def to_bytes(self):
+        """
+        :return bytes: The encoded form of this header.
+        """
+        if self.compressed:
+            flags = _COMPRESSED
+        else:
+            flags = 0
+        encoded_keys = list(key.encode("utf-8") for key in self.public_keys)
+        return b"".join(
+            [_HEADER.pack(
+                MAGIC,
+                VERSION,
+                flags,
+                self.count,
+                self.checksum,
+                len(encoded_keys),
+            )] + list(
+                _KEY_LENGTH.pack(len(key)) + key
+                for key
+                in encoded_keys
+            )
+        )
+
+
+def write_backup(f, tokens, public_keys, compress=False):
+    """
+    Write a backup.
+
+    The count and checksum are not known until all of the tokens are written
+    so space is left for them and they are filled in afterwards.
+
+    :param file f: A seekable file to write the backup to.
+
+    :param tokens: An iterable of the raw bytes of the tokens to back up.
+
+    :param list[unicode] public_keys: The public keys to record.
+
+    :param bool compress: Whether to compress the tokens.  Tokens are
+        random so this saves very little space.
+
+    :return BackupHeader: The header of the backup written.
+    """
+    writer = BackupWriter(f, public_keys, compress)
+    writer.write(tokens)
+    return writer.finish()
+
+
+class BackupWriter(object):
+    """
+    Write a backup a few tokens at a time, for tokens which are not all
+    available at once.
+
+    Space for the header is written when the writer is created.  The count
+    and checksum are filled in by ``finish``.
+
+    :ivar file _f: The seekable file to write the backup to.
+    """
+    def __init__(self, f, public_keys, compress=False):
+        """
+        :param file f: A seekable file to write the backup to.
+
+        :param list[unicode] public_keys: The public keys to record.
+
+        :param bool compress: Whether to compress the tokens.
+        """
+        self._f = f
+        self._public_keys = public_keys
+        self._compress = compress
+        self._start = f.tell()
+        self._count = 0
+        self._checksum = sha256()
+        f.write(BackupHeader(compress, 0, b"\0" * 32, public_keys).to_bytes())
+        if compress:
+            self._compressor = compressobj()
+
+    def write(self, tokens):
+        """
+        Write some more tokens.
+
+        :param tokens: An iterable of the raw bytes of the tokens to back up.
+        """
+        for token in tokens:
+            if len(token) != TOKEN_SIZE:
+                raise ValueError(
+                    "Unblinded token has length {} instead of {}".format(
+                        len(token),
+                        TOKEN_SIZE,
+                    ),
+                )
+            self._checksum.update(token)
+            if self._compress:
+                self._f.write(self._compressor.compress(token))
+            else:
+                self._f.write(token)
+            self._count += 1
+
+    def finish(self):
+        """
+        Complete the backup by filling in its header.
+
+        :return BackupHeader: The header of the backup written.
+        """
+        if self._compress:
+            self._f.write(self._compressor.flush())
+
+        end = self._f.tell()
+        header = BackupHeader(
+            self._compress,
+            self._count,
+            self._checksum.digest(),
+            self._public_keys,
+        )
+        self._f.seek(self._start)
+        self._f.write(header.to_bytes())
+        self._f.seek(end)
+        return header
+
+
+def read_header(f):
+    """
+    Read the header of a backup.
+
+    :param file f: A file positioned at the beginning of a backup.
+
+    :raise ValueError: If the header is not a valid header for a backup of a
+        supported version.
+
+    :return BackupHeader: The header.  ``f`` is left positioned at the
+        beginning of the tokens.
+    """
+    fixed = f.read(_HEADER.size)
+    if len(fixed) != _HEADER.size:
+        raise ValueError("Backup is too short")
+    magic, version, flags, count, checksum, key_count = _HEADER.unpack(fixed)
+    if magic != MAGIC:
+        raise ValueError("Not an unblinded token backup")
+    if version != VERSION:
+        raise ValueError("Unsupported backup version {}".format(version))
+    public_keys = []
+    for n in range(key_count):
+        (length,) = _KEY_LENGTH.unpack(_read_exactly(f, _KEY_LENGTH.size))
+        public_keys.append(_read_exactly(f, length).decode("utf-8"))
+    return BackupHeader(
+        bool(flags & _COMPRESSED),
+        count,
+        checksum,
+        public_keys,
+    )
+
+
+def _read_exactly(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Backup is too short")
+    return data
+
+
+def iter_tokens(f, header, chunk_size=2 ** 16):
+    """
+    Read the tokens from a backup without checking them against the header.
+
+    :param file f: A file positioned at the beginning of the tokens, as left
+        by ``read_header``.
+
+    :param BackupHeader header: The header of the backup.
+
+    :raise ValueError: While iterating, if the tokens cannot be decompressed
+        or do not divide evenly into tokens.
+
+    :return: An iterator of the raw bytes of each token.
+    """
+    pending = b""
+    for data in _read_chunks(f, header.compressed, chunk_size):
+        pending += data
+        whole = len(pending) - len(pending) % TOKEN_SIZE
+        for offset in range(0, whole, TOKEN_SIZE):
+            yield pending[offset:offset + TOKEN_SIZE]
+        pending = pending[whole:]
+    if pending:
+        raise ValueError("Backup ends part way through a token")
+
+
+def _read_chunks(f, compressed, chunk_size):
+    """
+    Read the rest of a file, decompressing it if necessary.
+
+    :return: An iterator of bytes.
+    """
+    if compressed:
+        decompressor = decompressobj()
+    while True:
+        data = f.read(chunk_size)
+        if compressed:
+            try:
+                if data:
+                    yield decompressor.decompress(data)
+                else:
+                    yield decompressor.flush()
+            except ZlibError as e:
+                raise ValueError("Backup cannot be decompressed: {}".format(e))
+        else:
+            yield data
+        if not data:
+            break
+    if compressed and decompressor.unused_data:
+        raise ValueError("Backup has extra data after the tokens")
+
+
+def verify_backup(f):
+    """
+    Check that the tokens in a backup match the count and checksum in its
+    header.
+
+    :param file f: A file positioned at the beginning of a backup.
+
+    :raise ValueError: If the backup is not valid.
+
+    :return BackupHeader: The header of the backup.
+    """
+    header = read_header(f)
+    count = 0
+    checksum = sha256()
+    for token in iter_tokens(f, header):
+        checksum.update(token)
+        count += 1
+    if count != header.count:
+        raise ValueError(
+            "Backup has {} tokens but its header says {}".format(
+                count,
+                header.count,
+            ),
+        )
+    if checksum.digest() != header.checksum:
+        raise ValueError("Backup checksum does not match")
+    return header
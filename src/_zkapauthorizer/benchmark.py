@@ -0,0 +1,177 @@
+# Copyright 2020 PrivateStorage.io, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measure how quickly the voucher database can record spending under each of
+several ``StorageProfile`` settings and how quickly tokens can be
+constructed with and without validation.
+
+Run it against a directory on the same filesystem as the node's database::
+
+    python -m _zkapauthorizer.benchmark /path/to/node/private
+
+The result depends heavily on the storage device so it is only meaningful
+when run on the machine where the node runs.
+"""
+
+from __future__ import (
+    print_function,
+)
+
+from sys import (
+    argv,
+)
+from os import (
+    urandom,
+)
+from time import (
+    time,
+)
+from datetime import (
+    datetime,
+)
+from base64 import (
+    b64encode,
+)
+from argparse import (
+    ArgumentParser,
+)
+
+from twisted.python.filepath import (
+    FilePath,
+)
+
+from .model import (
+    StorageProfile,
+    UnblindedToken,
+    VoucherStore,
+    open_and_initialize,
+)
+
+# The profiles to compare, with a description of each.
+PROFILES = [
+    (u"wal, synchronous=full (default)", StorageProfile()),
+    (u"wal, synchronous=normal", StorageProfile(synchronous=u"normal")),
+    (
+        u"wal, synchronous=normal, 64 MiB mmap",
+        StorageProfile(synchronous=u"normal", mmap_size=2 ** 26),
+    ),
+    (u"rollback journal, synchronous=full", StorageProfile(journal_mode=u"delete")),
+]
+
+
+def spend_rate(path, profile, spends, clock=time):
+    """
+    Measure the rate at which tokens can be spent from a store using a
+    certain profile.  Each spend is one transaction to reserve a token and
+    another to discard it, as ``SpendingController`` does.
+
+    :param FilePath path: The location at which to create a new database for
+        the measurement.  Anything already there is removed.
+
+    :param StorageProfile profile: The profile to measure.
+
+    :param int spends: The number of tokens to spend.
+
+    :param clock: A no-argument callable returning the current time in
+        seconds.
+
+    :return float: The number of spends per second.
+    """
+    for p in path.parent().globChildren(path.basename() + b"*"):
+        p.remove()
+
+    store = VoucherStore(
+        pass_value=2 ** 15,
+        database_path=path,
+        now=datetime.utcnow,
+        connection=open_and_initialize(path, profile=profile),
+    )
+    try:
+        store.insert_unblinded_tokens(list(
+            b64encode(urandom(96)).decode("ascii")
+            for n
+            in range(spends)
+        ))
+        start = clock()
+        for n in range(spends):
+            store.discard_unblinded_tokens(store.get_unblinded_tokens(1))
+        elapsed = clock() - start
+    finally:
+        store._connection.close()
+    return spends / max(elapsed, 1e-9)
+
+
+def construction_rate(count, trusted, clock=time):
+    """
+    Measure the rate at which ``UnblindedToken`` instances can be created.
+
+    :param int count: The number of instances to create.
+
+    :param bool trusted: If ``True``, create them with
+        ``UnblindedToken.trusted`` which skips validation.  Otherwise, create
+        them with the validating initializer.
+
+    :param clock: A no-argument callable returning the current time in
+        seconds.
+
+    :return float: The number of instances created per second.
+    """
+    values = list(
+        b64encode(urandom(96)).decode("ascii")
+        for n
+        in range(count)
+    )
+    construct = UnblindedToken.trusted if trusted else UnblindedToken
+    start = clock()
+    for value in values:
+        construct(value)
+    elapsed = clock() - start
+    return count / max(elapsed, 1e-9)
+
+
+def main(args):
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "directory",
+        help="A directory in which to create temporary benchmark databases.",
+    )
+    parser.add_argument(
+        "--spends",
+        type=int,
+        default=1000,
+        help="The number of spends to perform with each profile.",
+    )
+    parser.add_argument(
+        "--constructions",
+        type=int,
+        default=100000,
+        help="The number of tokens to construct with and without validation.",
+    )
+    options = parser.parse_args(args)
+    path = FilePath(options.directory).child(b"benchmark.sqlite3")
+    try:
+        for (description, profile) in PROFILES:
+            rate = spend_rate(path, profile, options.spends)
+            print(u"{:>10.1f} spends/second  {}".format(rate, description))
+        for (description, trusted) in [(u"validated", False), (u"trusted", True)]:
+            rate = construction_rate(options.constructions, trusted)
+            print(u"{:>10.1f} tokens/second  {}".format(rate, description))
+    finally:
+        for p in path.parent().globChildren(path.basename() + b"*"):
+            p.remove()
+
+
+if __name__ == "__main__":
+    main(argv[1:])
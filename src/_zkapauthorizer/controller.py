@@ -66,6 +66,7 @@ from twisted.internet.defer import (
     Deferred,
     succeed,
     fail,
+    maybeDeferred,
     inlineCallbacks,
     returnValue,
 )
@@ -90,6 +91,9 @@ from ._base64 import (
 from ._stack import (
     less_limited_stack,
 )
+from ._deferred import (
+    then,
+)
 
 from .model import (
     RandomToken,
@@ -508,7 +512,7 @@ class RistrettoRedeemer(object):
 
     def random_tokens_for_voucher(self, voucher, counter, count):
         return list(
-            RandomToken(
+            RandomToken.trusted(
                 challenge_bypass_ristretto.RandomToken.create().encode_base64().decode("ascii"),
             )
             for n
@@ -587,7 +591,7 @@ class RistrettoRedeemer(object):
             )
         self._log.info("Validated proof")
         unblinded_tokens = list(
-            UnblindedToken(token.encode_base64().decode("ascii"))
+            UnblindedToken.trusted(token.encode_base64().decode("ascii"))
             for token
             in clients_unblinded_tokens
         )
@@ -621,7 +625,7 @@ class RistrettoRedeemer(object):
             in unblinded_tokens
         )
         passes = list(
-            Pass(
+            Pass.trusted(
                 preimage.encode_base64().decode("ascii"),
                 signature.encode_base64().decode("ascii"),
             )
@@ -729,6 +733,7 @@ class PaymentController(object):
     _error = attr.ib(default=attr.Factory(dict))
     _unpaid = attr.ib(default=attr.Factory(dict))
     _active = attr.ib(default=attr.Factory(dict))
+    _retrying = attr.ib(default=attr.Factory(set))
 
     def __attrs_post_init__(self):
         """
@@ -739,7 +744,8 @@ class PaymentController(object):
         if self._clock is None:
             self._clock = namedAny("twisted.internet.reactor")
 
-        self._check_pending_vouchers()
+        checking = maybeDeferred(self._check_pending_vouchers)
+        checking.addErrback(self._check_pending_vouchers_failed)
         # Also start a time-based polling loop to retry redemption of vouchers
         # in retryable error states.
         self._schedule_retries()
@@ -759,17 +765,40 @@ class PaymentController(object):
 
     def _retry_redemption(self):
         for voucher in self._error.keys() + self._unpaid.keys():
-            if voucher in self._active:
+            if voucher in self._active or voucher in self._retrying:
                 continue
-            if self.get_voucher(voucher).state.should_start_redemption():
-                self.redeem(voucher)
+            # Looking up the voucher may not complete immediately.  Make sure
+            # the next iteration doesn't start a second retry meanwhile.
+            self._retrying.add(voucher)
+            d = maybeDeferred(
+                then,
+                self.get_voucher(voucher),
+                self._retry_if_needed,
+            )
+            d.addBoth(self._retried, voucher)
+
+    def _retry_if_needed(self, voucher):
+        if voucher.state.should_start_redemption():
+            return self.redeem(voucher.number)
+
+    def _retried(self, result, voucher):
+        self._retrying.discard(voucher)
+        return result
 
     def _check_pending_vouchers(self):
         """
         Find vouchers in the voucher store that need to be redeemed and try to
         redeem them.
         """
-        vouchers = self.store.list()
+        return then(self.store.list_pending(), self._redeem_pending_vouchers)
+
+    def _check_pending_vouchers_failed(self, reason):
+        self._log.failure(
+            "Controller could not check for vouchers that need redemption.",
+            reason,
+        )
+
+    def _redeem_pending_vouchers(self, vouchers):
         for voucher in vouchers:
             if voucher.state.should_start_redemption():
                 self._log.info(
@@ -825,7 +854,7 @@ class PaymentController(object):
         """
         # Try to get an existing voucher object for the given number.
         try:
-            voucher_obj = self.store.get(voucher)
+            voucher_obj = yield self.store.get(voucher)
         except KeyError:
             # This is our first time dealing with this number.
             counter_start = 0
@@ -861,7 +890,7 @@ class PaymentController(object):
             # number of passes that can be constructed is still only the size of
             # the set of random tokens.
             token_count = token_count_for_group(self.num_redemption_groups, num_tokens, counter)
-            tokens = self._get_random_tokens_for_voucher(
+            tokens = yield self._get_random_tokens_for_voucher(
                 voucher,
                 counter,
                 num_tokens=token_count,
@@ -869,7 +898,7 @@ class PaymentController(object):
             )
 
             # Reload state before each iteration.  We expect it to change each time.
-            voucher_obj = self.store.get(voucher)
+            voucher_obj = yield self.store.get(voucher)
 
             succeeded = yield self._perform_redeem(voucher_obj, counter, tokens)
             if not succeeded:
@@ -927,21 +956,45 @@ class PaymentController(object):
             "Inserting redeemed unblinded tokens for a voucher ({voucher}).",
             voucher=voucher,
         )
-        self.store.insert_unblinded_tokens_for_voucher(
-            voucher,
-            result.public_key,
-            result.unblinded_tokens,
-            completed=(counter + 1 == self.num_redemption_groups),
+        completed = (counter + 1 == self.num_redemption_groups)
+        return then(
+            self.store.insert_unblinded_tokens_for_voucher(
+                voucher,
+                result.public_key,
+                result.unblinded_tokens,
+                completed=completed,
+            ),
+            self._inserted_unblinded_tokens,
+            completed,
         )
+
+    def _inserted_unblinded_tokens(self, ignored, completed):
+        if completed:
+            # Redemption of this voucher discarded all of its random tokens.
+            # Give the space they used back.  The tokens are already stored
+            # so failing to do so does not change the outcome of redemption.
+            d = maybeDeferred(self.store.vacuum)
+            d.addErrback(self._vacuum_failed)
+            d.addCallback(lambda ignored: True)
+            return d
         return True
 
+    def _vacuum_failed(self, reason):
+        self._log.failure(
+            "Controller could not vacuum the database after redemption.",
+            reason,
+        )
+
     def _redeem_failure(self, voucher, reason):
         if reason.check(AlreadySpent):
             self._log.error(
                 "Voucher {voucher} reported as already spent during redemption.",
                 voucher=voucher,
             )
-            self.store.mark_voucher_double_spent(voucher)
+            return then(
+                self.store.mark_voucher_double_spent(voucher),
+                lambda ignored: False,
+            )
         elif reason.check(Unpaid):
             self._log.error(
                 "Voucher {voucher} reported as not paid for during redemption.",
@@ -969,10 +1022,24 @@ class PaymentController(object):
         return False
 
     def get_voucher(self, number):
-        return self.incorporate_transient_state(
+        return then(
             self.store.get(number),
+            self.incorporate_transient_state,
         )
 
+    def transient_state_tag(self):
+        """
+        Get a value which changes whenever the transient state of any voucher
+        known to this controller changes.
+
+        :return unicode: The value.
+        """
+        return sha256(repr((
+            sorted(self._active.items()),
+            sorted(self._unpaid.items()),
+            sorted(self._error.items()),
+        ))).hexdigest().decode("ascii")
+
     def incorporate_transient_state(self, voucher):
         """
         Create a new ``Voucher`` which represents the given voucher but which also
@@ -68,6 +68,18 @@ RESET_PASSES = MessageType(
     u"Some passes involved in a failed spending attempt have not definitely been spent and are being returned for future use.",
 )
 
+OPERATION_COUNT = Field(
+    u"operations",
+    int,
+    u"A number of separately requested operations.",
+)
+
+COMMITTED_PASS_STATES = MessageType(
+    u"zkapauthorizer:committed-pass-states",
+    [OPERATION_COUNT, PASS_COUNT],
+    u"Changes to the states of some passes requested by several operations have been recorded together.",
+)
+
 SIGNATURE_CHECK_FAILED = MessageType(
     u"zkapauthorizer:storage-client:signature-check-failed",
     [PASS_COUNT],
@@ -110,3 +122,40 @@ MUTABLE_PASSES_REQUIRED = MessageType(
     [CURRENT_SIZES, TW_VECTORS_SUMMARY, NEW_SIZES, NEW_PASSES],
     u"Some number of passes has been computed as the cost of updating a mutable.",
 )
+
+SCHEMA_VERSION = Field(
+    u"version",
+    int,
+    u"A version of the database schema.",
+)
+
+SCHEMA_UPGRADED = MessageType(
+    u"zkapauthorizer:schema:upgraded",
+    [SCHEMA_VERSION],
+    u"The database schema has been upgraded to a new version.",
+)
+
+ROW_COUNT = Field(
+    u"rows",
+    int,
+    u"A number of rows which have been processed.",
+)
+
+TOTAL_ROW_COUNT = Field(
+    u"total",
+    int,
+    u"An estimate of the number of rows to be processed altogether.",
+)
+
+SCHEMA_UPGRADE_PROGRESS = MessageType(
+    u"zkapauthorizer:schema:upgrade-progress",
+    [ROW_COUNT, TOTAL_ROW_COUNT],
+    u"Some of the rows of a table have been converted by a schema upgrade.",
+)
+
+FULL_VACUUM = ActionType(
+    u"zkapauthorizer:model:full-vacuum",
+    [],
+    [],
+    u"The whole database is being rewritten, once, so that space can be released incrementally from then on.",
+)
@@ -17,6 +17,9 @@ This module implements a service which periodically spends ZKAPs to
 refresh leases on all shares reachable from a root.
 """
 
+from sys import (
+    exc_info,
+)
 from functools import (
     partial,
 )
@@ -152,7 +155,8 @@ def renew_leases(
         to allow on a lease without renewing it.
 
     :param get_activity_observer: A no-argument callable which returns an
-        ``ILeaseMaintenanceObserver``.
+        ``ILeaseMaintenanceObserver`` (or a ``Deferred`` which fires with
+        one).
 
     :param now: A no-argument function returning the current time, as a
         datetime instance, for comparison against lease expiration time.
@@ -160,7 +164,7 @@ def renew_leases(
     :return Deferred: A Deferred which fires when all visitable nodes have
         been checked and any leases renewed which required it.
     """
-    activity = get_activity_observer()
+    activity = yield get_activity_observer()
 
     storage_indexes = yield iter_storage_indexes(visit_assets)
 
@@ -171,18 +175,33 @@ def renew_leases(
         in storage_broker.get_connected_servers()
     )
 
-    for server in servers:
-        # Consider parallelizing this.
-        yield renew_leases_on_server(
-            min_lease_remaining,
-            renewal_secret,
-            storage_indexes,
-            server,
-            activity,
-            now(),
+    try:
+        for server in servers:
+            # Consider parallelizing this.
+            yield renew_leases_on_server(
+                min_lease_remaining,
+                renewal_secret,
+                storage_indexes,
+                server,
+                activity,
+                now(),
+            )
+    except GeneratorExit:
+        raise
+    except:
+        # Record what was observed before the failure.  The run is not
+        # finished.  If recording fails too then log that and keep the
+        # original failure, which is the more interesting one.
+        info = exc_info()
+        flushing = maybeDeferred(activity.flush)
+        flushing.addErrback(
+            err,
+            "Recording lease maintenance activity after a failure",
         )
+        yield flushing
+        raise info[0], info[1], info[2]
 
-    activity.finish()
+    yield activity.finish()
 
 
 @inlineCallbacks
@@ -224,14 +243,17 @@ def renew_leases_on_server(
             # The server has no shares for this storage index.
             continue
 
-        # Keep track of what's been seen.
-        activity.observe([stat.size for stat in stat_dict.values()])
+        sizes = [stat.size for stat in stat_dict.values()]
 
         # All shares have the same lease information.
         stat = stat_dict.popitem()[1]
-        if needs_lease_renew(min_lease_remaining, stat, now):
+        renewed = needs_lease_renew(min_lease_remaining, stat, now)
+        if renewed:
             yield renew_lease(renewal_secret, storage_index, server)
 
+        # Keep track of what's been seen.
+        yield activity.observe(sizes, renewed)
+
 
 def renew_lease(renewal_secret, storage_index, server):
     """
@@ -477,7 +499,10 @@ class NoopMaintenanceObserver(object):
     """
     A lease maintenance observer that does nothing.
     """
-    def observe(self, sizes):
+    def observe(self, sizes, renewed=False):
+        pass
+
+    def flush(self):
         pass
 
     def finish(self):
@@ -491,10 +516,17 @@ class MemoryMaintenanceObserver(object):
     A lease maintenance observer that records observations in memory.
     """
     observed = attr.ib(default=attr.Factory(list))
+    renewed = attr.ib(default=0)
+    flushed = attr.ib(default=False)
     finished = attr.ib(default=False)
 
-    def observe(self, sizes):
+    def observe(self, sizes, renewed=False):
         self.observed.append(sizes)
+        if renewed:
+            self.renewed += 1
+
+    def flush(self):
+        self.flushed = True
 
     def finish(self):
         self.finished = True
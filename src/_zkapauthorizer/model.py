@@ -17,8 +17,22 @@ This module implements models (in the MVC sense) for the client side of
 the storage plugin.
 """
 
+from os import (
+    getpid,
+    kill,
+)
+from errno import (
+    ESRCH,
+)
+from socket import (
+    gethostname,
+)
 from functools import (
     wraps,
+    partial,
+)
+from itertools import (
+    islice,
 )
 from json import (
     loads,
@@ -26,6 +40,10 @@ from json import (
 )
 from datetime import (
     datetime,
+    timedelta,
+)
+from uuid import (
+    uuid4,
 )
 from zope.interface import (
     Interface,
@@ -34,6 +52,7 @@ from zope.interface import (
 
 from sqlite3 import (
     OperationalError,
+    Binary,
     connect as _connect,
 )
 
@@ -48,11 +67,29 @@ from twisted.logger import (
 from twisted.python.filepath import (
     FilePath,
 )
+from twisted.python.runtime import (
+    platform,
+)
+from twisted.python.threadpool import (
+    ThreadPool,
+)
+from twisted.internet.threads import (
+    deferToThreadPool,
+)
+from twisted.internet.defer import (
+    succeed,
+)
 
 from ._base64 import (
     urlsafe_b64decode,
+    b64_to_blob,
+    blob_to_b64,
 )
 
+from ._epoch import (
+    datetime_to_epoch,
+    epoch_to_datetime,
+)
 from .validators import (
     is_base64_encoded,
     has_length,
@@ -62,13 +99,24 @@ from .validators import (
 from .storage_common import (
     pass_value_attribute,
     get_configured_pass_value,
+    get_configured_lease_maintenance_retention,
     required_passes,
 )
 
+from .backup import (
+    write_backup,
+    read_header,
+    iter_tokens,
+    verify_backup,
+)
+from .snapshot import (
+    snapshot as _snapshot,
+)
 from .schema import (
-    get_schema_version,
-    get_schema_upgrades,
-    run_schema_upgrades,
+    initialize_schema,
+)
+from .eliot import (
+    FULL_VACUUM,
 )
 
 
@@ -89,16 +137,34 @@ class ILeaseMaintenanceObserver(Interface):
     An object which is interested in receiving events related to the progress
     of lease maintenance activity.
     """
-    def observe(sizes):
+    def observe(sizes, renewed=False):
         """
         Observe some shares encountered during lease maintenance.
 
         :param list[int] sizes: The sizes of the shares encountered.
+
+        :param bool renewed: Whether the leases on the shares were renewed.
+
+        :return: ``None`` or a ``Deferred`` which fires when the observation
+            has been recorded.  An observation may be held in memory for a
+            while before it is recorded.
+        """
+
+    def flush():
+        """
+        Record any observations which are being held in memory.  This is
+        useful when a run of lease maintenance stops without completing.
+
+        :return: ``None`` or a ``Deferred`` which fires when the observations
+            have been recorded.
         """
 
     def finish():
         """
         Observe that a run of lease maintenance has completed.
+
+        :return: ``None`` or a ``Deferred`` which fires when the completion
+            has been recorded.
         """
 
 
@@ -119,7 +185,125 @@ class NotEnoughTokens(Exception):
 
 CONFIG_DB_NAME = u"privatestorageio-zkapauthz-v1.sqlite3"
 
-def open_and_initialize(path, connect=None):
+# The name of the copy of the database written by ``VoucherStore.snapshot``
+# on behalf of the web API.
+SNAPSHOT_DB_NAME = u"privatestorageio-zkapauthz-v1-snapshot.sqlite3"
+
+# The name of each additional database holding tokens for spending when
+# ``token-shards`` is configured.  The shard number is substituted.
+SHARD_DB_NAME = u"privatestorageio-zkapauthz-v1-shard-{}.sqlite3"
+
+# The values which ``VoucherStore.list_page`` accepts for selecting and
+# ordering vouchers.
+_VOUCHER_STATES = {None, u"pending", u"redeemed", u"double-spend"}
+_VOUCHER_ORDERS = {u"created", u"finished"}
+
+# The columns of [vouchers] which ``Voucher.from_row`` expects, in order.
+_VOUCHER_COLUMNS = u"[number], [created], [expected-tokens], [state], [finished], [token-count], [public-key], [counter]"
+
+# The value of the auto_vacuum pragma for the INCREMENTAL mode.
+_AUTO_VACUUM_INCREMENTAL = 2
+
+# The SQLite3 journal modes a ``StorageProfile`` may select.  ``memory`` and
+# ``off`` are left out because they risk corrupting the database if the
+# process crashes.
+_JOURNAL_MODES = {u"wal", u"delete", u"truncate", u"persist"}
+
+# The SQLite3 synchronous levels a ``StorageProfile`` may select.
+_SYNCHRONOUS_LEVELS = {u"off", u"normal", u"full", u"extra"}
+
+
+@attr.s(frozen=True)
+class StorageProfile(object):
+    """
+    A ``StorageProfile`` describes how the voucher database trades durability
+    and memory use against the cost of each transaction.
+
+    The defaults make every committed transaction durable, even against power
+    loss.  Spending relies on this: if the record that a token was spent is
+    lost the token may be offered to a server again and be rejected.
+
+    :ivar unicode journal_mode: The SQLite3 journal mode.  In ``wal`` mode a
+        commit needs one sync instead of several and readers do not block
+        the writer.  It does not work for databases on network filesystems.
+
+    :ivar unicode synchronous: The SQLite3 ``synchronous`` level.  ``full``
+        syncs on every commit.  ``normal`` in ``wal`` mode survives the
+        process crashing but may lose the most recent transactions if the
+        operating system crashes or power is lost.  ``off`` may corrupt the
+        database in that case.
+
+    :ivar int mmap_size: The number of bytes of the database file to access
+        through a memory map instead of reads.  ``0`` disables memory
+        mapping.
+
+    :ivar int cache_size: The size of the SQLite3 page cache.  A positive
+        value is a number of pages.  A negative value is a number of KiB.
+    """
+    journal_mode = attr.ib(
+        default=u"wal",
+        validator=attr.validators.in_(_JOURNAL_MODES),
+    )
+    synchronous = attr.ib(
+        default=u"full",
+        validator=attr.validators.in_(_SYNCHRONOUS_LEVELS),
+    )
+    mmap_size = attr.ib(
+        default=0,
+        validator=attr.validators.instance_of((int, long)),
+    )
+    cache_size = attr.ib(
+        default=-2000,
+        validator=attr.validators.instance_of((int, long)),
+    )
+
+    @classmethod
+    def from_node_config(cls, node_config):
+        """
+        Read a ``StorageProfile`` from the ZKAPAuthorizer plugin client section
+        of a node's configuration.  Options which are not configured take
+        their default values.
+
+        :param allmydata.node._Config node_config: The configuration to read.
+
+        :raise ValueError: If a configured value is not allowed.
+        """
+        section_name = u"storageclient.plugins.privatestorageio-zkapauthz-v1"
+        default = cls()
+        def get(option, default):
+            return node_config.get_config(
+                section=section_name,
+                option=option,
+                default=default,
+            )
+        return cls(
+            journal_mode=get(
+                u"database-journal-mode",
+                default.journal_mode,
+            ).lower(),
+            synchronous=get(
+                u"database-synchronous",
+                default.synchronous,
+            ).lower(),
+            mmap_size=int(get(u"database-mmap-size", default.mmap_size)),
+            cache_size=int(get(u"database-cache-size", default.cache_size)),
+        )
+
+    def apply(self, conn):
+        """
+        Configure a database connection according to this profile.
+
+        :param conn: The SQLite3 connection to configure.
+        """
+        # PRAGMA does not accept parameters.  The values are interpolated but
+        # the validators have already limited them to safe values.
+        conn.execute("PRAGMA journal_mode = {}".format(self.journal_mode))
+        conn.execute("PRAGMA synchronous = {}".format(self.synchronous))
+        conn.execute("PRAGMA mmap_size = {:d}".format(self.mmap_size))
+        conn.execute("PRAGMA cache_size = {:d}".format(self.cache_size))
+
+
+def open_and_initialize(path, connect=None, profile=None):
     """
     Open a SQLite3 database for use as a voucher store.
 
@@ -128,10 +312,15 @@ def open_and_initialize(path, connect=None):
 
     :param FilePath path: The location of the SQLite3 database file.
 
+    :param StorageProfile profile: The durability and performance settings to
+        use for the connection.  If ``None``, the default profile is used.
+
     :return: A SQLite3 connection object for the database at the given path.
     """
     if connect is None:
         connect = _connect
+    if profile is None:
+        profile = StorageProfile()
     try:
         path.parent().makedirs(ignoreExistingDirectory=True)
     except OSError as e:
@@ -146,51 +335,49 @@ def open_and_initialize(path, connect=None):
     except OperationalError as e:
         raise StoreOpenError(e)
 
-    # Enforcement of foreign key constraints is off by default.  It must be
-    # enabled on a per-connection basis.  This is a helpful feature to ensure
-    # consistency so we want it enforced and we use it in our schema.
-    conn.execute("PRAGMA foreign_keys = ON")
+    # Let space freed by deleting rows be returned to the filesystem a little
+    # at a time (see ``VoucherStore.vacuum``).  This only takes effect
+    # immediately for a database with no tables yet.  An older database is
+    # switched over by ``VoucherStore.enable_incremental_vacuum`` rather than
+    # here so that opening it stays quick.
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+    profile.apply(conn)
 
     with conn:
         cursor = conn.cursor()
-        actual_version = get_schema_version(cursor)
-        schema_upgrades = list(get_schema_upgrades(actual_version))
-        run_schema_upgrades(schema_upgrades, cursor)
+        initialize_schema(cursor)
+        # A process which exits while spending leaves its tokens in use or
+        # reserved.  A restart should not have to wait for them to expire.
+        _free_abandoned_unblinded_tokens(cursor)
+
+    # Enforcement of foreign key constraints is off by default.  It must be
+    # enabled on a per-connection basis.  This is a helpful feature to ensure
+    # consistency so we want it enforced and we use it in our schema.  It is
+    # only enabled once the schema is up to date because some upgrades
+    # replace tables which others refer to.
+    conn.execute("PRAGMA foreign_keys = ON")
 
     # Create some tables that only exist (along with their contents) for
     # this connection.  These are outside of the schema because they are not
     # persistent.  We can change them any time we like without worrying about
     # upgrade logic because we re-create them on every connection.
-    conn.execute(
-        """
-        -- Track tokens in use by the process holding this connection.
-        CREATE TEMPORARY TABLE [in-use] (
-            [unblinded-token] text, -- The base64 encoded unblinded token.
-
-            PRIMARY KEY([unblinded-token])
-            -- A foreign key on unblinded-token to [unblinded-tokens]([token])
-            -- would be alright - however SQLite3 foreign key constraints
-            -- can't cross databases (and temporary tables are considered to
-            -- be in a different database than normal tables).
-        )
-        """,
-    )
     conn.execute(
         """
         -- Track tokens that we want to remove from the database.  Mainly just
         -- works around the awkward DB-API interface for dealing with deleting
         -- many rows.
         CREATE TEMPORARY TABLE [to-discard] (
-            [unblinded-token] text
+            [unblinded-token] blob
         )
         """,
     )
     conn.execute(
         """
-        -- Track tokens that we want to remove from the [in-use] set.  Similar
-        -- to [to-discard].
+        -- Track tokens that we want to return to the free state.  Similar to
+        -- [to-discard].
         CREATE TEMPORARY TABLE [to-reset] (
-            [unblinded-token] text
+            [unblinded-token] blob
         )
         """,
     )
@@ -224,6 +411,86 @@ def memory_connect(path, *a, **kw):
 # this an the representation loses precision as a floating point.
 _SQLITE3_INTEGER_MAX = 2 ** 63 - 1
 
+# The length of time for which tokens from ``VoucherStore.get_unblinded_tokens``
+# stay in use if they are not spent, invalidated, or reset.  This is far
+# longer than any one spending attempt should take.
+_DEFAULT_RESERVATION_LEASE = timedelta(minutes=30)
+
+# The length of time for which records of finished lease maintenance runs are
+# kept by default.
+_DEFAULT_LEASE_MAINTENANCE_RETENTION = timedelta(days=730)
+
+# The number of the most recent changes to the unblinded tokens for which
+# removals are remembered by default.  A backup brought up to date within
+# this many changes can still be updated incrementally.
+_DEFAULT_TOKEN_CHANGES_RETENTION = 2 ** 16
+
+
+def _hostname():
+    """
+    :return unicode: The name of this host.
+    """
+    return gethostname().decode("utf-8", "replace")
+
+
+def _new_owner():
+    """
+    :return unicode: A new identifier for the holder of in-use tokens, unique
+        across processes.  It names the host and process it was made in so
+        that tokens left in use by a process which has exited can be found.
+    """
+    return u"{}/{}/{}".format(_hostname(), getpid(), uuid4())
+
+
+def _owner_running(owner):
+    """
+    :param unicode owner: An identifier made by ``_new_owner``.
+
+    :return bool: ``False`` if ``owner`` was made by a process on this host
+        which has exited.  ``True`` if the process may still be running.
+    """
+    try:
+        host, pid, _ = owner.split(u"/")
+        pid = int(pid)
+    except ValueError:
+        return True
+    if host != _hostname() or platform.isWindows():
+        # There is no telling for another host.  On Windows ``kill`` would
+        # end the process rather than check for it.
+        return True
+    try:
+        kill(pid, 0)
+    except OSError as e:
+        return e.errno != ESRCH
+    return True
+
+
+def _free_abandoned_unblinded_tokens(cursor):
+    """
+    Free the in-use and reserved tokens held by processes on this host which
+    have exited, without waiting for their reservations to expire.
+    """
+    cursor.execute(
+        """
+        SELECT DISTINCT [owner] FROM [unblinded-tokens]
+        WHERE [state] IN ("in-use", "reserved")
+        """,
+    )
+    abandoned = list(
+        (owner,)
+        for (owner,)
+        in cursor.fetchall()
+        if owner is not None and not _owner_running(owner)
+    )
+    cursor.executemany(
+        """
+        UPDATE [unblinded-tokens]
+        SET [state] = "free", [owner] = NULL, [expires] = NULL
+        WHERE [state] IN ("in-use", "reserved") AND [owner] = ?
+        """,
+        abandoned,
+    )
+
 
 @attr.s(frozen=True)
 class VoucherStore(object):
@@ -234,7 +501,30 @@ class VoucherStore(object):
         the node that owns the persisted vouchers.
 
     :ivar now: A no-argument callable that returns the time of the call as a
-        ``datetime`` instance.
+        ``datetime`` instance with no timezone giving the time in UTC (for
+        example, ``datetime.utcnow``).  Times are stored as microseconds
+        since the epoch so a local time would be stored as the wrong
+        instant.
+
+    :ivar unicode owner: An identifier for this store which is recorded
+        against the tokens it puts in use.  Each store sharing a database
+        with others, in this process or another, must have a different one.
+
+    :ivar timedelta reservation_lease: The length of time for which tokens
+        this store puts in use are kept from other stores.  After this the
+        tokens may be given out again.  They are given out again sooner if
+        the process which put them in use exits and the database is opened
+        again.
+
+    :ivar timedelta|None lease_maintenance_retention: The length of time for
+        which records of lease maintenance runs are kept.  Older records are
+        deleted when a new run starts.  ``None`` keeps them forever.
+
+    :ivar int|None token_changes_retention: The number of the most recent
+        changes to the unblinded tokens for which removals are remembered.
+        Older removals are forgotten by ``vacuum`` as if by
+        ``prune_token_changes``.  ``None`` keeps them until they are pruned
+        explicitly.
     """
     _log = Logger()
 
@@ -245,8 +535,25 @@ class VoucherStore(object):
 
     _connection = attr.ib()
 
+    owner = attr.ib(
+        default=attr.Factory(_new_owner),
+        validator=attr.validators.instance_of(unicode),
+    )
+    reservation_lease = attr.ib(
+        default=_DEFAULT_RESERVATION_LEASE,
+        validator=attr.validators.instance_of(timedelta),
+    )
+    lease_maintenance_retention = attr.ib(
+        default=_DEFAULT_LEASE_MAINTENANCE_RETENTION,
+        validator=attr.validators.optional(attr.validators.instance_of(timedelta)),
+    )
+    token_changes_retention = attr.ib(
+        default=_DEFAULT_TOKEN_CHANGES_RETENTION,
+        validator=attr.validators.optional(attr.validators.instance_of(int)),
+    )
+
     @classmethod
-    def from_node_config(cls, node_config, now, connect=None):
+    def from_node_config(cls, node_config, now, connect=None, name=CONFIG_DB_NAME):
         """
         Create or open the ``VoucherStore`` for a given node.
 
@@ -258,17 +565,25 @@ class VoucherStore(object):
 
         :param connect: An alternate database connection function.  This is
             primarily for the purposes of the test suite.
+
+        :param unicode name: The name of the database file in the node's
+            private directory.  This is only given to open one of the node's
+            token shards (see ``SHARD_DB_NAME``).
         """
-        db_path = FilePath(node_config.get_private_path(CONFIG_DB_NAME))
+        db_path = FilePath(node_config.get_private_path(name))
         conn = open_and_initialize(
             db_path,
             connect=connect,
+            profile=StorageProfile.from_node_config(node_config),
         )
         return cls(
             get_configured_pass_value(node_config),
             db_path,
             now,
             conn,
+            lease_maintenance_retention=get_configured_lease_maintenance_retention(
+                node_config,
+            ),
         )
 
     @with_cursor
@@ -280,13 +595,10 @@ class VoucherStore(object):
         """
         cursor.execute(
             """
-            SELECT
-                [number], [created], [expected-tokens], [state], [finished], [token-count], [public-key], [counter]
-            FROM
-                [vouchers]
-            WHERE
-                [number] = ?
-            """,
+            SELECT {}
+            FROM [vouchers]
+            WHERE [number] = ?
+            """.format(_VOUCHER_COLUMNS),
             (voucher,),
         )
         refs = cursor.fetchall()
@@ -340,7 +652,7 @@ class VoucherStore(object):
                 counter=counter,
             )
             tokens = list(
-                RandomToken(token_value)
+                RandomToken.trusted(blob_to_b64(token_value))
                 for (token_value,)
                 in rows
             )
@@ -356,14 +668,14 @@ class VoucherStore(object):
                 """
                 INSERT OR IGNORE INTO [vouchers] ([number], [expected-tokens], [created]) VALUES (?, ?, ?)
                 """,
-                (voucher, expected_tokens, self.now())
+                (voucher, expected_tokens, datetime_to_epoch(now))
             )
             cursor.executemany(
                 """
                 INSERT INTO [tokens] ([voucher], [counter], [text]) VALUES (?, ?, ?)
                 """,
                 list(
-                    (voucher, counter, token.token_value)
+                    (voucher, counter, b64_to_blob(token.token_value))
                     for token
                     in tokens
                 ),
@@ -379,11 +691,37 @@ class VoucherStore(object):
         """
         cursor.execute(
             """
-            SELECT
-                [number], [created], [expected-tokens], [state], [finished], [token-count], [public-key], [counter]
-            FROM
-                [vouchers]
-            """,
+            SELECT {}
+            FROM [vouchers]
+            """.format(_VOUCHER_COLUMNS),
+        )
+        refs = cursor.fetchall()
+
+        return list(
+            Voucher.from_row(row)
+            for row
+            in refs
+        )
+
+    @with_cursor
+    def list_pending(self, cursor):
+        """
+        Get the vouchers which have not been completely redeemed.
+
+        Unlike ``list`` this only reads the vouchers in the **pending** state
+        so its cost does not grow with the number of vouchers which have been
+        redeemed in the past.
+
+        :return list[Voucher]: The vouchers in the **pending** state in the
+            order they were added.
+        """
+        cursor.execute(
+            """
+            SELECT {}
+            FROM [vouchers]
+            WHERE [state] = "pending"
+            ORDER BY [created], [number]
+            """.format(_VOUCHER_COLUMNS),
         )
         refs = cursor.fetchall()
 
@@ -393,16 +731,132 @@ class VoucherStore(object):
             in refs
         )
 
-    def _insert_unblinded_tokens(self, cursor, unblinded_tokens):
+    @with_cursor
+    def list_page(self, cursor, state=None, order=u"created", descending=False, after=None, limit=None):
+        """
+        Get some vouchers in a particular order.
+
+        :param unicode state: The name of a database state (``pending``,
+            ``redeemed``, or ``double-spend``) to get only vouchers in that
+            state or ``None`` to get vouchers in any state.
+
+        :param unicode order: ``created`` to order the vouchers by the time
+            they were added or ``finished`` to order them by the time their
+            redemption finished.  Vouchers which have not finished come before
+            the others.  Vouchers with equal times are ordered by number.
+
+        :param bool descending: Whether to reverse the order.
+
+        :param unicode after: The number of the voucher after which to begin
+            or ``None`` to begin at the beginning.
+
+        :param int limit: The greatest number of vouchers to get or ``None``
+            to get all of the rest of them.
+
+        :raise ValueError: If ``state`` or ``order`` is not recognized.
+
+        :raise KeyError: If there is no voucher numbered ``after``.
+
+        :return list[Voucher]: The vouchers.
+        """
+        if state not in _VOUCHER_STATES:
+            raise ValueError("Unknown voucher state {!r}".format(state))
+        if order not in _VOUCHER_ORDERS:
+            raise ValueError("Unknown voucher order {!r}".format(order))
+
+        conditions = []
+        arguments = []
+        if state is not None:
+            conditions.append(u"[state] = ?")
+            arguments.append(state)
+        if after is not None:
+            cursor.execute(
+                u"SELECT [{}] FROM [vouchers] WHERE [number] = ?".format(order),
+                (after,),
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                raise KeyError(after)
+            [(position,)] = rows
+            # NULL sorts before everything else and does not compare equal to
+            # itself so vouchers which have not finished are dealt with
+            # separately.
+            if position is None and descending:
+                conditions.append(u"([{0}] IS NULL AND [number] < ?)".format(order))
+                arguments.append(after)
+            elif position is None:
+                conditions.append(u"(([{0}] IS NULL AND [number] > ?) OR [{0}] IS NOT NULL)".format(order))
+                arguments.append(after)
+            elif descending:
+                conditions.append(u"(([{0}], [number]) < (?, ?) OR [{0}] IS NULL)".format(order))
+                arguments.extend([position, after])
+            else:
+                conditions.append(u"([{0}], [number]) > (?, ?)".format(order))
+                arguments.extend([position, after])
+        if limit is None:
+            # A negative limit means there is no limit.
+            limit = -1
+        arguments.append(limit)
+
+        if conditions:
+            where = u"WHERE " + u" AND ".join(conditions)
+        else:
+            where = u""
+        if descending:
+            direction = u"DESC"
+        else:
+            direction = u"ASC"
+        cursor.execute(
+            u"""
+            SELECT {columns}
+            FROM [vouchers]
+            {where}
+            ORDER BY [{order}] {direction}, [number] {direction}
+            LIMIT ?
+            """.format(
+                columns=_VOUCHER_COLUMNS,
+                where=where,
+                order=order,
+                direction=direction,
+            ),
+            arguments,
+        )
+        refs = cursor.fetchall()
+
+        return list(
+            Voucher.from_row(row)
+            for row
+            in refs
+        )
+
+    @with_cursor
+    def vouchers_version(self, cursor):
+        """
+        Get a number which changes whenever any voucher is added or changed.
+
+        :return int: The number.
+        """
+        cursor.execute(
+            """
+            SELECT [version] FROM [vouchers-version]
+            """,
+        )
+        [(version,)] = cursor.fetchall()
+        return version
+
+    def _insert_unblinded_tokens(self, cursor, unblinded_tokens, conflict=u"ABORT"):
         """
         Helper function to really insert unblinded tokens into the database.
+
+        :param unicode conflict: The SQLite3 conflict resolution algorithm to
+            use if a token is already present.
         """
         cursor.executemany(
             """
-            INSERT INTO [unblinded-tokens] VALUES (?)
-            """,
+            INSERT OR {} INTO [unblinded-tokens] ([token]) VALUES (?)
+            """.format(conflict),
             list(
-                (token,)
+                (b64_to_blob(token),)
                 for token
                 in unblinded_tokens
             ),
@@ -411,13 +865,26 @@ class VoucherStore(object):
     @with_cursor
     def insert_unblinded_tokens(self, cursor, unblinded_tokens):
         """
-        Store some unblinded tokens, for example as part of a backup-restore
-        process.
+        Store some unblinded tokens.
 
-        :param list[unicode] unblinded_tokens: The unblinded tokens to store.
+        :param list[unicode] unblinded_tokens: The base64 encoded unblinded
+            tokens to store.
         """
         self._insert_unblinded_tokens(cursor, unblinded_tokens)
 
+    @with_cursor
+    def import_unblinded_tokens(self, cursor, unblinded_tokens):
+        """
+        Store some unblinded tokens as part of a backup-restore process.
+
+        Tokens which are already present are left as they are so that an
+        interrupted restore can be repeated without harm.
+
+        :param list[unicode] unblinded_tokens: The base64 encoded unblinded
+            tokens to store.
+        """
+        self._insert_unblinded_tokens(cursor, unblinded_tokens, u"IGNORE")
+
     @with_cursor
     def insert_unblinded_tokens_for_voucher(self, cursor, voucher, public_key, unblinded_tokens, completed):
         """
@@ -454,7 +921,7 @@ class VoucherStore(object):
             (
                 voucher_state,
                 len(unblinded_tokens),
-                self.now(),
+                datetime_to_epoch(self.now()),
                 public_key,
                 voucher,
             ),
@@ -469,6 +936,118 @@ class VoucherStore(object):
                 in unblinded_tokens
             ),
         )
+        # The result of this redemption group is now recorded.  The random
+        # tokens which went into it will never be submitted again so there is
+        # no reason to keep them.
+        cursor.execute(
+            """
+            DELETE FROM [tokens]
+            WHERE [voucher] = ?
+              AND [counter] < (SELECT [counter] FROM [vouchers] WHERE [number] = ?)
+            """,
+            (voucher, voucher),
+        )
+
+    def vacuum(self, pages=None):
+        """
+        Return some of the space freed by deleted rows to the filesystem.
+
+        Removals older than ``token_changes_retention`` are forgotten first
+        so that their space is released too.
+
+        Nothing is released from a database created before incremental
+        vacuuming was enabled until ``enable_incremental_vacuum`` has been
+        used on it.
+
+        :param int pages: The maximum number of database pages to release or
+            ``None`` to release all of them.
+
+        :return int: The number of free pages which remain in the database.
+        """
+        if self.token_changes_retention is not None:
+            self._forget_old_token_changes()
+        return self._incremental_vacuum(pages)
+
+    def enable_incremental_vacuum(self):
+        """
+        Rewrite a database created before incremental vacuuming was enabled so
+        that it uses it.  This reads and writes the whole database so it is
+        done once, as a separate maintenance step, rather than by ``vacuum``.
+
+        :return bool: ``True`` if the database was rewritten, ``False`` if it
+            already used incremental vacuuming.
+        """
+        [(auto_vacuum,)] = self._connection.execute(
+            "PRAGMA auto_vacuum",
+        ).fetchall()
+        if auto_vacuum == _AUTO_VACUUM_INCREMENTAL:
+            return False
+        # This cannot be done inside a transaction.
+        with FULL_VACUUM():
+            self._connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self._connection.execute("VACUUM")
+        return True
+
+    @with_cursor
+    def _forget_old_token_changes(self, cursor):
+        cursor.execute(
+            """
+            SELECT [seq] FROM [sqlite_sequence] WHERE [name] = "token-changes"
+            """,
+        )
+        sequence = max([0] + list(seq for (seq,) in cursor.fetchall()))
+        through = sequence - self.token_changes_retention
+        if through > 0:
+            self._prune_token_changes(cursor, through)
+
+    @with_cursor
+    def _incremental_vacuum(self, cursor, pages):
+        if pages is None:
+            cursor.execute("PRAGMA incremental_vacuum")
+        else:
+            cursor.execute("PRAGMA incremental_vacuum({:d})".format(pages))
+        # Each row of the result corresponds to one step of the vacuum so
+        # they must all be consumed for it to complete.
+        cursor.fetchall()
+        cursor.execute("PRAGMA freelist_count")
+        [(free_pages,)] = cursor.fetchall()
+        return free_pages
+
+    @with_cursor
+    def _database_file(self, cursor):
+        """
+        :raise ValueError: If the database is only held in memory.
+
+        :return FilePath: The file which actually holds the database.
+        """
+        cursor.execute("PRAGMA database_list")
+        [path] = list(
+            path
+            for (seq, name, path)
+            in cursor.fetchall()
+            if name == u"main"
+        )
+        if not path:
+            raise ValueError("An in-memory database has no file to snapshot")
+        return FilePath(path)
+
+    def snapshot(self, target, rows_per_step=1024):
+        """
+        Copy the database to another file while it remains in use.
+
+        The copy is made through a separate connection so it does not hold
+        this store's connection between steps.  See
+        ``_zkapauthorizer.snapshot.snapshot``.
+
+        :param FilePath target: The location to write the copy.
+
+        :param int rows_per_step: The greatest number of rows to copy at once.
+
+        :return: An iterator which copies some rows each time it is advanced
+            and produces a two-tuple of the number of rows copied so far and
+            the total number of rows to copy.
+        """
+        return _snapshot(self._database_file(), target, rows_per_step)
 
     @with_cursor
     def mark_voucher_double_spent(self, cursor, voucher):
@@ -484,7 +1063,7 @@ class VoucherStore(object):
             WHERE [number] = ?
               AND [state] = "pending"
             """,
-            (self.now(), voucher),
+            (datetime_to_epoch(self.now()), voucher),
         )
         if cursor.rowcount == 0:
             # Was there no matching voucher or was it in the wrong state?
@@ -513,14 +1092,14 @@ class VoucherStore(object):
         Get some unblinded tokens.
 
         These tokens are not removed from the store but they will not be
-        returned from a future call to ``get_unblinded_tokens`` *on this
-        ``VoucherStore`` instance* unless ``reset_unblinded_tokens`` is used
-        to reset their state.
+        returned from a future call to ``get_unblinded_tokens`` on this or any
+        other store sharing the same database unless
+        ``reset_unblinded_tokens`` is used to reset their state.
 
-        If the underlying storage is access via another ``VoucherStore``
-        instance then the behavior of this method will be as if all tokens
-        which have not had their state changed to invalid or spent have been
-        reset.
+        The tokens are held by ``owner`` for ``reservation_lease``.  If they
+        are not spent, invalidated, or reset by then they are taken to have
+        been abandoned (for example, by a process which has exited) and they
+        may be returned again.
 
         :return list[UnblindedTokens]: The removed unblinded tokens.
         """
@@ -529,60 +1108,201 @@ class VoucherStore(object):
             # provoke undesirable behavior from the database.
             raise NotEnoughTokens()
 
-        cursor.execute(
-            """
-            SELECT [token]
-            FROM [unblinded-tokens]
-            WHERE [token] NOT IN [in-use]
-            LIMIT ?
-            """,
-            (count,),
+        now = self.now()
+        self._free_expired_unblinded_tokens(cursor, now)
+        tokens = self._claim_unblinded_tokens(
+            cursor,
+            count,
+            u"in-use",
+            self.owner,
+            datetime_to_epoch(now + self.reservation_lease),
         )
-        texts = cursor.fetchall()
-        if len(texts) < count:
+        if len(tokens) < count:
             raise NotEnoughTokens()
+        return tokens
 
-        cursor.executemany(
+    def _free_expired_unblinded_tokens(self, cursor, now):
+        """
+        Free the in-use tokens whose reservations expired at or before
+        ``now``.
+        """
+        # The index on ([state], [expires]) lets this find only the expired
+        # reservations.  When there are none it costs a single lookup.
+        cursor.execute(
             """
-            INSERT INTO [in-use] VALUES (?)
+            UPDATE [unblinded-tokens]
+            SET [state] = "free", [owner] = NULL, [expires] = NULL
+            WHERE [state] = "in-use" AND [expires] <= ?
             """,
-            texts,
+            (datetime_to_epoch(now),),
         )
-        return list(
-            UnblindedToken(t)
-            for (t,)
-            in texts
+
+    @with_cursor
+    def reserve_unblinded_tokens(self, cursor, count, holder=None):
+        """
+        Get up to ``count`` unblinded tokens for a caller which will keep track
+        of their use itself (for example, ``TokenReservoir``).
+
+        Like tokens from ``get_unblinded_tokens``, these are not returned
+        again unless ``reset_unblinded_tokens`` is used to reset their state.
+        Unlike those tokens, they are never made available again by the
+        expiry of a reservation because they may be held for a long time.
+        Like those tokens, they are freed when the database is next opened
+        if they are held by ``owner`` and the process which made this store
+        has exited by then.
+
+        :param unicode|None holder: An identifier for the token shard the
+            tokens are being moved to or ``None`` to hold them for ``owner``.
+            See ``reconcile_shard``.
+
+        :return list[UnblindedToken]: The reserved unblinded tokens.  There
+            may be fewer than ``count`` if the store does not have enough.
+        """
+        if holder is None:
+            holder = self.owner
+        return self._claim_unblinded_tokens(
+            cursor,
+            min(count, _SQLITE3_INTEGER_MAX),
+            u"reserved",
+            holder,
         )
 
     @with_cursor
-    def discard_unblinded_tokens(self, cursor, unblinded_tokens):
+    def reconcile_shard(self, cursor, holder, held):
         """
-        Get rid of some unblinded tokens.  The tokens will be completely removed
-        from the system.  This is useful when the tokens have been
-        successfully spent.
+        Compare the tokens reserved for a token shard with the tokens the shard
+        has so that a move or a spend which was interrupted part of the way
+        through can be finished.
 
-        :param list[UnblindedToken] unblinded_tokens: The tokens to discard.
+        Tokens are moved to a shard by reserving them here for ``holder``
+        and then inserting them into the shard.  When they are spent or
+        invalidated they are removed from here and then from the shard.  So
+        a token which is reserved for the shard and missing from it never
+        arrived and a token which the shard has and which is missing from
+        here is used up.
 
-        :return: ``None``
+        Tokens the shard has which are reserved here with no holder, as a
+        shard's tokens were before holders were recorded, are taken to be
+        held by the shard.
+
+        :param unicode holder: The identifier for the shard.
+
+        :param list[unicode] held: The base64 encoded tokens the shard has.
+
+        :return (list[unicode], list[UnblindedToken]): The base64 encoded
+            tokens which should be inserted into the shard and the tokens
+            which should be discarded from it.
         """
+        blobs = list(b64_to_blob(token) for token in held)
         cursor.executemany(
             """
-            INSERT INTO [to-discard] VALUES (?)
+            UPDATE [unblinded-tokens]
+            SET [owner] = ?
+            WHERE [token] = ? AND [state] = "reserved" AND [owner] IS NULL
             """,
-            list((token.unblinded_token,) for token in unblinded_tokens),
+            list((holder, blob) for blob in blobs),
         )
+        used = []
+        for (token, blob) in zip(held, blobs):
+            cursor.execute(
+                """
+                SELECT 1 FROM [unblinded-tokens] WHERE [token] = ?
+                """,
+                (blob,),
+            )
+            if not cursor.fetchall():
+                used.append(UnblindedToken.trusted(token))
         cursor.execute(
             """
-            DELETE FROM [in-use]
-            WHERE [unblinded-token] IN [to-discard]
+            SELECT [token] FROM [unblinded-tokens]
+            WHERE [state] = "reserved" AND [owner] = ?
+            ORDER BY [id]
             """,
+            (holder,),
+        )
+        present = set(held)
+        missing = list(
+            token
+            for token
+            in (blob_to_b64(blob) for (blob,) in cursor.fetchall())
+            if token not in present
         )
+        return missing, used
+
+    def _claim_unblinded_tokens(self, cursor, count, state, owner=None, expires=None):
+        """
+        Move up to ``count`` free tokens into a new state.
+
+        :param unicode owner: The holder of the tokens in their new state, if
+            any.
+
+        :param int expires: When the tokens may be freed again, in
+            microseconds since the epoch, if ever.
+
+        :return list[UnblindedToken]: The tokens which were moved, in the
+            order they were inserted into the store.
+        """
+        # The index on ([state], [id]) lets this find the first free tokens
+        # without considering any of the tokens which are already in use.
         cursor.execute(
             """
-            DELETE FROM [unblinded-tokens]
-            WHERE [token] IN [to-discard]
+            SELECT [id], [token]
+            FROM [unblinded-tokens]
+            WHERE [state] = "free"
+            ORDER BY [id]
+            LIMIT ?
+            """,
+            (count,),
+        )
+        rows = cursor.fetchall()
+        cursor.executemany(
+            """
+            UPDATE [unblinded-tokens]
+            SET [state] = ?, [owner] = ?, [expires] = ?
+            WHERE [id] = ?
+            """,
+            list((state, owner, expires, ident) for (ident, t) in rows),
+        )
+        return list(
+            UnblindedToken.trusted(blob_to_b64(t))
+            for (ident, t)
+            in rows
+        )
+
+    @with_cursor
+    def discard_unblinded_tokens(self, cursor, unblinded_tokens):
+        """
+        Get rid of some unblinded tokens.  The tokens will be completely removed
+        from the system.  This is useful when the tokens have been
+        successfully spent.
+
+        :param list[UnblindedToken] unblinded_tokens: The tokens to discard.
+
+        :return: ``None``
+        """
+        self._discard_unblinded_tokens(cursor, unblinded_tokens)
+
+    def _discard_unblinded_tokens(self, cursor, unblinded_tokens):
+        cursor.executemany(
+            """
+            INSERT INTO [to-discard] VALUES (?)
+            """,
+            list((b64_to_blob(token.unblinded_token),) for token in unblinded_tokens),
+        )
+        cursor.execute(
+            """
+            DELETE FROM [unblinded-tokens]
+            WHERE [token] IN [to-discard]
             """,
         )
+        cursor.execute(
+            """
+            UPDATE [token-inventory]
+            SET [count] = [count] + ?
+            WHERE [state] = "spent"
+            """,
+            (cursor.rowcount,),
+        )
         cursor.execute(
             """
             DELETE FROM [to-discard]
@@ -602,27 +1322,25 @@ class VoucherStore(object):
 
         :return: ``None``
         """
+        self._invalidate_unblinded_tokens(cursor, reason, unblinded_tokens)
+
+    def _invalidate_unblinded_tokens(self, cursor, reason, unblinded_tokens):
+        blobs = list(b64_to_blob(token.unblinded_token) for token in unblinded_tokens)
         cursor.executemany(
             """
             INSERT INTO [invalid-unblinded-tokens] VALUES (?, ?)
             """,
-            list(
-                (token.unblinded_token, reason)
-                for token
-                in unblinded_tokens
-            ),
+            list((blob, reason) for blob in blobs),
         )
-        cursor.execute(
-            """
-            DELETE FROM [in-use]
-            WHERE [unblinded-token] IN (SELECT [token] FROM [invalid-unblinded-tokens])
-            """,
-        )
-        cursor.execute(
+        # Look up each token by the unique index on [token].  The cost of this
+        # depends only on the number of tokens being invalidated, not on the
+        # number of tokens which have been invalidated in the past.
+        cursor.executemany(
             """
             DELETE FROM [unblinded-tokens]
-            WHERE [token] IN (SELECT [token] FROM [invalid-unblinded-tokens])
+            WHERE [token] = ?
             """,
+            list((blob,) for blob in blobs),
         )
 
     @with_cursor
@@ -632,16 +1350,20 @@ class VoucherStore(object):
         This is useful if a spending operation has failed with a transient
         error.
         """
+        self._reset_unblinded_tokens(cursor, unblinded_tokens)
+
+    def _reset_unblinded_tokens(self, cursor, unblinded_tokens):
         cursor.executemany(
             """
             INSERT INTO [to-reset] VALUES (?)
             """,
-            list((token.unblinded_token,) for token in unblinded_tokens),
+            list((b64_to_blob(token.unblinded_token),) for token in unblinded_tokens),
         )
         cursor.execute(
             """
-            DELETE FROM [in-use]
-            WHERE [unblinded-token] IN [to-reset]
+            UPDATE [unblinded-tokens]
+            SET [state] = "free", [owner] = NULL, [expires] = NULL
+            WHERE [token] IN [to-reset]
             """,
         )
         cursor.execute(
@@ -650,29 +1372,369 @@ class VoucherStore(object):
             """,
         )
 
+    @with_cursor
+    def update_unblinded_tokens(self, cursor, discarded, invalidated, reset):
+        """
+        Discard, invalidate and reset many unblinded tokens in a single
+        transaction.
+
+        The result does not depend on the order of the changes.  Discarding
+        or invalidating a token removes it while resetting a token which has
+        been removed does nothing.
+
+        :param list[UnblindedToken] discarded: Tokens to discard as with
+            ``discard_unblinded_tokens``.
+
+        :param list[(unicode, list[UnblindedToken])] invalidated: Reasons and
+            the tokens to invalidate for each as with
+            ``invalidate_unblinded_tokens``.
+
+        :param list[UnblindedToken] reset: Tokens to reset as with
+            ``reset_unblinded_tokens``.
+
+        :return: ``None``
+        """
+        if discarded:
+            self._discard_unblinded_tokens(cursor, discarded)
+        for (reason, unblinded_tokens) in invalidated:
+            self._invalidate_unblinded_tokens(cursor, reason, unblinded_tokens)
+        if reset:
+            self._reset_unblinded_tokens(cursor, reset)
+
+    @with_cursor
+    def get_unblinded_token_page(self, cursor, after, limit):
+        """
+        Read some unblinded tokens in the order they will be used without
+        changing their state.
+
+        Pages are found using the integer primary key so the cost of reading
+        a page does not depend on how many pages come before it.
+
+        :param int|None after: The key of the last token of the previous page
+            or ``None`` to start from the beginning.
+
+        :param int|None limit: The greatest number of tokens to read or
+            ``None`` to read all of the remaining tokens.
+
+        :return list[(int, unicode)]: The key and base64 encoded value of
+            each token read.
+        """
+        return list(
+            (ident, blob_to_b64(token))
+            for (ident, token)
+            in self._get_unblinded_token_page(cursor, after, limit)
+        )
+
+    @with_cursor
+    def get_raw_unblinded_token_page(self, cursor, after, limit):
+        """
+        Like ``get_unblinded_token_page`` but read the raw bytes of each token
+        instead of its base64 encoding.
+
+        :return list[(int, bytes)]: The key and raw value of each token read.
+        """
+        return list(
+            (ident, bytes(token))
+            for (ident, token)
+            in self._get_unblinded_token_page(cursor, after, limit)
+        )
+
+    def _get_unblinded_token_page(self, cursor, after, limit):
+        """
+        Helper function to really read a page of unblinded tokens.
+
+        :return list[(int, buffer)]: The key and stored value of each token.
+        """
+        if after is None:
+            after = 0
+        if limit is None:
+            # A negative limit means no limit.
+            limit = -1
+        cursor.execute(
+            """
+            SELECT [id], [token]
+            FROM [unblinded-tokens]
+            WHERE [id] > ?
+            ORDER BY [id]
+            LIMIT ?
+            """,
+            (after, limit),
+        )
+        return cursor.fetchall()
+
+    @with_cursor
+    def inventory(self, cursor):
+        """
+        Count the tokens in each state.
+
+        :return dict[unicode, int]: A mapping from token state to the number
+            of tokens in that state.  The states are ``free``, ``in-use`` and
+            ``reserved`` for tokens which may still be spent and ``invalid``
+            and ``spent`` for tokens which have been used up.  Tokens spent
+            before the count was introduced are not included.
+        """
+        cursor.execute(
+            """
+            SELECT [state], [count] FROM [token-inventory]
+            """,
+        )
+        return dict(cursor.fetchall())
+
     @with_cursor
     def backup(self, cursor):
         """
         Read out all state necessary to recreate this database in the event it is
         lost.
+
+        All of the tokens are held in memory at once.
+        ``get_unblinded_token_page`` reads the same tokens a page at a time.
         """
         cursor.execute(
             """
-            SELECT [token] FROM [unblinded-tokens]
+            SELECT [token] FROM [unblinded-tokens] ORDER BY [id]
             """,
         )
         tokens = cursor.fetchall()
         return {
-            u"unblinded-tokens": list(token for (token,) in tokens),
+            u"unblinded-tokens": list(blob_to_b64(token) for (token,) in tokens),
+        }
+
+    @with_cursor
+    def get_token_changes(self, cursor, since):
+        """
+        Read the changes to the unblinded tokens since a previous call so that
+        a backup can be brought up to date.
+
+        Only the most recent change to each token is kept.  So a token which
+        was inserted and removed again since ``since`` is reported as
+        removed, even though the backup never had it.
+
+        :param int since: The ``sequence`` from the result of a previous call
+            or 0 to read every change that is still recorded.
+
+        :return dict: A description of the changes with these properties:
+
+            * ``sequence``: The sequence number of the latest change.  Pass
+              this to the next call.
+            * ``complete``: ``True`` if changes since ``since`` have been
+              pruned.  In this case ``inserted`` holds every token and
+              ``removed`` is empty, so the backup should be replaced rather
+              than updated.
+            * ``inserted``: The base64 encoded tokens inserted, in the order
+              they were inserted.
+            * ``removed``: The base64 encoded tokens removed.
+        """
+        cursor.execute(
+            """
+            SELECT [sequence] FROM [token-changes-horizon]
+            """,
+        )
+        [(horizon,)] = cursor.fetchall()
+        complete = since < horizon
+        if complete:
+            since = 0
+        cursor.execute(
+            """
+            SELECT [token], [present] FROM [token-changes]
+            WHERE [sequence] > ?
+            ORDER BY [sequence]
+            """,
+            (since,),
+        )
+        changes = cursor.fetchall()
+        cursor.execute(
+            """
+            SELECT [seq] FROM [sqlite_sequence] WHERE [name] = "token-changes"
+            """,
+        )
+        sequence = max([0] + list(seq for (seq,) in cursor.fetchall()))
+        return {
+            u"sequence": sequence,
+            u"complete": complete,
+            u"inserted": list(
+                blob_to_b64(token)
+                for (token, present)
+                in changes
+                if present
+            ),
+            u"removed": list(
+                blob_to_b64(token)
+                for (token, present)
+                in changes
+                if not (present or complete)
+            ),
         }
 
+    @with_cursor
+    def apply_token_changes(self, cursor, changes):
+        """
+        Apply changes read by ``get_token_changes`` from another store.
+
+        This is meant for restoring a backup into a store which is not in
+        use.  If the changes are complete then every token not among them is
+        removed, whatever its state.
+
+        :param dict changes: The result of ``get_token_changes``.
+        """
+        if changes[u"complete"]:
+            cursor.execute(
+                """
+                DELETE FROM [unblinded-tokens]
+                """,
+            )
+        cursor.executemany(
+            """
+            DELETE FROM [unblinded-tokens] WHERE [token] = ?
+            """,
+            list((b64_to_blob(token),) for token in changes[u"removed"]),
+        )
+        self._insert_unblinded_tokens(cursor, changes[u"inserted"], u"IGNORE")
+
+    @with_cursor
+    def prune_token_changes(self, cursor, through):
+        """
+        Forget about tokens removed at or before a certain change.
+
+        Changes since an earlier sequence number can no longer be read
+        afterwards.  ``get_token_changes`` reports every token instead.
+
+        :param int through: The ``sequence`` from a result of
+            ``get_token_changes`` which has been recorded in a backup.
+        """
+        self._prune_token_changes(cursor, through)
+
+    def _prune_token_changes(self, cursor, through):
+        """
+        Helper function to really forget about removed tokens.
+        """
+        cursor.execute(
+            """
+            DELETE FROM [token-changes] WHERE [present] = 0 AND [sequence] <= ?
+            """,
+            (through,),
+        )
+        cursor.execute(
+            """
+            UPDATE [token-changes-horizon] SET [sequence] = MAX([sequence], ?)
+            """,
+            (through,),
+        )
+
+    @with_cursor
+    def get_public_keys(self, cursor):
+        """
+        Read the public keys of the issuers which signed the unblinded tokens,
+        for recording in a binary backup.
+
+        :return list[unicode]: The keys, sorted.
+        """
+        return self._get_public_keys(cursor)
+
+    def _get_public_keys(self, cursor):
+        """
+        Helper function to really read the public keys.
+        """
+        cursor.execute(
+            """
+            SELECT DISTINCT [public-key] FROM [vouchers]
+            WHERE [public-key] IS NOT NULL
+            ORDER BY [public-key]
+            """,
+        )
+        return list(key for (key,) in cursor.fetchall())
+
+    @with_cursor
+    def export_binary_backup(self, cursor, f, compress=False):
+        """
+        Write all of the unblinded tokens to a file in the binary backup format
+        implemented by ``_zkapauthorizer.backup``.
+
+        This is about three quarters the size of the JSON form returned by
+        ``backup`` and can be restored without decoding each token.
+
+        All of the tokens are read in one transaction.  The backup resource
+        instead uses ``get_raw_unblinded_token_page`` to read them a page at
+        a time.
+
+        :param file f: A seekable file to write the backup to.
+
+        :param bool compress: Whether to compress the tokens.
+
+        :return BackupHeader: The header of the backup written.
+        """
+        public_keys = self._get_public_keys(cursor)
+        cursor.execute(
+            """
+            SELECT [token] FROM [unblinded-tokens] ORDER BY [id]
+            """,
+        )
+        return write_backup(
+            f,
+            (bytes(token) for (token,) in cursor),
+            public_keys,
+            compress,
+        )
+
+    def import_binary_backup(self, f, batch_size=1024):
+        """
+        Store the unblinded tokens from a file written by
+        ``export_binary_backup``.
+
+        The whole backup is checked against the count and checksum in its
+        header before any tokens are stored.  Then tokens are stored a batch
+        at a time.  Tokens which are already present are left as they are.
+
+        :param file f: A seekable file positioned at the beginning of the
+            backup.
+
+        :param int batch_size: The number of tokens to store in each
+            transaction.
+
+        :raise ValueError: If the backup is not valid.  No tokens are stored.
+
+        :return BackupHeader: The header of the backup.
+        """
+        start = f.tell()
+        verify_backup(f)
+        f.seek(start)
+        header = read_header(f)
+        tokens = iter_tokens(f, header)
+        while True:
+            batch = list(islice(tokens, batch_size))
+            if not batch:
+                break
+            self._insert_raw_unblinded_tokens(batch)
+        return header
+
+    @with_cursor
+    def _insert_raw_unblinded_tokens(self, cursor, raw_tokens):
+        """
+        Store some unblinded tokens given as raw bytes.  Tokens which are
+        already present are left as they are.
+
+        :param list[bytes] raw_tokens: The tokens to store.
+        """
+        cursor.executemany(
+            """
+            INSERT OR IGNORE INTO [unblinded-tokens] ([token]) VALUES (?)
+            """,
+            list((Binary(token),) for token in raw_tokens),
+        )
+
     def start_lease_maintenance(self):
         """
         Get an object which can track a newly started round of lease maintenance
         activity.
 
+        Records of runs older than ``lease_maintenance_retention`` are deleted
+        first.
+
         :return LeaseMaintenance: A new, started lease maintenance object.
         """
+        if self.lease_maintenance_retention is not None:
+            self.prune_lease_maintenance_history(
+                self.now() - self.lease_maintenance_retention,
+            )
         m = LeaseMaintenance(self.pass_value, self.now, self._connection)
         m.start()
         return m
@@ -688,7 +1750,7 @@ class VoucherStore(object):
         """
         cursor.execute(
             """
-            SELECT [started], [count], [finished]
+            SELECT [started], [count], [finished], [checked], [renewed]
             FROM [lease-maintenance-spending]
             WHERE [finished] IS NOT NULL
             ORDER BY [finished] DESC
@@ -698,14 +1760,249 @@ class VoucherStore(object):
         activity = cursor.fetchall()
         if len(activity) == 0:
             return None
-        [(started, count, finished)] = activity
-        return LeaseMaintenanceActivity(
-            parse_datetime(started, delimiter=u" "),
-            count,
-            parse_datetime(finished, delimiter=u" "),
+        [row] = activity
+        return LeaseMaintenanceActivity.from_row(row)
+
+    @with_cursor
+    def get_lease_maintenance_history(self, cursor, since=None, until=None, limit=None):
+        """
+        Get descriptions of the lease maintenance runs which finished in a
+        range of time.
+
+        :param datetime|None since: The earliest finish time to include or
+            ``None`` for no lower bound.
+
+        :param datetime|None until: The finish time before which to stop or
+            ``None`` for no upper bound.
+
+        :param int|None limit: The greatest number of runs to return or
+            ``None`` for no limit.
+
+        :return list[LeaseMaintenanceActivity]: The runs, earliest first.
+        """
+        cursor.execute(
+            """
+            SELECT [started], [count], [finished], [checked], [renewed]
+            FROM [lease-maintenance-spending]
+            WHERE [finished] >= ? AND [finished] < ?
+            ORDER BY [finished]
+            LIMIT ?
+            """,
+            (
+                0 if since is None else datetime_to_epoch(since),
+                _SQLITE3_INTEGER_MAX if until is None else datetime_to_epoch(until),
+                # SQLite3 takes a negative limit to mean no limit.
+                -1 if limit is None else limit,
+            ),
+        )
+        return list(
+            LeaseMaintenanceActivity.from_row(row)
+            for row
+            in cursor.fetchall()
+        )
+
+    @with_cursor
+    def prune_lease_maintenance_history(self, cursor, before):
+        """
+        Delete the records of lease maintenance runs which finished, or which
+        started and never finished, before a certain time.
+
+        :param datetime before: The time before which to delete records.
+        """
+        before = datetime_to_epoch(before)
+        cursor.execute(
+            """
+            DELETE FROM [lease-maintenance-spending]
+            WHERE [finished] < ?
+            """,
+            (before,),
+        )
+        cursor.execute(
+            """
+            DELETE FROM [lease-maintenance-spending]
+            WHERE [finished] IS NULL AND [started] < ?
+            """,
+            (before,),
         )
 
 
+def _run_in_thread(method):
+    """
+    Create a method for ``AsyncVoucherStore`` which runs the ``VoucherStore``
+    method of the same name on the database thread.
+
+    :param method: The ``VoucherStore`` method to wrap.
+    """
+    name = method.__name__
+    @wraps(method)
+    def run_in_thread(self, *a, **kw):
+        return self._run(getattr(self.store, name), *a, **kw)
+    return run_in_thread
+
+
+@attr.s
+class _ThreadedSteps(object):
+    """
+    Advance an iterator on the database thread.
+
+    Each item is a ``Deferred`` which fires with the next item of the
+    wrapped iterator or with ``None`` once it is exhausted.  Iteration stops
+    after that.
+
+    :ivar _steps: The iterator to advance.
+
+    :ivar _run: A function like ``AsyncVoucherStore._run`` to use to advance
+        it.
+    """
+    _steps = attr.ib()
+    _run = attr.ib()
+    _done = attr.ib(default=False)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._done:
+            raise StopIteration()
+        d = self._run(next, self._steps, None)
+        d.addCallback(self._check_done)
+        return d
+
+    def _check_done(self, step):
+        if step is None:
+            self._done = True
+        return step
+
+
+@attr.s(frozen=True)
+class AsyncVoucherStore(object):
+    """
+    This class offers the same operations as ``VoucherStore`` but performs
+    the database work somewhere other than the calling thread.  Each
+    operation returns a ``Deferred`` which fires with the result.
+
+    Operations are run one at a time in the order they are requested so the
+    single underlying database connection is never used concurrently.
+
+    :ivar VoucherStore store: The store which does the real work.
+
+    :ivar _run: A callable like ``maybeDeferred`` which arranges for a
+        function to be called (usually in another thread) and returns a
+        ``Deferred`` that fires with its result.
+    """
+    store = attr.ib(validator=attr.validators.instance_of(VoucherStore))
+    _run = attr.ib()
+
+    @classmethod
+    def from_node_config(cls, node_config, now, reactor, connect=None, name=CONFIG_DB_NAME):
+        """
+        Create or open the ``VoucherStore`` for a given node and arrange for its
+        operations to run in a dedicated database thread.
+
+        :param reactor: The reactor to use to deliver results from the
+            database thread.  The thread is stopped when this reactor shuts
+            down.
+
+        See ``VoucherStore.from_node_config`` for other parameters.
+        """
+        if connect is None:
+            connect = _connect
+        store = VoucherStore.from_node_config(
+            node_config,
+            now,
+            # The connection is created here but used in the database thread.
+            partial(connect, check_same_thread=False),
+            name,
+        )
+        pool = ThreadPool(minthreads=1, maxthreads=1, name=u"zkapauthorizer-database")
+        pool.start()
+        reactor.addSystemEventTrigger("during", "shutdown", pool.stop)
+        return cls(store, partial(deferToThreadPool, reactor, pool))
+
+    @property
+    def pass_value(self):
+        return self.store.pass_value
+
+    @property
+    def database_path(self):
+        return self.store.database_path
+
+    @property
+    def now(self):
+        return self.store.now
+
+    @property
+    def owner(self):
+        return self.store.owner
+
+    get = _run_in_thread(VoucherStore.get)
+    add = _run_in_thread(VoucherStore.add)
+    list = _run_in_thread(VoucherStore.list)
+    list_pending = _run_in_thread(VoucherStore.list_pending)
+    list_page = _run_in_thread(VoucherStore.list_page)
+    vouchers_version = _run_in_thread(VoucherStore.vouchers_version)
+    insert_unblinded_tokens = _run_in_thread(VoucherStore.insert_unblinded_tokens)
+    import_unblinded_tokens = _run_in_thread(VoucherStore.import_unblinded_tokens)
+    insert_unblinded_tokens_for_voucher = _run_in_thread(VoucherStore.insert_unblinded_tokens_for_voucher)
+    vacuum = _run_in_thread(VoucherStore.vacuum)
+    enable_incremental_vacuum = _run_in_thread(VoucherStore.enable_incremental_vacuum)
+    _database_file = _run_in_thread(VoucherStore._database_file)
+    mark_voucher_double_spent = _run_in_thread(VoucherStore.mark_voucher_double_spent)
+    get_unblinded_tokens = _run_in_thread(VoucherStore.get_unblinded_tokens)
+    reserve_unblinded_tokens = _run_in_thread(VoucherStore.reserve_unblinded_tokens)
+    reconcile_shard = _run_in_thread(VoucherStore.reconcile_shard)
+    discard_unblinded_tokens = _run_in_thread(VoucherStore.discard_unblinded_tokens)
+    invalidate_unblinded_tokens = _run_in_thread(VoucherStore.invalidate_unblinded_tokens)
+    reset_unblinded_tokens = _run_in_thread(VoucherStore.reset_unblinded_tokens)
+    update_unblinded_tokens = _run_in_thread(VoucherStore.update_unblinded_tokens)
+    get_unblinded_token_page = _run_in_thread(VoucherStore.get_unblinded_token_page)
+    get_raw_unblinded_token_page = _run_in_thread(VoucherStore.get_raw_unblinded_token_page)
+    inventory = _run_in_thread(VoucherStore.inventory)
+    backup = _run_in_thread(VoucherStore.backup)
+    get_token_changes = _run_in_thread(VoucherStore.get_token_changes)
+    apply_token_changes = _run_in_thread(VoucherStore.apply_token_changes)
+    prune_token_changes = _run_in_thread(VoucherStore.prune_token_changes)
+    get_public_keys = _run_in_thread(VoucherStore.get_public_keys)
+    import_binary_backup = _run_in_thread(VoucherStore.import_binary_backup)
+
+    get_latest_lease_maintenance_activity = _run_in_thread(
+        VoucherStore.get_latest_lease_maintenance_activity,
+    )
+    get_lease_maintenance_history = _run_in_thread(
+        VoucherStore.get_lease_maintenance_history,
+    )
+    prune_lease_maintenance_history = _run_in_thread(
+        VoucherStore.prune_lease_maintenance_history,
+    )
+
+    def snapshot(self, target, rows_per_step=1024):
+        """
+        Like ``VoucherStore.snapshot`` but the result is a ``Deferred`` which
+        fires with a ``_ThreadedSteps``.  Each step of the copy is made on
+        the database thread.
+        """
+        d = self._database_file()
+        d.addCallback(
+            lambda source: _ThreadedSteps(
+                _snapshot(source, target, rows_per_step),
+                self._run,
+            ),
+        )
+        return d
+
+    def start_lease_maintenance(self):
+        """
+        Get an object which can track a newly started round of lease maintenance
+        activity.
+
+        :return Deferred[AsyncLeaseMaintenance]: A ``Deferred`` that fires
+            with a new, started lease maintenance object.
+        """
+        d = self._run(self.store.start_lease_maintenance)
+        d.addCallback(lambda maintenance: AsyncLeaseMaintenance(maintenance, self._run))
+        return d
+
+
 @implementer(ILeaseMaintenanceObserver)
 @attr.s
 class LeaseMaintenance(object):
@@ -717,6 +2014,12 @@ class LeaseMaintenance(object):
     the ``observe`` and ``finish`` methods to persist state about a lease
     maintenance run.
 
+    Observations are added up in memory and written to the database once
+    ``flush_every`` of them have been made or ``flush_interval`` has passed
+    since the last write, whichever is first, and when the run finishes.  If
+    the process stops during a run then at most that many observations are
+    missing from the recorded count.
+
     :ivar int _pass_value: The value of a single ZKAP in byte-months.
 
     :ivar _now: A no-argument callable which returns a datetime giving a time
@@ -728,12 +2031,38 @@ class LeaseMaintenance(object):
     :ivar _rowid: None for unstarted lease maintenance objects.  For started
         objects, the database row id that corresponds to the started run.
         This is used to make sure future updates go to the right row.
+
+    :ivar int flush_every: The greatest number of observations to hold in
+        memory.
+
+    :ivar timedelta flush_interval: The longest time to hold observations in
+        memory.
+
+    :ivar int _unrecorded: The number of passes required by observations
+        which have not been written to the database.
+
+    :ivar int _observations: The number of observations which have not been
+        written to the database.
+
+    :ivar int _renewed: The number of those observations of shares with
+        renewed leases.
+
+    :ivar datetime _last_flush: When observations were last written to the
+        database (or when the run started).
     """
     _pass_value = pass_value_attribute()
     _now = attr.ib()
     _connection = attr.ib()
     _rowid = attr.ib(default=None)
 
+    flush_every = attr.ib(default=1000, validator=greater_than(0))
+    flush_interval = attr.ib(default=timedelta(seconds=60))
+
+    _unrecorded = attr.ib(default=0)
+    _observations = attr.ib(default=0)
+    _renewed = attr.ib(default=0)
+    _last_flush = attr.ib(default=None)
+
     @with_cursor
     def start(self, cursor):
         """
@@ -742,51 +2071,179 @@ class LeaseMaintenance(object):
         if self._rowid is not None:
             raise Exception("Cannot re-start a particular _LeaseMaintenance.")
 
+        self._last_flush = self._now()
         cursor.execute(
             """
-            INSERT INTO [lease-maintenance-spending] ([started], [finished], [count])
-            VALUES (?, ?, ?)
+            INSERT INTO [lease-maintenance-spending]
+                ([started], [finished], [count], [checked], [renewed])
+            VALUES (?, ?, ?, ?, ?)
             """,
-            (self._now(), None, 0),
+            (datetime_to_epoch(self._last_flush), None, 0, 0, 0),
         )
         self._rowid = cursor.lastrowid
 
-    @with_cursor
-    def observe(self, cursor, sizes):
+    def observe(self, sizes, renewed=False):
         """
         Record a storage shares of the given sizes.
         """
-        count = required_passes(self._pass_value, sizes)
+        totals = self.accumulate(sizes, renewed)
+        if totals is not None:
+            self.record(*totals)
+
+    def flush(self):
+        """
+        Write all observations held in memory to the database.
+        """
+        self.record(*self.drain())
+
+    def finish(self):
+        """
+        Record the completion of this lease maintenance run.
+        """
+        self.record_finish(*self.drain())
+
+    def accumulate(self, sizes, renewed):
+        """
+        Add an observation to those held in memory without touching the
+        database.  This and ``drain`` let a caller such as
+        ``AsyncLeaseMaintenance`` choose where ``record`` and
+        ``record_finish`` run.
+
+        :return (int, int, int)|None: If it is time to write observations to
+            the database, the totals described by ``drain``.  The
+            observations are no longer held in memory and the totals must be
+            passed to ``record``.  Otherwise, ``None``.
+        """
+        self._unrecorded += required_passes(self._pass_value, sizes)
+        self._observations += 1
+        if renewed:
+            self._renewed += 1
+        if (
+            self._observations >= self.flush_every or
+            self._now() - self._last_flush >= self.flush_interval
+        ):
+            return self.drain()
+        return None
+
+    def drain(self):
+        """
+        Stop holding observations in memory.
+
+        :return (int, int, int): The number of passes they require, the number
+            of them, and the number of them with renewed leases.
+        """
+        totals = (self._unrecorded, self._observations, self._renewed)
+        self._unrecorded = 0
+        self._observations = 0
+        self._renewed = 0
+        self._last_flush = self._now()
+        return totals
+
+    @with_cursor
+    def record(self, cursor, count, checked, renewed):
+        """
+        Add totals described by ``drain`` to the database.
+        """
         cursor.execute(
             """
             UPDATE [lease-maintenance-spending]
-            SET [count] = [count] + ?
+            SET [count] = [count] + ?, [checked] = [checked] + ?, [renewed] = [renewed] + ?
             WHERE [id] = ?
             """,
-            (count, self._rowid),
+            (count, checked, renewed, self._rowid),
         )
 
     @with_cursor
-    def finish(self, cursor):
+    def record_finish(self, cursor, count, checked, renewed):
         """
-        Record the completion of this lease maintenance run.
+        Add totals described by ``drain`` to the database and record the
+        completion of this lease maintenance run.
         """
         cursor.execute(
             """
             UPDATE [lease-maintenance-spending]
-            SET [finished] = ?
+            SET [count] = [count] + ?, [checked] = [checked] + ?, [renewed] = [renewed] + ?,
+                [finished] = ?
             WHERE [id] = ?
             """,
-            (self._now(), self._rowid),
+            (count, checked, renewed, datetime_to_epoch(self._now()), self._rowid),
         )
         self._rowid = None
 
 
+@implementer(ILeaseMaintenanceObserver)
+@attr.s(frozen=True)
+class AsyncLeaseMaintenance(object):
+    """
+    A ``LeaseMaintenance`` wrapper which records lease maintenance activity
+    using the database thread of an ``AsyncVoucherStore``.
+
+    :ivar LeaseMaintenance _maintenance: The object which does the real work.
+
+    :ivar _run: See ``AsyncVoucherStore._run``.
+    """
+    _maintenance = attr.ib()
+    _run = attr.ib()
+
+    def observe(self, sizes, renewed=False):
+        # Observations are added up here and only the occasional write is
+        # done in the database thread.
+        totals = self._maintenance.accumulate(sizes, renewed)
+        if totals is None:
+            return succeed(None)
+        return self._run(self._maintenance.record, *totals)
+
+    def flush(self):
+        return self._run(self._maintenance.record, *self._maintenance.drain())
+
+    def finish(self):
+        return self._run(
+            self._maintenance.record_finish,
+            *self._maintenance.drain()
+        )
+
+
 @attr.s
 class LeaseMaintenanceActivity(object):
+    """
+    A description of a finished lease maintenance run.
+
+    :ivar int|None checked: The number of storage indexes with shares found
+        during the run or ``None`` if the run was recorded before these were
+        counted.
+
+    :ivar int|None renewed: The number of those storage indexes with leases
+        renewed or ``None`` if the run was recorded before these were
+        counted.
+    """
     started = attr.ib()
     passes_required = attr.ib()
     finished = attr.ib()
+    checked = attr.ib()
+    renewed = attr.ib()
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        :param row: The ``[started]``, ``[count]``, ``[finished]``,
+            ``[checked]``, and ``[renewed]`` columns of a row of
+            ``[lease-maintenance-spending]``.
+        """
+        started, count, finished, checked, renewed = row
+        return cls(
+            epoch_to_datetime(started),
+            count,
+            epoch_to_datetime(finished),
+            checked,
+            renewed,
+        )
+
+    @property
+    def duration(self):
+        """
+        :return timedelta: How long the run took.
+        """
+        return self.finished - self.started
 
 
 # store = ...
@@ -797,9 +2254,35 @@ class LeaseMaintenanceActivity(object):
 # x.finish()
 #
 # x = store.get_latest_lease_maintenance_activity()
-# xs.started, xs.passes_required, xs.finished
+# xs.started, xs.passes_required, xs.finished, xs.checked, xs.renewed
 
-@attr.s(frozen=True)
+def _trusted(cls, *values):
+    """
+    Create an instance of an attrs-defined class without running its
+    validators.
+
+    :param cls: The class.
+
+    :param values: A value for each attribute of the class, in order.
+
+    :raise TypeError: If there is not exactly one value for each attribute.
+    """
+    fields = attr.fields(cls)
+    # An attribute left unset would only be noticed when it is first read.
+    if len(values) != len(fields):
+        raise TypeError("{} needs {} values, got {}".format(
+            cls.__name__,
+            len(fields),
+            len(values),
+        ))
+    inst = object.__new__(cls)
+    for (field, value) in zip(fields, values):
+        # The classes are frozen so go around their ``__setattr__``.
+        object.__setattr__(inst, field.name, value)
+    return inst
+
+
+@attr.s(frozen=True, slots=True)
 class UnblindedToken(object):
     """
     An ``UnblindedToken`` instance represents cryptographic proof of a voucher
@@ -820,8 +2303,16 @@ class UnblindedToken(object):
         ),
     )
 
+    @classmethod
+    def trusted(cls, unblinded_token):
+        """
+        Create an ``UnblindedToken`` without validating it.  This is only for
+        values which come from the database or from our own cryptography.
+        """
+        return _trusted(cls, unblinded_token)
 
-@attr.s(frozen=True)
+
+@attr.s(frozen=True, slots=True)
 class Pass(object):
     """
     A ``Pass`` instance completely represents a single Zero-Knowledge Access Pass.
@@ -849,12 +2340,20 @@ class Pass(object):
         ),
     )
 
+    @classmethod
+    def trusted(cls, preimage, signature):
+        """
+        Create a ``Pass`` without validating it.  This is only for values
+        which come from our own cryptography.
+        """
+        return _trusted(cls, preimage, signature)
+
     @property
     def pass_text(self):
         return u"{} {}".format(self.preimage, self.signature)
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class RandomToken(object):
     """
     :ivar unicode token_value: The base64-encoded representation of the random
@@ -868,6 +2367,14 @@ class RandomToken(object):
         ),
     )
 
+    @classmethod
+    def trusted(cls, token_value):
+        """
+        Create a ``RandomToken`` without validating it.  This is only for
+        values which come from the database or from our own cryptography.
+        """
+        return _trusted(cls, token_value)
+
 
 def _counter_attribute():
     return attr.ib(
@@ -1002,7 +2509,7 @@ class Error(object):
         }
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class Voucher(object):
     """
     :ivar unicode number: The text string which gives this voucher its
@@ -1054,6 +2561,14 @@ class Voucher(object):
         )),
     )
 
+    @classmethod
+    def trusted(cls, number, expected_tokens, created, state):
+        """
+        Create a ``Voucher`` without validating it.  This is only for values
+        which come from the database.
+        """
+        return _trusted(cls, number, expected_tokens, created, state)
+
     @classmethod
     def from_row(cls, row):
         def state_from_row(state, row):
@@ -1061,11 +2576,11 @@ class Voucher(object):
                 return Pending(counter=row[3])
             if state == u"double-spend":
                 return DoubleSpend(
-                    parse_datetime(row[0], delimiter=u" "),
+                    epoch_to_datetime(row[0]),
                 )
             if state == u"redeemed":
                 return Redeemed(
-                    parse_datetime(row[0], delimiter=u" "),
+                    epoch_to_datetime(row[0]),
                     row[1],
                     row[2],
                 )
@@ -1073,16 +2588,11 @@ class Voucher(object):
 
         number, created, expected_tokens, state = row[:4]
 
-        return cls(
-            number=number,
-            expected_tokens=expected_tokens,
-            # All Python datetime-based date/time libraries fail to handle
-            # leap seconds.  This parse call might raise an exception of the
-            # value represents a leap second.  However, since we also use
-            # Python to generate the data in the first place, it should never
-            # represent a leap second... I hope.
-            created=parse_datetime(created, delimiter=u" "),
-            state=state_from_row(state, row[4:]),
+        return cls.trusted(
+            number,
+            expected_tokens,
+            epoch_to_datetime(created),
+            state_from_row(state, row[4:]),
         )
 
     @classmethod
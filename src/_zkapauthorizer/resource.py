@@ -27,19 +27,40 @@ from sys import (
 from itertools import (
     islice,
 )
+from functools import (
+    partial,
+)
+from tempfile import (
+    TemporaryFile,
+)
 from json import (
     loads,
-    load,
     dumps,
 )
 from zope.interface import (
     Attribute,
+    implementer,
 )
 from twisted.logger import (
     Logger,
 )
+from twisted.internet.interfaces import (
+    IPushProducer,
+)
+from twisted.internet.defer import (
+    Deferred,
+    maybeDeferred,
+)
+from twisted.internet.task import (
+    Cooperator,
+    SchedulerError,
+    TaskFinished,
+    cooperate as global_cooperate,
+)
 from twisted.web.http import (
+    CACHED,
     BAD_REQUEST,
+    INTERNAL_SERVER_ERROR,
 )
 from twisted.web.server import (
     NOT_DONE_YET,
@@ -58,6 +79,15 @@ from . import (
 from ._base64 import (
     urlsafe_b64decode,
 )
+from ._deferred import (
+    then,
+)
+from .backup import (
+    BackupWriter,
+)
+from ._jsonstream import (
+    iter_array,
+)
 
 from .storage_common import (
     get_configured_shares_needed,
@@ -70,6 +100,11 @@ from .pricecalculator import (
     PriceCalculator,
 )
 
+from .model import (
+    SNAPSHOT_DB_NAME,
+    parse_datetime,
+)
+
 from .controller import (
     PaymentController,
     get_redeemer,
@@ -82,6 +117,8 @@ from .private import (
 # The number of tokens to submit with a voucher redemption.
 NUM_TOKENS = 2 ** 15
 
+_log = Logger()
+
 
 class IZKAPRoot(IResource):
     """
@@ -136,7 +173,8 @@ def from_configuration(
     :param IRedeemer redeemer: The voucher redeemer to use.  If ``None`` a
         sensible one is constructed.
 
-    :param clock: See ``PaymentController._clock``.
+    :param clock: See ``PaymentController._clock``.  This is also used to
+        schedule work which is spread out over time, such as writing backups.
 
     :return IZKAPRoot: The root of the resource hierarchy presented by the
         client side of the plugin.
@@ -170,12 +208,18 @@ def from_configuration(
         get_configured_lease_duration(node_config),
     )
 
+    if clock is None:
+        cooperate = global_cooperate
+    else:
+        cooperate = Cooperator(scheduler=partial(clock.callLater, 0)).cooperate
+
     root = create_private_tree(
         lambda: node_config.get_private_config(b"api_auth_token"),
         authorizationless_resource_tree(
             store,
             controller,
             calculate_price,
+            cooperate,
         ),
     )
     root.store = store
@@ -187,6 +231,7 @@ def authorizationless_resource_tree(
         store,
         controller,
         calculate_price,
+        cooperate=global_cooperate,
 ):
     """
     Create the full ZKAPAuthorizer client plugin resource hierarchy with no
@@ -197,6 +242,9 @@ def authorizationless_resource_tree(
 
     :param IResource calculate_price: The resource for the price calculation endpoint.
 
+    :param cooperate: A callable like ``twisted.internet.task.cooperate`` to
+        use to run long-running response-writing tasks.
+
     :return IResource: The root of the resource hierarchy.
     """
     root = Resource()
@@ -212,8 +260,20 @@ def authorizationless_resource_tree(
         _UnblindedTokenCollection(
             store,
             controller,
+            cooperate,
         ),
     )
+    root.putChild(
+        b"snapshot",
+        _Snapshot(
+            store,
+            cooperate,
+        ),
+    )
+    root.putChild(
+        b"lease-maintenance",
+        _LeaseMaintenanceHistory(store),
+    )
     root.putChild(
         b"version",
         _ProjectVersion(),
@@ -347,48 +407,161 @@ class _UnblindedTokenCollection(Resource):
     """
     _log = Logger()
 
-    def __init__(self, store, controller):
+    def __init__(self, store, controller, cooperate=global_cooperate, import_batch_size=1024):
         self._store = store
         self._controller = controller
+        self._cooperate = cooperate
+        self._import_batch_size = import_batch_size
         Resource.__init__(self)
+        self.putChild(b"inventory", _TokenInventory(store))
+        self.putChild(b"backup", _UnblindedTokenBackup(store, cooperate))
+        self.putChild(b"changes", _TokenChanges(store))
 
     def render_GET(self, request):
         """
         Retrieve some unblinded tokens and associated information.
         """
         application_json(request)
-        state = self._store.backup()
-        unblinded_tokens = state[u"unblinded-tokens"]
-
-        limit = request.args.get(b"limit", [None])[0]
-        if limit is not None:
-            limit = min(maxint, int(limit))
+        try:
+            limit = request.args.get(b"limit", [None])[0]
+            if limit is not None:
+                limit = int(limit)
+                if limit < 0:
+                    raise ValueError("limit must not be negative")
+                limit = min(maxint, limit)
+
+            after = request.args.get(b"cursor", [None])[0]
+            if after is not None:
+                after = int(after)
+        except ValueError:
+            return bad_request(u"invalid query arguments").render(request)
 
         position = request.args.get(b"position", [b""])[0].decode("utf-8")
+        if position:
+            # The database cannot compare against the base64 text of the
+            # tokens so read all of them after the cursor and filter here.
+            page = then(
+                self._store.get_unblinded_token_page(after, None),
+                lambda keyed_tokens: list(islice((
+                    (key, token)
+                    for (key, token)
+                    in keyed_tokens
+                    if token > position
+                ), limit)),
+            )
+        else:
+            page = self._store.get_unblinded_token_page(after, limit)
+
+        return render_maybe_deferred(
+            request,
+            then(page, self._render_page, limit),
+        )
 
-        return dumps({
-            u"total": len(unblinded_tokens),
-            u"unblinded-tokens": list(islice((
-                token
-                for token
-                in unblinded_tokens
-                if token > position
-            ), limit)),
-            u"lease-maintenance-spending": self._lease_maintenance_activity(),
-        })
+    def _render_page(self, keyed_tokens, limit):
+        if keyed_tokens and len(keyed_tokens) == limit:
+            next_cursor = keyed_tokens[-1][0]
+        else:
+            next_cursor = None
+        return then(
+            self._store.inventory(),
+            self._render_inventory,
+            list(token for (key, token) in keyed_tokens),
+            next_cursor,
+        )
+
+    def _render_inventory(self, inventory, unblinded_tokens, next_cursor):
+        return then(
+            self._lease_maintenance_activity(),
+            lambda activity: dumps({
+                u"total": sum(
+                    inventory[state]
+                    for state
+                    in (u"free", u"in-use", u"reserved")
+                ),
+                u"unblinded-tokens": unblinded_tokens,
+                u"next-cursor": next_cursor,
+                u"lease-maintenance-spending": activity,
+            }),
+        )
 
     def render_POST(self, request):
         """
         Store some unblinded tokens.
+
+        The request body is decoded and stored a batch at a time.  The
+        response reports the number of tokens stored as each batch is
+        committed so a client which loses its connection can resume with the
+        **skip** query argument.
+
+        If the request body is a binary backup it is checked and then stored
+        all at once instead.
         """
+        content_type = request.requestHeaders.getRawHeaders(
+            u"content-type",
+            [None],
+        )[0]
         application_json(request)
-        unblinded_tokens = load(request.content)[u"unblinded-tokens"]
-        self._store.insert_unblinded_tokens(unblinded_tokens)
-        return dumps({})
+        if content_type == u"application/octet-stream":
+            return self._render_binary_POST(request)
+
+        try:
+            skip = int(request.args.get(b"skip", [b"0"])[0])
+        except ValueError:
+            skip = -1
+        if skip < 0:
+            return bad_request(u"skip must be a non-negative integer").render(request)
+
+        unblinded_tokens = islice(
+            iter_array(request.content.read, u"unblinded-tokens"),
+            skip,
+            None,
+        )
+        importing = _TokenImport(
+            self._store,
+            request,
+            unblinded_tokens,
+            self._import_batch_size,
+        )
+        task = self._cooperate(importing.run())
+        producer = _TaskProducer(task)
+        request.registerProducer(producer, True)
+        request.notifyFinish().addErrback(lambda ignored: producer.stopProducing())
+        task.whenDone().addCallbacks(
+            lambda ignored: importing.finished(),
+            importing.failed,
+        )
+        return NOT_DONE_YET
 
 
+    def _render_binary_POST(self, request):
+        try:
+            body = then(
+                self._store.import_binary_backup(request.content),
+                lambda header: dumps({u"imported": header.count}),
+            )
+        except ValueError as e:
+            return self._invalid_backup(e, request)
+        if isinstance(body, Deferred):
+            body.addErrback(self._invalid_backup_failure, request)
+        return render_maybe_deferred(request, body)
+
+    def _invalid_backup_failure(self, reason, request):
+        reason.trap(ValueError)
+        return self._invalid_backup(reason.value, request)
+
+    def _invalid_backup(self, error, request):
+        request.setResponseCode(BAD_REQUEST)
+        return dumps({
+            u"error": u"invalid backup: {}".format(error),
+        })
+
     def _lease_maintenance_activity(self):
-        activity = self._store.get_latest_lease_maintenance_activity()
+        return then(
+            self._store.get_latest_lease_maintenance_activity(),
+            self._marshal_activity,
+        )
+
+    def _marshal_activity(self, activity):
         if activity is None:
             return activity
         return {
@@ -398,6 +571,522 @@ class _UnblindedTokenCollection(Resource):
 
 
 
+class _TokenImport(object):
+    """
+    Store unblinded tokens from a request body a batch at a time and write a
+    response body reporting progress, like::
+
+        {"progress": [1024, 2048, 2100], "imported": 2100}
+
+    The response is not started until the first batch is stored so errors
+    in that batch can still be reported with an error response code.
+    Afterwards an error is reported with an ``error`` property.
+
+    :ivar int imported: The number of tokens stored so far.
+    """
+    def __init__(self, store, request, unblinded_tokens, batch_size):
+        self._store = store
+        self._request = request
+        self._unblinded_tokens = unblinded_tokens
+        self._batch_size = batch_size
+        self.imported = 0
+
+    def run(self):
+        """
+        Store the tokens.
+
+        :return: A generator suitable for use with ``cooperate``.  It yields a
+            ``Deferred`` when it is waiting for the store.
+        """
+        while True:
+            batch = list(islice(self._unblinded_tokens, self._batch_size))
+            if not batch:
+                break
+            yield then(
+                self._store.import_unblinded_tokens(batch),
+                lambda ignored: None,
+            )
+            if self.imported == 0:
+                self._request.write(b'{"progress": [')
+            else:
+                self._request.write(b", ")
+            self.imported += len(batch)
+            self._request.write(dumps(self.imported))
+            _log.info(
+                "Imported {imported} unblinded tokens.",
+                imported=self.imported,
+            )
+
+    def finished(self):
+        self._finish({})
+
+    def failed(self, reason):
+        if reason.check(TaskFinished):
+            # The client went away and the task was stopped.  There is no one
+            # to tell.
+            return
+        if reason.check(ValueError):
+            code = BAD_REQUEST
+            error = u"could not parse request body"
+        elif reason.check(TypeError):
+            # The base64 decoder rejects a token this way.
+            code = BAD_REQUEST
+            error = u"could not decode unblinded token"
+        else:
+            _log.failure("Importing unblinded tokens failed.", reason)
+            code = INTERNAL_SERVER_ERROR
+            error = u"could not store unblinded tokens"
+        if self.imported == 0:
+            self._request.setResponseCode(code)
+        self._finish({u"error": error})
+
+    def _finish(self, tail):
+        if self.imported == 0:
+            self._request.write(b'{"progress": [')
+        tail[u"imported"] = self.imported
+        # Splice the remaining properties on to the object already started.
+        self._request.write(b"], " + dumps(tail)[1:])
+        self._request.unregisterProducer()
+        self._request.finish()
+
+
+class _TokenChanges(Resource):
+    """
+    This class implements incremental backup of unblinded tokens.  Users
+    **GET** this resource to find out which tokens were inserted and removed
+    since an earlier **GET**, **POST** such changes to another node to
+    apply them there, and **DELETE** to let the node forget changes which
+    have been backed up.
+    """
+    def __init__(self, store):
+        self._store = store
+        Resource.__init__(self)
+
+    def render_GET(self, request):
+        application_json(request)
+        try:
+            since = int(request.args.get(b"since", [b"0"])[0])
+        except ValueError:
+            request.setResponseCode(BAD_REQUEST)
+            return dumps({
+                u"error": u"`since` query argument must be an integer",
+            })
+        return render_maybe_deferred(
+            request,
+            then(self._store.get_token_changes(since), dumps),
+        )
+
+    def render_POST(self, request):
+        application_json(request)
+        try:
+            changes = loads(request.content.read())
+            changes = {
+                u"complete": bool(changes[u"complete"]),
+                u"inserted": list(changes[u"inserted"]),
+                u"removed": list(changes[u"removed"]),
+            }
+        except (ValueError, TypeError, KeyError):
+            request.setResponseCode(BAD_REQUEST)
+            return dumps({
+                u"error": u"could not read `complete`, `inserted`, and `removed` properties",
+            })
+        return render_maybe_deferred(
+            request,
+            then(
+                self._store.apply_token_changes(changes),
+                lambda ignored: dumps({}),
+            ),
+        )
+
+    def render_DELETE(self, request):
+        application_json(request)
+        try:
+            through = int(request.args[b"through"][0])
+        except (KeyError, ValueError):
+            request.setResponseCode(BAD_REQUEST)
+            return dumps({
+                u"error": u"integer `through` query argument required",
+            })
+        return render_maybe_deferred(
+            request,
+            then(
+                self._store.prune_token_changes(through),
+                lambda ignored: dumps({}),
+            ),
+        )
+
+
+class _TokenInventory(Resource):
+    """
+    This class implements inspection of the number of tokens in each state.
+    Unlike ``_UnblindedTokenCollection`` it does not read any tokens so it is
+    cheap enough to poll.
+    """
+    def __init__(self, store):
+        self._store = store
+        Resource.__init__(self)
+
+    def render_GET(self, request):
+        application_json(request)
+        return render_maybe_deferred(
+            request,
+            then(self._store.inventory(), dumps),
+        )
+
+
+class _UnblindedTokenBackup(Resource):
+    """
+    This class implements export of all unblinded tokens.  Users **GET** this
+    resource to retrieve a document which can be **POST**\ ed to
+    ``_UnblindedTokenCollection`` to restore the tokens.
+
+    Unlike ``VoucherStore.backup`` the tokens are read and written a page at
+    a time so the response can be arbitrarily large without holding all of
+    it in memory or blocking the reactor.
+
+    With the **format** query argument set to ``binary`` the response is
+    instead a backup in the format implemented by ``_zkapauthorizer.backup``.
+    This is written to a temporary file first, a page of tokens at a time,
+    because the header cannot be completed until all of the tokens are
+    written.
+
+    :ivar cooperate: A callable like ``twisted.internet.task.cooperate`` to
+        use to run the task which writes the response.
+
+    :ivar int page_size: The greatest number of tokens to read from the
+        database and write to the response at once.
+    """
+    def __init__(self, store, cooperate, page_size=1024):
+        self._store = store
+        self._cooperate = cooperate
+        self._page_size = page_size
+        Resource.__init__(self)
+
+    def render_GET(self, request):
+        if request.args.get(b"format", [b"json"])[0] == b"binary":
+            return self._render_binary(request)
+        application_json(request)
+        task = self._cooperate(self._write_tokens(request))
+        producer = _TaskProducer(task)
+        request.registerProducer(producer, True)
+        request.notifyFinish().addErrback(lambda ignored: producer.stopProducing())
+        task.whenDone().addCallbacks(
+            lambda ignored: self._finished(request),
+            partial(self._failed, request),
+        )
+        return NOT_DONE_YET
+
+    def _render_binary(self, request):
+        compress = request.args.get(b"compress", [b"false"])[0] == b"true"
+        request.responseHeaders.setRawHeaders(
+            u"content-type",
+            [u"application/octet-stream"],
+        )
+        backup = TemporaryFile()
+        task = self._cooperate(self._export_tokens(backup, compress))
+        producer = _TaskProducer(task)
+        disconnected = []
+
+        def stop(reason):
+            disconnected.append(reason)
+            producer.stopProducing()
+        request.notifyFinish().addErrback(stop)
+
+        exporting = task.whenDone()
+        exporting.addCallback(
+            lambda ignored: self._send_file(request, backup, disconnected),
+        )
+        exporting.addErrback(self._export_failed, request, disconnected)
+        exporting.addBoth(lambda ignored: backup.close())
+        return NOT_DONE_YET
+
+    def _export_tokens(self, f, compress):
+        """
+        Write a binary backup to a file a page of tokens at a time.
+
+        :return: A generator suitable for use with ``cooperate``.  It yields a
+            ``Deferred`` when it is waiting for the store.
+        """
+        public_keys = []
+        yield then(self._store.get_public_keys(), public_keys.extend)
+        writer = BackupWriter(f, public_keys, compress)
+        for waiting in self._read_pages(
+            self._store.get_raw_unblinded_token_page,
+            writer.write,
+        ):
+            yield waiting
+        writer.finish()
+
+    def _send_file(self, request, f, disconnected):
+        if disconnected:
+            return
+        request.setHeader(b"content-length", b"{}".format(f.tell()))
+        f.seek(0)
+        task = self._cooperate(
+            request.write(chunk)
+            for chunk
+            in iter(lambda: f.read(2 ** 16), b"")
+        )
+        producer = _TaskProducer(task)
+        request.registerProducer(producer, True)
+        request.notifyFinish().addErrback(lambda ignored: producer.stopProducing())
+        sending = task.whenDone()
+        sending.addCallback(lambda ignored: self._finished(request))
+        return sending
+
+    def _export_failed(self, reason, request, disconnected):
+        if disconnected:
+            # The client went away.  There is no one to tell.
+            return
+        _log.failure("Writing binary backup failed.", reason)
+        if request.startedWriting:
+            request.loseConnection()
+        else:
+            request.setResponseCode(INTERNAL_SERVER_ERROR)
+            request.finish()
+
+    def _write_tokens(self, request):
+        """
+        Write the response body a page of tokens at a time.
+
+        :return: A generator suitable for use with ``cooperate``.  It yields a
+            ``Deferred`` when it is waiting for the store.
+        """
+        request.write(b'{"unblinded-tokens": [')
+        separator = [b""]
+
+        def write_page(tokens):
+            request.write(separator[0] + b", ".join(
+                dumps(token)
+                for token
+                in tokens
+            ))
+            separator[0] = b", "
+
+        for waiting in self._read_pages(
+            self._store.get_unblinded_token_page,
+            write_page,
+        ):
+            yield waiting
+        request.write(b"]}")
+
+    def _read_pages(self, get_page, write_page):
+        """
+        Read all of the tokens a page at a time.
+
+        :param get_page: ``get_unblinded_token_page`` or a function like it
+            to read a page.
+
+        :param write_page: A function to call with the tokens of each
+            non-empty page.
+
+        :return: A generator which yields a ``Deferred`` when it is waiting
+            for the store.
+        """
+        after = None
+        while True:
+            page = []
+            yield then(get_page(after, self._page_size), page.extend)
+            if page:
+                after = page[-1][0]
+                write_page(list(token for (key, token) in page))
+            if len(page) < self._page_size:
+                break
+
+    def _finished(self, request):
+        request.unregisterProducer()
+        request.finish()
+
+    def _failed(self, request, reason):
+        if reason.check(TaskFinished):
+            # The client went away and the task was stopped.  There is no one
+            # to tell.
+            return
+        _log.failure("Writing backup failed.", reason)
+        # The response code is long gone.  Leave the body incomplete so the
+        # client cannot mistake it for a whole backup.
+        request.unregisterProducer()
+        request.loseConnection()
+
+
+class _Snapshot(Resource):
+    """
+    This class implements copying the database while the node is running.
+    Users **POST** to this resource to write a copy of the database next to
+    it, named ``SNAPSHOT_DB_NAME``.  The response reports progress as the
+    copy is made, like::
+
+        {"progress": [1024, 2048, 2100], "rows": 2100, "path": "..."}
+
+    :ivar cooperate: A callable like ``twisted.internet.task.cooperate`` to
+        use to run the task which makes the copy.
+    """
+    def __init__(self, store, cooperate):
+        self._store = store
+        self._cooperate = cooperate
+        Resource.__init__(self)
+
+    def render_POST(self, request):
+        application_json(request)
+        target = self._store.database_path.sibling(SNAPSHOT_DB_NAME)
+        starting = maybeDeferred(self._store.snapshot, target)
+        starting.addCallbacks(
+            lambda steps: self._copy(request, steps, target),
+            partial(self._start_failed, request),
+        )
+        return NOT_DONE_YET
+
+    def _copy(self, request, steps, target):
+        task = self._cooperate(self._write_progress(request, steps, target))
+        producer = _TaskProducer(task)
+        request.registerProducer(producer, True)
+        request.notifyFinish().addErrback(lambda ignored: producer.stopProducing())
+        task.whenDone().addCallbacks(
+            lambda ignored: self._finished(request),
+            partial(self._failed, request),
+        )
+
+    def _write_progress(self, request, steps, target):
+        """
+        Make the copy, writing the number of rows copied after each step.
+
+        :return: A generator suitable for use with ``cooperate``.
+        """
+        request.write(b'{"progress": [')
+        separator = b""
+        total = 0
+        for step in steps:
+            progress = []
+            yield then(step, progress.append)
+            [progress] = progress
+            if progress is None:
+                # The steps of an ``AsyncVoucherStore`` snapshot end this way.
+                break
+            (copied, total) = progress
+            request.write(separator + dumps(copied))
+            separator = b", "
+        _log.info(
+            "Wrote snapshot of {rows} rows to {path}.",
+            rows=total,
+            path=target.path,
+        )
+        # Splice the remaining properties on to the object already started.
+        request.write(b"], " + dumps({
+            u"rows": total,
+            u"path": target.path,
+        })[1:])
+
+    def _start_failed(self, request, reason):
+        _log.failure("Starting snapshot failed.", reason)
+        request.setResponseCode(INTERNAL_SERVER_ERROR)
+        request.write(dumps({u"error": u"could not start snapshot"}))
+        request.finish()
+
+    def _finished(self, request):
+        request.unregisterProducer()
+        request.finish()
+
+    def _failed(self, request, reason):
+        if reason.check(TaskFinished):
+            # The client went away and the task was stopped.  There is no one
+            # to tell.
+            return
+        _log.failure("Writing snapshot failed.", reason)
+        # The response code is long gone.  Leave the body incomplete so the
+        # client cannot mistake the copy for a complete one.
+        request.unregisterProducer()
+        request.loseConnection()
+
+
+@implementer(IPushProducer)
+class _TaskProducer(object):
+    """
+    Control a cooperative task according to the demands of a consumer.
+
+    :ivar _task: The ``CooperativeTask`` to control.
+    """
+    def __init__(self, task):
+        self._task = task
+
+    def pauseProducing(self):
+        try:
+            self._task.pause()
+        except TaskFinished:
+            pass
+
+    def resumeProducing(self):
+        try:
+            self._task.resume()
+        except SchedulerError:
+            # It is finished or it was not paused.
+            pass
+
+    def stopProducing(self):
+        try:
+            self._task.stop()
+        except TaskFinished:
+            pass
+
+
+class _LeaseMaintenanceHistory(Resource):
+    """
+    This class implements inspection of the history of lease maintenance.
+    Users **GET** this resource to find out about the lease maintenance runs
+    which finished in a range of time, like::
+
+        {"history": [
+            {"started": "2020-01-01T00:00:00", "finished": "2020-01-01T00:05:00",
+             "duration": 300.0, "count": 96, "checked": 12, "renewed": 3},
+            ...
+        ]}
+    """
+    def __init__(self, store):
+        self._store = store
+        Resource.__init__(self)
+
+    def render_GET(self, request):
+        application_json(request)
+        try:
+            since = request.args.get(b"since", [None])[0]
+            if since is not None:
+                since = parse_datetime(since.decode("utf-8"))
+            until = request.args.get(b"until", [None])[0]
+            if until is not None:
+                until = parse_datetime(until.decode("utf-8"))
+            limit = request.args.get(b"limit", [None])[0]
+            if limit is not None:
+                limit = int(limit)
+                if limit < 0:
+                    raise ValueError("limit must not be negative")
+                limit = min(maxint, limit)
+        except ValueError:
+            return bad_request(u"invalid query arguments").render(request)
+
+        return render_maybe_deferred(
+            request,
+            then(
+                self._store.get_lease_maintenance_history(since, until, limit),
+                lambda history: dumps({
+                    u"history": list(
+                        self._marshal_activity(activity)
+                        for activity
+                        in history
+                    ),
+                }),
+            ),
+        )
+
+    def _marshal_activity(self, activity):
+        return {
+            u"started": activity.started.isoformat(),
+            u"finished": activity.finished.isoformat(),
+            u"duration": activity.duration.total_seconds(),
+            u"count": activity.passes_required,
+            u"checked": activity.checked,
+            u"renewed": activity.renewed,
+        }
+
+
 class _VoucherCollection(Resource):
     """
     This class implements redemption of vouchers.  Users **PUT** such numbers
@@ -433,13 +1122,87 @@ class _VoucherCollection(Resource):
 
 
     def render_GET(self, request):
+        """
+        Retrieve some vouchers, optionally selected by state, in some order, a
+        page at a time.
+        """
         application_json(request)
+        try:
+            state = request.args.get(b"state", [None])[0]
+            if state is not None:
+                state = state.decode("utf-8")
+            order = request.args.get(b"order", [b"created"])[0].decode("utf-8")
+            descending = order.startswith(u"-")
+            order = order.lstrip(u"-")
+            limit = request.args.get(b"limit", [None])[0]
+            if limit is not None:
+                limit = int(limit)
+                if limit < 0:
+                    raise ValueError("limit must not be negative")
+                limit = min(maxint, limit)
+            after = request.args.get(b"cursor", [None])[0]
+            if after is not None:
+                after = after.decode("utf-8")
+        except ValueError:
+            return bad_request(u"invalid query arguments").render(request)
+
+        return render_maybe_deferred(
+            request,
+            then(
+                self._store.vouchers_version(),
+                self._render_version,
+                request,
+                state,
+                order,
+                descending,
+                after,
+                limit,
+            ),
+        )
+
+    def _render_version(self, version, request, state, order, descending, after, limit):
+        # The response depends on the transient state held by the controller
+        # as well as on the vouchers in the store.
+        etag = u'"{}-{}"'.format(
+            version,
+            self._controller.transient_state_tag()[:16],
+        ).encode("ascii")
+        if request.setETag(etag) == CACHED:
+            return b""
+        listing = maybeDeferred(
+            self._store.list_page,
+            state,
+            order,
+            descending,
+            after,
+            limit,
+        )
+        listing.addCallbacks(
+            self._render_vouchers,
+            partial(self._invalid_listing, request),
+            callbackArgs=(limit,),
+        )
+        return listing
+
+    def _invalid_listing(self, request, reason):
+        reason.trap(ValueError, KeyError)
+        request.setResponseCode(BAD_REQUEST)
+        return dumps({
+            u"error": u"unrecognized `state`, `order`, or `cursor` query argument",
+        })
+
+    def _render_vouchers(self, vouchers, limit):
+        if vouchers and len(vouchers) == limit:
+            next_cursor = vouchers[-1].number
+        else:
+            next_cursor = None
         return dumps({
             u"vouchers": list(
                 self._controller.incorporate_transient_state(voucher).marshal()
                 for voucher
-                in self._store.list()
+                in vouchers
             ),
+            u"next-cursor": next_cursor,
         })
 
 
@@ -451,7 +1214,9 @@ class _VoucherCollection(Resource):
             voucher = self._store.get(voucher)
         except KeyError:
             return NoResource()
-        return VoucherView(self._controller.incorporate_transient_state(voucher))
+        return VoucherView(
+            then(voucher, self._controller.incorporate_transient_state),
+        )
 
 
 def is_syntactic_voucher(voucher):
@@ -482,8 +1247,9 @@ class VoucherView(Resource):
     """
     def __init__(self, voucher):
         """
-        :param Voucher reference: The model object for which to provide a
-            view.
+        :param voucher: The model object for which to provide a view.  This
+            may also be a ``Deferred`` which fires with the model object or
+            fails with ``KeyError`` if there is no such voucher.
         """
         self._voucher = voucher
         Resource.__init__(self)
@@ -491,7 +1257,43 @@ class VoucherView(Resource):
 
     def render_GET(self, request):
         application_json(request)
-        return self._voucher.to_json()
+        body = then(self._voucher, lambda voucher: voucher.to_json())
+        if isinstance(body, Deferred):
+            body.addErrback(self._not_found, request)
+        return render_maybe_deferred(request, body)
+
+
+    def _not_found(self, reason, request):
+        reason.trap(KeyError)
+        return NoResource().render(request)
+
+
+def render_maybe_deferred(request, body):
+    """
+    Render a response body which may not be available yet.
+
+    :param request: The request to respond to.
+
+    :param body: The bytes of the response body or a ``Deferred`` which fires
+        with them.
+
+    :return: ``body`` if it is available now or ``NOT_DONE_YET`` if the
+        response will be written when it is.
+    """
+    if not isinstance(body, Deferred):
+        return body
+
+    def write(body):
+        request.write(body)
+        request.finish()
+
+    def failed(reason):
+        _log.failure("Rendering response failed.", reason)
+        request.setResponseCode(INTERNAL_SERVER_ERROR)
+        request.finish()
+
+    body.addCallbacks(write, failed)
+    return NOT_DONE_YET
 
 
 def bad_request(reason=u"Bad Request"):
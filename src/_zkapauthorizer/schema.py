@@ -20,6 +20,63 @@ from __future__ import (
 This module defines the database schema used by the model interface.
 """
 
+from aniso8601 import (
+    parse_datetime,
+)
+
+from ._base64 import (
+    b64_to_blob,
+)
+from ._epoch import (
+    datetime_to_epoch,
+    local_datetime_to_epoch,
+)
+from .eliot import (
+    SCHEMA_UPGRADED,
+    SCHEMA_UPGRADE_PROGRESS,
+)
+
+def initialize_schema(cursor):
+    """
+    Bring the schema of a database up to date.
+
+    A new database is given the latest schema directly.  An older database
+    is upgraded one version at a time.  A database which is already up to
+    date is recognized from its ``user_version`` alone.
+
+    :param cursor: A DB-API cursor to use to run the SQL.
+    """
+    cursor.execute("PRAGMA user_version")
+    [(user_version,)] = cursor.fetchall()
+    if user_version >= SCHEMA_VERSION:
+        return
+
+    cursor.execute("SELECT COUNT(*) FROM [sqlite_master]")
+    [(objects,)] = cursor.fetchall()
+    if objects == 0:
+        create_latest_schema(cursor)
+    else:
+        run_schema_upgrades(get_schema_upgrades(get_schema_version(cursor)), cursor)
+    cursor.execute("PRAGMA user_version = {:d}".format(SCHEMA_VERSION))
+
+
+def create_latest_schema(cursor):
+    """
+    Create the latest version of the schema in an empty database without
+    going through any of the earlier versions.
+
+    :param cursor: A DB-API cursor to use to run the SQL.
+    """
+    for statement in _LATEST_SCHEMA:
+        cursor.execute(statement)
+    cursor.execute(
+        """
+        INSERT INTO [version] ([version]) VALUES (?)
+        """,
+        (SCHEMA_VERSION,),
+    )
+
+
 def get_schema_version(cursor):
     cursor.execute(
         """
@@ -37,8 +94,9 @@ def get_schema_version(cursor):
 
 def get_schema_upgrades(from_version):
     """
-    Generate unicode strings containing SQL expressions to alter a schema from
-    ``from_version`` to the latest version.
+    Generate unicode strings containing SQL expressions (or functions which
+    operate on a cursor, for upgrades which cannot be expressed in SQL alone)
+    to alter a schema from ``from_version`` to the latest version.
 
     :param int from_version: The version of the schema which may require
         upgrade.
@@ -46,7 +104,7 @@ def get_schema_upgrades(from_version):
     while from_version in _UPGRADES:
         for upgrade in _UPGRADES[from_version]:
             yield upgrade
-        yield _INCREMENT_VERSION
+        yield _increment_version
         from_version += 1
 
 
@@ -54,24 +112,146 @@ def run_schema_upgrades(upgrades, cursor):
     """
     Apply the given upgrades using the given cursor.
 
-    :param list[unicode] upgrades: The SQL statements to apply for the
-        upgrade.
+    :param list[unicode|(cursor -> None)] upgrades: The SQL statements to
+        apply for the upgrade or functions to call with the cursor to apply
+        the upgrade.
 
     :param cursor: A DB-API cursor to use to run the SQL.
     """
     for upgrade in upgrades:
-        cursor.execute(upgrade)
+        if callable(upgrade):
+            upgrade(cursor)
+        else:
+            cursor.execute(upgrade)
 
 
-_INCREMENT_VERSION = (
+def _copy_rows(table, select, insert, convert, batch_size=1024):
     """
-    UPDATE [version]
-    SET [version] = [version] + 1
+    Create a schema upgrade function which copies rows from one table to
+    another, converting them along the way.
+
+    :param unicode table: The name of the table ``select`` reads from.  Its
+        largest rowid is used as an estimate of the number of rows to copy
+        for progress reporting so that the table is not scanned an extra
+        time just to count it.
+
+    :param unicode select: A query for the rows to copy.
+
+    :param unicode insert: A statement to insert one converted row.
+
+    :param convert: A function which takes one row from ``select`` and
+        returns the parameters for ``insert``.
+
+    :param int batch_size: The number of rows to convert at a time.
     """
-)
+    def copy_rows(cursor):
+        # Use a separate cursor to read so inserts can proceed on the given
+        # one without disturbing the query.
+        reader = cursor.connection.cursor()
+        reader.execute("SELECT MAX([rowid]) FROM [{}]".format(table))
+        [(total,)] = reader.fetchall()
+        # An empty table has no largest rowid.
+        total = total or 0
+        reader.execute(select)
+        copied = 0
+        while True:
+            rows = reader.fetchmany(batch_size)
+            if not rows:
+                break
+            cursor.executemany(insert, list(convert(row) for row in rows))
+            copied += len(rows)
+            # Copying a large table can take a long time.  Say how far it
+            # has got so it is clear the upgrade is making progress.
+            SCHEMA_UPGRADE_PROGRESS.log(rows=copied, total=total)
+    return copy_rows
+
+
+def _text_to_epoch(text):
+    """
+    Convert a date+time string written by an earlier version of the schema to
+    a number of microseconds since the epoch, suitable for storage in an
+    integer column.  Earlier versions wrote local times with no timezone.
+    """
+    if text is None:
+        return None
+    when = parse_datetime(text.encode("ascii"), delimiter=b" ")
+    if when.utcoffset() is None:
+        return local_datetime_to_epoch(when)
+    return datetime_to_epoch(when)
+
+
+def _increment_version(cursor):
+    """
+    Record that the schema has been upgraded to its next version.
+    """
+    cursor.execute(
+        """
+        UPDATE [version]
+        SET [version] = [version] + 1
+        """,
+    )
+    cursor.execute("SELECT [version] FROM [version]")
+    [(version,)] = cursor.fetchall()
+    SCHEMA_UPGRADED.log(version=version)
+
+# The index on [vouchers] which supports finding the vouchers in one state
+# (for example, those which still need to be redeemed) in the order they were
+# added.  It is added by version 11.
+_VOUCHERS_STATE_INDEX = """
+    CREATE INDEX [vouchers-state-created] ON [vouchers] ([state], [created], [number])
+    """
+
+# The rest of the indexes on [vouchers] which support reading them a page at
+# a time.  They are added by version 12.
+_VOUCHERS_ORDER_INDEXES = [
+    """
+    CREATE INDEX [vouchers-created] ON [vouchers] ([created], [number])
+    """,
+    """
+    CREATE INDEX [vouchers-finished] ON [vouchers] ([finished], [number])
+    """,
+    """
+    CREATE INDEX [vouchers-state-finished] ON [vouchers] ([state], [finished], [number])
+    """,
+]
+
+# All of the indexes on [vouchers].  Version 13 replaces the table and adds
+# them again.  ``_LATEST_SCHEMA`` creates them too.
+_VOUCHERS_INDEXES = [_VOUCHERS_STATE_INDEX] + _VOUCHERS_ORDER_INDEXES
+
+# The triggers which count changes to [vouchers] in [vouchers-version].
+# They are created by version 12, again by version 13, and by
+# ``_LATEST_SCHEMA``.
+_VOUCHERS_VERSION_TRIGGERS = [
+    """
+    CREATE TRIGGER [vouchers-inserted-version]
+    AFTER INSERT ON [vouchers]
+    BEGIN
+        UPDATE [vouchers-version] SET [version] = [version] + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER [vouchers-updated-version]
+    AFTER UPDATE ON [vouchers]
+    BEGIN
+        UPDATE [vouchers-version] SET [version] = [version] + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER [vouchers-deleted-version]
+    AFTER DELETE ON [vouchers]
+    BEGIN
+        UPDATE [vouchers-version] SET [version] = [version] + 1;
+    END
+    """,
+]
 
 # A mapping from old schema versions to lists of unicode strings of SQL to
 # execute against that version of the schema to create the successor schema.
+#
+# Every upgrade added here must also be reflected in ``_LATEST_SCHEMA``, which
+# is used to create new databases directly at ``SCHEMA_VERSION``.
+# ``InitializeTests.test_latest_schema`` checks that the two agree.
 _UPGRADES = {
     0: [
         """
@@ -167,4 +347,563 @@ _UPGRADES = {
         )
         """,
     ],
+
+    5: [
+        """
+        -- Replace the unblinded token table with one which gives each token a
+        -- stable integer identifier and records whether it is currently
+        -- reserved for use.  This lets a reservation find free tokens with an
+        -- index lookup instead of skipping over every token already in use.
+        CREATE TABLE [unblinded-tokens-v2] (
+            [id] integer,           -- A stable identifier, increasing in insertion order.
+            [token] text NOT NULL,  -- The base64 encoded unblinded token.
+            [state] text NOT NULL DEFAULT "free", -- free, in-use
+
+            PRIMARY KEY([id])
+            UNIQUE([token])
+        )
+        """,
+        """
+        INSERT INTO [unblinded-tokens-v2] ([token])
+        SELECT [token] FROM [unblinded-tokens] ORDER BY [rowid]
+        """,
+        """
+        DROP TABLE [unblinded-tokens]
+        """,
+        """
+        ALTER TABLE [unblinded-tokens-v2] RENAME TO [unblinded-tokens]
+        """,
+        """
+        CREATE INDEX [unblinded-tokens-state] ON [unblinded-tokens] ([state], [id])
+        """,
+    ],
+
+    6: [
+        # Store tokens as their raw bytes instead of as base64 text.  This
+        # saves a quarter of the space they take up and makes comparisons
+        # against them cheaper.  SQLite3 has no base64 decoder so the
+        # conversion of existing rows is done in Python.
+        """
+        CREATE TABLE [tokens-v2] (
+            [text] blob NOT NULL, -- The raw bytes of the random token.
+            [voucher] text, -- Reference to the voucher these tokens go with.
+            [counter] integer NOT NULL DEFAULT 0, -- Reference to the counter these tokens go with.
+
+            PRIMARY KEY([text])
+            FOREIGN KEY([voucher]) REFERENCES [vouchers]([number])
+        )
+        """,
+        _copy_rows(
+            u"tokens",
+            """
+            SELECT [text], [voucher], [counter] FROM [tokens] ORDER BY [rowid]
+            """,
+            """
+            INSERT INTO [tokens-v2] ([text], [voucher], [counter]) VALUES (?, ?, ?)
+            """,
+            lambda (text, voucher, counter): (b64_to_blob(text), voucher, counter),
+        ),
+        """
+        DROP TABLE [tokens]
+        """,
+        """
+        ALTER TABLE [tokens-v2] RENAME TO [tokens]
+        """,
+
+        """
+        CREATE TABLE [unblinded-tokens-v3] (
+            [id] integer,           -- A stable identifier, increasing in insertion order.
+            [token] blob NOT NULL,  -- The raw bytes of the unblinded token.
+            [state] text NOT NULL DEFAULT "free", -- free, in-use
+
+            PRIMARY KEY([id])
+            UNIQUE([token])
+        )
+        """,
+        _copy_rows(
+            u"unblinded-tokens",
+            """
+            SELECT [id], [token], [state] FROM [unblinded-tokens]
+            """,
+            """
+            INSERT INTO [unblinded-tokens-v3] ([id], [token], [state]) VALUES (?, ?, ?)
+            """,
+            lambda (ident, token, state): (ident, b64_to_blob(token), state),
+        ),
+        """
+        DROP TABLE [unblinded-tokens]
+        """,
+        """
+        ALTER TABLE [unblinded-tokens-v3] RENAME TO [unblinded-tokens]
+        """,
+        """
+        CREATE INDEX [unblinded-tokens-state] ON [unblinded-tokens] ([state], [id])
+        """,
+
+        """
+        CREATE TABLE [invalid-unblinded-tokens-v2] (
+            [token] blob,  -- The raw bytes of the unblinded token.
+            [reason] text, -- The reason given for it being considered invalid.
+
+            PRIMARY KEY([token])
+        )
+        """,
+        _copy_rows(
+            u"invalid-unblinded-tokens",
+            """
+            SELECT [token], [reason] FROM [invalid-unblinded-tokens]
+            """,
+            """
+            INSERT INTO [invalid-unblinded-tokens-v2] ([token], [reason]) VALUES (?, ?)
+            """,
+            lambda (token, reason): (b64_to_blob(token), reason),
+        ),
+        """
+        DROP TABLE [invalid-unblinded-tokens]
+        """,
+        """
+        ALTER TABLE [invalid-unblinded-tokens-v2] RENAME TO [invalid-unblinded-tokens]
+        """,
+    ],
+
+    7: [
+        """
+        -- Support finding the random tokens for a particular redemption group
+        -- without scanning the random tokens of every other voucher.
+        CREATE INDEX [tokens-voucher-counter] ON [tokens] ([voucher], [counter])
+        """,
+    ],
+
+    8: [
+        """
+        -- Random tokens for redemption groups which have completed are never
+        -- used again.  They are now deleted as each group completes.  Clean
+        -- up any left over from before that was the case.
+        DELETE FROM [tokens]
+        WHERE [counter] < (
+            SELECT [counter] FROM [vouchers] WHERE [vouchers].[number] = [tokens].[voucher]
+        )
+        """,
+    ],
+
+    9: [
+        """
+        -- Keep a count of the tokens in each state so the counts can be read
+        -- without reading every token.
+        CREATE TABLE [token-inventory] (
+            [state] text,                   -- free, in-use, reserved, invalid, spent
+            [count] integer NOT NULL DEFAULT 0,
+
+            PRIMARY KEY([state])
+        )
+        """,
+        """
+        INSERT INTO [token-inventory] ([state], [count])
+        SELECT "free", COUNT(*) FROM [unblinded-tokens] WHERE [state] = "free"
+        UNION ALL
+        SELECT "in-use", COUNT(*) FROM [unblinded-tokens] WHERE [state] = "in-use"
+        UNION ALL
+        SELECT "reserved", COUNT(*) FROM [unblinded-tokens] WHERE [state] = "reserved"
+        UNION ALL
+        SELECT "invalid", COUNT(*) FROM [invalid-unblinded-tokens]
+        UNION ALL
+        -- Spent tokens were deleted without a trace so count from here on.
+        SELECT "spent", 0
+        """,
+        # Triggers keep the counts of tokens still in [unblinded-tokens] and
+        # of invalid tokens current.  Spent tokens are counted by the code
+        # which discards them since deleting an unblinded token does not say
+        # whether it was spent.
+        """
+        CREATE TRIGGER [unblinded-tokens-inserted]
+        AFTER INSERT ON [unblinded-tokens]
+        BEGIN
+            UPDATE [token-inventory] SET [count] = [count] + 1 WHERE [state] = NEW.[state];
+        END
+        """,
+        """
+        CREATE TRIGGER [unblinded-tokens-state-changed]
+        AFTER UPDATE OF [state] ON [unblinded-tokens]
+        WHEN OLD.[state] != NEW.[state]
+        BEGIN
+            UPDATE [token-inventory] SET [count] = [count] - 1 WHERE [state] = OLD.[state];
+            UPDATE [token-inventory] SET [count] = [count] + 1 WHERE [state] = NEW.[state];
+        END
+        """,
+        """
+        CREATE TRIGGER [unblinded-tokens-deleted]
+        AFTER DELETE ON [unblinded-tokens]
+        BEGIN
+            UPDATE [token-inventory] SET [count] = [count] - 1 WHERE [state] = OLD.[state];
+        END
+        """,
+        """
+        CREATE TRIGGER [invalid-unblinded-tokens-inserted]
+        AFTER INSERT ON [invalid-unblinded-tokens]
+        BEGIN
+            UPDATE [token-inventory] SET [count] = [count] + 1 WHERE [state] = "invalid";
+        END
+        """,
+    ],
+
+    10: [
+        """
+        -- Record the most recent change to each unblinded token so that a
+        -- backup can be brought up to date without copying every token.
+        -- Replacing a token's row gives it a new, greater sequence number.
+        CREATE TABLE [token-changes] (
+            [sequence] integer PRIMARY KEY AUTOINCREMENT,
+            [token] blob NOT NULL,      -- The raw bytes of the unblinded token.
+            [present] integer NOT NULL, -- 1 if it was inserted, 0 if it was removed.
+
+            UNIQUE([token])
+        )
+        """,
+        """
+        -- Changes at or before this sequence number may have been pruned.
+        CREATE TABLE [token-changes-horizon] AS SELECT 0 AS [sequence]
+        """,
+        """
+        INSERT INTO [token-changes] ([token], [present])
+        SELECT [token], 1 FROM [unblinded-tokens] ORDER BY [id]
+        """,
+        # The row is deleted and inserted again instead of replaced because
+        # the conflict resolution of the statement which fires the trigger
+        # (for example, INSERT OR IGNORE) would override OR REPLACE here.
+        """
+        CREATE TRIGGER [unblinded-tokens-inserted-change]
+        AFTER INSERT ON [unblinded-tokens]
+        BEGIN
+            DELETE FROM [token-changes] WHERE [token] = NEW.[token];
+            INSERT INTO [token-changes] ([token], [present]) VALUES (NEW.[token], 1);
+        END
+        """,
+        """
+        CREATE TRIGGER [unblinded-tokens-deleted-change]
+        AFTER DELETE ON [unblinded-tokens]
+        BEGIN
+            DELETE FROM [token-changes] WHERE [token] = OLD.[token];
+            INSERT INTO [token-changes] ([token], [present]) VALUES (OLD.[token], 0);
+        END
+        """,
+    ],
+
+    # Support finding the vouchers which still need to be redeemed without
+    # reading every voucher ever added.
+    11: [_VOUCHERS_STATE_INDEX],
+
+    # Support reading vouchers a page at a time in order of creation or of
+    # completion, with or without selecting a single state.  The voucher
+    # number breaks ties so every voucher has a distinct position.
+    12: _VOUCHERS_ORDER_INDEXES + [
+        """
+        -- Count changes to the vouchers so a client can cheaply find out
+        -- whether anything has changed since it last looked.
+        CREATE TABLE [vouchers-version] AS SELECT 0 AS [version]
+        """,
+    ] + _VOUCHERS_VERSION_TRIGGERS,
+
+    13: [
+        # Store times as integer numbers of microseconds since the epoch
+        # instead of as ISO8601 strings.  They are much cheaper to decode and
+        # they still sort in time order.  The column types change so the
+        # tables are replaced.  SQLite3 cannot parse all of the strings
+        # which may have been written so the conversion is done in Python.
+        # This relies on foreign key enforcement being off so the vouchers
+        # referenced by [tokens] can be dropped.
+        """
+        CREATE TABLE [vouchers-v2] (
+            [number] text,
+            [created] integer,                  -- Microseconds since the epoch.
+            [state] text DEFAULT "pending",     -- pending, double-spend, redeemed
+
+            [finished] integer DEFAULT NULL,    -- Microseconds since the epoch when
+                                                -- the current terminal state was entered.
+
+            [token-count] num DEFAULT NULL,     -- Set in the redeemed state to the number
+                                                -- of tokens received on this voucher's
+                                                -- redemption.
+
+            [public-key] text,
+            [counter] integer DEFAULT 0,
+            [expected-tokens] integer NOT NULL DEFAULT 32768,
+
+            PRIMARY KEY([number])
+        )
+        """,
+        _copy_rows(
+            u"vouchers",
+            """
+            SELECT
+                [number], [created], [state], [finished], [token-count], [public-key], [counter], [expected-tokens]
+            FROM [vouchers]
+            """,
+            """
+            INSERT INTO [vouchers-v2] (
+                [number], [created], [state], [finished], [token-count], [public-key], [counter], [expected-tokens]
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            lambda row: (
+                row[0],
+                _text_to_epoch(row[1]),
+                row[2],
+                _text_to_epoch(row[3]),
+            ) + tuple(row[4:]),
+        ),
+        """
+        DROP TABLE [vouchers]
+        """,
+        """
+        ALTER TABLE [vouchers-v2] RENAME TO [vouchers]
+        """,
+        # Dropping the table dropped its indexes and triggers as well.
+    ] + _VOUCHERS_INDEXES + _VOUCHERS_VERSION_TRIGGERS + [
+        """
+        CREATE TABLE [lease-maintenance-spending-v2] (
+            [id] integer,       -- A unique identifier for a group of activity.
+            [started] integer,  -- Microseconds since the epoch when the activity began.
+            [finished] integer, -- Microseconds since the epoch when the activity completed (or null).
+            [count] integer,    -- See version 0.
+
+            PRIMARY KEY([id])
+        )
+        """,
+        _copy_rows(
+            u"lease-maintenance-spending",
+            """
+            SELECT [id], [started], [finished], [count] FROM [lease-maintenance-spending]
+            """,
+            """
+            INSERT INTO [lease-maintenance-spending-v2] ([id], [started], [finished], [count])
+            VALUES (?, ?, ?, ?)
+            """,
+            lambda (ident, started, finished, count): (
+                ident,
+                _text_to_epoch(started),
+                _text_to_epoch(finished),
+                count,
+            ),
+        ),
+        """
+        DROP TABLE [lease-maintenance-spending]
+        """,
+        """
+        ALTER TABLE [lease-maintenance-spending-v2] RENAME TO [lease-maintenance-spending]
+        """,
+    ],
+
+    14: [
+        # Record which process is using each in-use token and until when.
+        # Several processes may share one database and none of them can tell
+        # whether the others are still running.  A reservation which is not
+        # renewed before it expires is taken to have been abandoned.
+        """
+        ALTER TABLE [unblinded-tokens] ADD COLUMN [owner] text DEFAULT NULL
+        """,
+        """
+        -- Microseconds since the epoch after which an in-use token may be
+        -- freed.
+        ALTER TABLE [unblinded-tokens] ADD COLUMN [expires] integer DEFAULT NULL
+        """,
+        """
+        -- Until now every in-use token was freed whenever the database was
+        -- opened so any which are in use now belong to a process which has
+        -- gone away.  Let them be freed at once.
+        UPDATE [unblinded-tokens] SET [expires] = 0 WHERE [state] = "in-use"
+        """,
+        """
+        -- Support finding expired reservations without reading every token.
+        CREATE INDEX [unblinded-tokens-expires] ON [unblinded-tokens] ([state], [expires])
+        """,
+    ],
+
+    15: [
+        # Keep enough about each lease maintenance run to chart it over time
+        # and support reading a range of runs without scanning them all.
+        # Runs recorded before this have no counts of storage indexes.
+        """
+        -- The number of storage indexes with shares found during the run.
+        ALTER TABLE [lease-maintenance-spending] ADD COLUMN [checked] integer DEFAULT NULL
+        """,
+        """
+        -- The number of those storage indexes with leases renewed.
+        ALTER TABLE [lease-maintenance-spending] ADD COLUMN [renewed] integer DEFAULT NULL
+        """,
+        """
+        CREATE INDEX [lease-maintenance-spending-finished] ON [lease-maintenance-spending] ([finished])
+        """,
+    ],
 }
+
+# The version of the schema which results from applying all of ``_UPGRADES``.
+SCHEMA_VERSION = len(_UPGRADES)
+
+# A list of unicode strings of SQL to execute against an empty database to
+# create the schema at ``SCHEMA_VERSION`` directly.  This must create the same
+# tables, indexes, triggers, and initial rows as all of ``_UPGRADES`` do.
+# When an upgrade is added this must be changed to match.
+_LATEST_SCHEMA = [
+    """
+    CREATE TABLE [version] ([version])
+    """,
+    """
+    CREATE TABLE [vouchers] (
+        [number] text,
+        [created] integer,                  -- Microseconds since the epoch.
+        [state] text DEFAULT "pending",     -- pending, double-spend, redeemed
+
+        [finished] integer DEFAULT NULL,    -- Microseconds since the epoch when
+                                            -- the current terminal state was entered.
+
+        [token-count] num DEFAULT NULL,     -- Set in the redeemed state to the number
+                                            -- of tokens received on this voucher's
+                                            -- redemption.
+
+        [public-key] text,
+        [counter] integer DEFAULT 0,
+        [expected-tokens] integer NOT NULL DEFAULT 32768,
+
+        PRIMARY KEY([number])
+    )
+    """,
+] + _VOUCHERS_INDEXES + [
+    """
+    CREATE TABLE [vouchers-version] ([version])
+    """,
+    """
+    INSERT INTO [vouchers-version] ([version]) VALUES (0)
+    """,
+] + _VOUCHERS_VERSION_TRIGGERS + [
+    """
+    CREATE TABLE [tokens] (
+        [text] blob NOT NULL, -- The raw bytes of the random token.
+        [voucher] text, -- Reference to the voucher these tokens go with.
+        [counter] integer NOT NULL DEFAULT 0, -- Reference to the counter these tokens go with.
+
+        PRIMARY KEY([text])
+        FOREIGN KEY([voucher]) REFERENCES [vouchers]([number])
+    )
+    """,
+    """
+    CREATE INDEX [tokens-voucher-counter] ON [tokens] ([voucher], [counter])
+    """,
+
+    """
+    CREATE TABLE [unblinded-tokens] (
+        [id] integer,           -- A stable identifier, increasing in insertion order.
+        [token] blob NOT NULL,  -- The raw bytes of the unblinded token.
+        [state] text NOT NULL DEFAULT "free", -- free, in-use, reserved
+        [owner] text DEFAULT NULL,      -- The holder of an in-use token.
+        [expires] integer DEFAULT NULL, -- Microseconds since the epoch after which
+                                        -- an in-use token may be freed.
+
+        PRIMARY KEY([id])
+        UNIQUE([token])
+    )
+    """,
+    """
+    CREATE INDEX [unblinded-tokens-state] ON [unblinded-tokens] ([state], [id])
+    """,
+    """
+    CREATE INDEX [unblinded-tokens-expires] ON [unblinded-tokens] ([state], [expires])
+    """,
+    """
+    CREATE TABLE [invalid-unblinded-tokens] (
+        [token] blob,  -- The raw bytes of the unblinded token.
+        [reason] text, -- The reason given for it being considered invalid.
+
+        PRIMARY KEY([token])
+    )
+    """,
+
+    """
+    CREATE TABLE [token-inventory] (
+        [state] text,                   -- free, in-use, reserved, invalid, spent
+        [count] integer NOT NULL DEFAULT 0,
+
+        PRIMARY KEY([state])
+    )
+    """,
+    """
+    INSERT INTO [token-inventory] ([state], [count])
+    VALUES ("free", 0), ("in-use", 0), ("reserved", 0), ("invalid", 0), ("spent", 0)
+    """,
+    """
+    CREATE TRIGGER [unblinded-tokens-inserted]
+    AFTER INSERT ON [unblinded-tokens]
+    BEGIN
+        UPDATE [token-inventory] SET [count] = [count] + 1 WHERE [state] = NEW.[state];
+    END
+    """,
+    """
+    CREATE TRIGGER [unblinded-tokens-state-changed]
+    AFTER UPDATE OF [state] ON [unblinded-tokens]
+    WHEN OLD.[state] != NEW.[state]
+    BEGIN
+        UPDATE [token-inventory] SET [count] = [count] - 1 WHERE [state] = OLD.[state];
+        UPDATE [token-inventory] SET [count] = [count] + 1 WHERE [state] = NEW.[state];
+    END
+    """,
+    """
+    CREATE TRIGGER [unblinded-tokens-deleted]
+    AFTER DELETE ON [unblinded-tokens]
+    BEGIN
+        UPDATE [token-inventory] SET [count] = [count] - 1 WHERE [state] = OLD.[state];
+    END
+    """,
+    """
+    CREATE TRIGGER [invalid-unblinded-tokens-inserted]
+    AFTER INSERT ON [invalid-unblinded-tokens]
+    BEGIN
+        UPDATE [token-inventory] SET [count] = [count] + 1 WHERE [state] = "invalid";
+    END
+    """,
+
+    """
+    CREATE TABLE [token-changes] (
+        [sequence] integer PRIMARY KEY AUTOINCREMENT,
+        [token] blob NOT NULL,      -- The raw bytes of the unblinded token.
+        [present] integer NOT NULL, -- 1 if it was inserted, 0 if it was removed.
+
+        UNIQUE([token])
+    )
+    """,
+    """
+    CREATE TABLE [token-changes-horizon] ([sequence])
+    """,
+    """
+    INSERT INTO [token-changes-horizon] ([sequence]) VALUES (0)
+    """,
+    """
+    CREATE TRIGGER [unblinded-tokens-inserted-change]
+    AFTER INSERT ON [unblinded-tokens]
+    BEGIN
+        DELETE FROM [token-changes] WHERE [token] = NEW.[token];
+        INSERT INTO [token-changes] ([token], [present]) VALUES (NEW.[token], 1);
+    END
+    """,
+    """
+    CREATE TRIGGER [unblinded-tokens-deleted-change]
+    AFTER DELETE ON [unblinded-tokens]
+    BEGIN
+        DELETE FROM [token-changes] WHERE [token] = OLD.[token];
+        INSERT INTO [token-changes] ([token], [present]) VALUES (OLD.[token], 0);
+    END
+    """,
+
+    """
+    CREATE TABLE [lease-maintenance-spending] (
+        [id] integer,       -- A unique identifier for a group of activity.
+        [started] integer,  -- Microseconds since the epoch when the activity began.
+        [finished] integer, -- Microseconds since the epoch when the activity completed (or null).
+        [count] integer,    -- The number of passes required to renew the shares encountered.
+        [checked] integer DEFAULT NULL, -- The number of storage indexes with shares found.
+        [renewed] integer DEFAULT NULL, -- The number of storage indexes with leases renewed.
+
+        PRIMARY KEY([id])
+    )
+    """,
+    """
+    CREATE INDEX [lease-maintenance-spending-finished] ON [lease-maintenance-spending] ([finished])
+    """,
+]
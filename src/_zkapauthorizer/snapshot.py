@@ -0,0 +1,205 @@
+# Copyright 2020 PrivateStorage.io, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+This module implements copying a SQLite3 database which is in use.
+
+The online backup API of SQLite3 is not exposed by the ``sqlite3`` module of
+Python 2 so the copy is made by reading every row from a separate connection
+inside one read transaction and writing it to the copy.  In WAL mode the read
+transaction sees a single consistent state of the database while other
+connections continue to commit changes.
+"""
+
+from __future__ import (
+    absolute_import,
+)
+
+from sqlite3 import (
+    connect as _connect,
+)
+
+
+def snapshot(source, target, rows_per_step=1024):
+    """
+    Copy a SQLite3 database a few rows at a time.
+
+    :param FilePath source: The database to copy.  It may be in use by other
+        connections.
+
+    :param FilePath target: The location to write the copy.  Anything already
+        there is replaced.
+
+    :param int rows_per_step: The greatest number of rows to copy between
+        opportunities for other work to run.
+
+    :return: An iterator which copies some rows each time it is advanced and
+        produces a two-tuple of the number of rows copied so far and the
+        total number of rows to copy.  In WAL mode the connections to the
+        source database may commit changes between steps without affecting
+        the copy.  In other modes the copy is made in one step because any
+        open read transaction would stop them from doing so.
+    """
+    for path in [target, target.siblingExtension(b"-journal")]:
+        if path.exists():
+            path.remove()
+
+    conn = _connect(source.asBytesMode().path, isolation_level=None)
+    try:
+        wal = conn.execute("PRAGMA journal_mode").fetchone()[0] == u"wal"
+        conn.execute("ATTACH DATABASE ? AS [snapshot]", (target.asBytesMode().path,))
+        conn.execute("BEGIN")
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT [type], [name], [sql] FROM [main].[sqlite_master]
+            WHERE [sql] IS NOT NULL AND [name] NOT LIKE "sqlite_%"
+            ORDER BY [rowid]
+            """,
+        )
+        schema = cursor.fetchall()
+        tables = list(name for (kind, name, sql) in schema if kind == u"table")
+
+        total = 0
+        for name in tables:
+            cursor.execute("SELECT COUNT(*) FROM [main].[{}]".format(name))
+            total += cursor.fetchone()[0]
+
+        # Settings which are stored in the database file itself must be
+        # copied as well.  ``auto_vacuum`` only takes effect if it is set
+        # before any tables are created.
+        pragmas = list(
+            "PRAGMA {} = {:d}".format(
+                pragma,
+                cursor.execute("PRAGMA [main].{}".format(pragma)).fetchone()[0],
+            )
+            for pragma
+            in [u"auto_vacuum", u"user_version"]
+        )
+
+        # Create the tables in the copy with their original definitions.
+        # The copy is attached to this connection under another name so use
+        # another connection which can see it as its main database.
+        _execute_in(target, pragmas + list(
+            sql
+            for (kind, name, sql)
+            in schema
+            if kind == u"table"
+        ))
+
+        copied = 0
+        for name in tables:
+            for count in _copy_table(cursor, name, rows_per_step):
+                copied += count
+                if wal:
+                    yield (copied, total)
+
+        if _has_sequence(cursor):
+            # Copying rows into tables with AUTOINCREMENT keys has already
+            # made some entries here but they may be behind the originals.
+            cursor.execute("DELETE FROM [snapshot].[sqlite_sequence]")
+            cursor.execute(
+                """
+                INSERT INTO [snapshot].[sqlite_sequence]
+                SELECT * FROM [main].[sqlite_sequence]
+                """,
+            )
+        conn.execute("COMMIT")
+        conn.execute("DETACH DATABASE [snapshot]")
+    finally:
+        conn.close()
+
+    # Indexes and triggers are created after the rows are copied so the
+    # triggers do not act on the copied rows.
+    _execute_in(target, list(
+        sql
+        for (kind, name, sql)
+        in schema
+        if kind != u"table"
+    ))
+    if not wal:
+        yield (total, total)
+
+
+def _copy_table(cursor, name, rows_per_step):
+    """
+    Copy the rows of one table from the main database to the snapshot.
+
+    :return: An iterator which copies some rows each time it is advanced and
+        produces the number of rows copied.
+    """
+    cursor.execute("PRAGMA [main].table_info([{}])".format(name))
+    info = cursor.fetchall()
+    columns = list(column for (cid, column, kind, notnull, default, pk) in info)
+    keys = list(
+        (column, kind)
+        for (cid, column, kind, notnull, default, pk)
+        in info
+        if pk
+    )
+    if len(keys) == 1 and keys[0][1].lower() == u"integer":
+        # This column is the rowid so copying it keeps the rowid.
+        key = keys[0][0]
+    else:
+        key = u"rowid"
+        columns.insert(0, key)
+
+    quoted = ", ".join("[{}]".format(column) for column in columns)
+    select = "SELECT {} FROM [main].[{}] WHERE [{}] > ? ORDER BY [{}] LIMIT ?".format(
+        quoted,
+        name,
+        key,
+        key,
+    )
+    insert = "INSERT INTO [snapshot].[{}] ({}) VALUES ({})".format(
+        name,
+        quoted,
+        ", ".join("?" for column in columns),
+    )
+    position = columns.index(key)
+    after = -2 ** 63
+    while True:
+        cursor.execute(select, (after, rows_per_step))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        cursor.executemany(insert, rows)
+        after = rows[-1][position]
+        yield len(rows)
+
+
+def _has_sequence(cursor):
+    cursor.execute(
+        """
+        SELECT COUNT(*) FROM [main].[sqlite_master] WHERE [name] = "sqlite_sequence"
+        """,
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def _execute_in(path, statements):
+    """
+    Run some SQL statements in one transaction against a database.
+
+    :param FilePath path: The database.
+
+    :param list[unicode] statements: The statements to run.
+    """
+    conn = _connect(path.asBytesMode().path)
+    try:
+        with conn:
+            for sql in statements:
+                conn.execute(sql)
+    finally:
+        conn.close()
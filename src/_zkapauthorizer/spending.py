@@ -24,11 +24,34 @@ from zope.interface import (
 
 import attr
 
+from twisted.logger import (
+    Logger,
+)
+from twisted.python.failure import (
+    Failure,
+)
+from twisted.internet.defer import (
+    Deferred,
+    succeed,
+    maybeDeferred,
+    gatherResults,
+)
+
+from ._deferred import (
+    then,
+)
+from .model import (
+    NotEnoughTokens,
+)
+from .validators import (
+    greater_than,
+)
 from .eliot import (
     GET_PASSES,
     SPENT_PASSES,
     INVALID_PASSES,
     RESET_PASSES,
+    COMMITTED_PASS_STATES,
 )
 
 class IPassGroup(Interface):
@@ -56,7 +79,7 @@ class IPassGroup(Interface):
         :param int by_amount: The number of additional passes the resulting
             group should contain.
 
-        :return IPassGroup: The new group.
+        :return IPassGroup|Deferred[IPassGroup]: The new group.
         """
 
     def mark_spent():
@@ -64,7 +87,8 @@ class IPassGroup(Interface):
         The passes have been spent successfully.  Ensure none of them appear in
         any ``IPassGroup`` provider created in the future.
 
-        :return: ``None``
+        :return: ``None`` or a ``Deferred`` that fires with ``None`` when the
+            change has been recorded.
         """
 
     def mark_invalid(reason):
@@ -75,7 +99,8 @@ class IPassGroup(Interface):
         :param unicode reason: A short description of the reason the passes
             could not be spent.
 
-        :return: ``None``
+        :return: ``None`` or a ``Deferred`` that fires with ``None`` when the
+            change has been recorded.
         """
 
     def reset():
@@ -83,7 +108,8 @@ class IPassGroup(Interface):
         The passes have not been spent.  Return them to for use in a future
         ``IPassGroup`` provider.
 
-        :return: ``None``
+        :return: ``None`` or a ``Deferred`` that fires with ``None`` when the
+            change has been recorded.
         """
 
 
@@ -97,8 +123,9 @@ class IPassFactory(Interface):
 
         :param int num_passes: The number of passes to request.
 
-        :return IPassGroup: A group of passes bound to the given message and
-            of the requested size.
+        :return IPassGroup|Deferred[IPassGroup]: A group of passes bound to
+            the given message and of the requested size.  A ``Deferred`` is
+            returned if the underlying store works asynchronously.
         """
 
 
@@ -149,19 +176,22 @@ class PassGroup(object):
         )
 
     def expand(self, by_amount):
-        return attr.evolve(
-            self,
-            tokens=self._tokens + self._factory.get(self._message, by_amount)._tokens,
+        return then(
+            self._factory.get(self._message, by_amount),
+            lambda more: attr.evolve(
+                self,
+                tokens=self._tokens + more._tokens,
+            ),
         )
 
     def mark_spent(self):
-        self._factory._mark_spent(self.unblinded_tokens)
+        return self._factory._mark_spent(self.unblinded_tokens)
 
     def mark_invalid(self, reason):
-        self._factory._mark_invalid(reason, self.unblinded_tokens)
+        return self._factory._mark_invalid(reason, self.unblinded_tokens)
 
     def reset(self):
-        self._factory._reset(self.unblinded_tokens)
+        return self._factory._reset(self.unblinded_tokens)
 
 
 @implementer(IPassFactory)
@@ -170,6 +200,10 @@ class SpendingController(object):
     """
     A ``SpendingController`` gives out ZKAPs and arranges for re-spend
     attempts when necessary.
+
+    The token-managing functions may either return their results directly or
+    return ``Deferred`` instances which fire with them (as is the case for
+    ``AsyncVoucherStore``).
     """
     get_unblinded_tokens = attr.ib()
     discard_unblinded_tokens = attr.ib()
@@ -189,7 +223,14 @@ class SpendingController(object):
         )
 
     def get(self, message, num_passes):
-        unblinded_tokens = self.get_unblinded_tokens(num_passes)
+        return then(
+            self.get_unblinded_tokens(num_passes),
+            self._make_group,
+            message,
+            num_passes,
+        )
+
+    def _make_group(self, unblinded_tokens, message, num_passes):
         passes = self.tokens_to_passes(message, unblinded_tokens)
         GET_PASSES.log(
             message=message,
@@ -201,17 +242,645 @@ class SpendingController(object):
         SPENT_PASSES.log(
             count=len(unblinded_tokens),
         )
-        self.discard_unblinded_tokens(unblinded_tokens)
+        return self.discard_unblinded_tokens(unblinded_tokens)
 
     def _mark_invalid(self, reason, unblinded_tokens):
         INVALID_PASSES.log(
             reason=reason,
             count=len(unblinded_tokens),
         )
-        self.invalidate_unblinded_tokens(reason, unblinded_tokens)
+        return self.invalidate_unblinded_tokens(reason, unblinded_tokens)
 
     def _reset(self, unblinded_tokens):
         RESET_PASSES.log(
             count=len(unblinded_tokens),
         )
-        self.reset_unblinded_tokens(unblinded_tokens)
+        return self.reset_unblinded_tokens(unblinded_tokens)
+
+
+@attr.s
+class TokenReservoir(object):
+    """
+    A ``TokenReservoir`` keeps a batch of unblinded tokens in memory so they
+    can be given out and returned without a database transaction for each
+    operation.
+
+    It offers the token-managing operations ``SpendingController`` needs so
+    it can be used in place of a ``VoucherStore``.
+
+    Tokens are taken from the store in batches using
+    ``reserve_unblinded_tokens``.  Tokens which are spent are written back to
+    the store together, either when a batch of them has built up or after
+    ``max_latency`` seconds, whichever comes first.  If the process exits
+    without stopping the reservoir, the tokens it reserved are freed when the
+    store's database is next opened.  Tokens which were spent in the last
+    ``max_latency`` seconds before the exit may then be spent again.
+
+    :ivar store: The ``VoucherStore`` (or ``AsyncVoucherStore``) to take
+        tokens from and record spending in.
+
+    :ivar clock: An ``IReactorTime`` provider used to schedule writes.
+
+    :ivar int batch_size: The number of tokens to reserve at a time and the
+        number of spent tokens which triggers an immediate write.
+
+    :ivar float max_latency: The greatest number of seconds to wait before
+        writing spent tokens to the store.
+
+    :ivar list[UnblindedToken] _available: Reserved tokens which have not
+        been given out.
+
+    :ivar list[UnblindedToken] _spent: Tokens which have been spent but not
+        yet recorded as spent in the store.
+
+    :ivar _write_call: The ``IDelayedCall`` which will write spent tokens to
+        the store, if one is scheduled.
+    """
+    _log = Logger()
+
+    store = attr.ib()
+    clock = attr.ib()
+    batch_size = attr.ib(validator=greater_than(0))
+    max_latency = attr.ib(default=1.0)
+
+    _available = attr.ib(default=attr.Factory(list))
+    _spent = attr.ib(default=attr.Factory(list))
+    _write_call = attr.ib(default=None)
+
+    def get_unblinded_tokens(self, count):
+        """
+        Get some unblinded tokens, reserving more from the store if there are
+        not enough in memory.
+
+        :raise NotEnoughTokens: If the store does not have enough tokens.
+
+        :return list[UnblindedToken]|Deferred[list[UnblindedToken]]: The
+            tokens.
+        """
+        if len(self._available) >= count:
+            return self._take(count)
+        return then(
+            self.store.reserve_unblinded_tokens(
+                max(self.batch_size, count - len(self._available)),
+            ),
+            self._refilled,
+            count,
+        )
+
+    def _refilled(self, reserved, count):
+        self._available.extend(reserved)
+        if len(self._available) < count:
+            raise NotEnoughTokens()
+        return self._take(count)
+
+    def _take(self, count):
+        taken = self._available[:count]
+        del self._available[:count]
+        return taken
+
+    def discard_unblinded_tokens(self, unblinded_tokens):
+        """
+        Note that some tokens have been spent.  The store is updated later.
+        """
+        self._spent.extend(unblinded_tokens)
+        if len(self._spent) >= self.batch_size:
+            return self.flush()
+        if self._write_call is None:
+            self._write_call = self.clock.callLater(
+                self.max_latency,
+                self._scheduled_flush,
+            )
+        return None
+
+    def invalidate_unblinded_tokens(self, reason, unblinded_tokens):
+        """
+        Record some tokens as invalid in the store.  This is infrequent so it
+        is written through immediately.
+        """
+        return self.store.invalidate_unblinded_tokens(reason, unblinded_tokens)
+
+    def reset_unblinded_tokens(self, unblinded_tokens):
+        """
+        Make some tokens available to be given out again.  They remain reserved
+        in the store so nothing needs to be written.
+        """
+        # Put them back first so tokens are still used in roughly the order
+        # they were inserted into the store.
+        self._available[:0] = unblinded_tokens
+
+    def flush(self):
+        """
+        Record in the store any spending which has not been recorded yet.
+
+        :return: ``None`` or a ``Deferred`` that fires when the spending has
+            been recorded.
+        """
+        if self._write_call is not None:
+            if self._write_call.active():
+                self._write_call.cancel()
+            self._write_call = None
+        spent, self._spent = self._spent, []
+        if spent:
+            return self.store.discard_unblinded_tokens(spent)
+        return None
+
+    def _scheduled_flush(self):
+        self._write_call = None
+        try:
+            result = self.flush()
+        except Exception:
+            self._log.failure("Recording spent tokens failed.")
+        else:
+            if result is not None:
+                result.addErrback(
+                    lambda reason: self._log.failure(
+                        "Recording spent tokens failed.",
+                        reason,
+                    ),
+                )
+
+    def stop(self):
+        """
+        Record all outstanding spending and return the tokens which have not
+        been given out to the store.  Tokens which have been given out but
+        neither spent nor reset remain reserved in the store.
+
+        :return: ``None`` or a ``Deferred`` that fires when the store has been
+            updated.
+        """
+        available, self._available = self._available, []
+        return then(
+            self.flush(),
+            lambda ignored: self.store.reset_unblinded_tokens(available),
+        )
+
+
+@attr.s
+class TokenStateJournal(object):
+    """
+    A ``TokenStateJournal`` collects the token state changes requested by
+    separate spending operations and records them in the store in a single
+    transaction.
+
+    It offers the token-managing operations ``SpendingController`` needs so
+    it can be used in place of a ``VoucherStore``.  Each change is recorded
+    at most ``max_latency`` seconds after it is requested.  The ``Deferred``
+    returned for a change fires once it has been recorded.
+
+    :ivar store: The ``VoucherStore`` (or ``AsyncVoucherStore``) to record
+        changes in.
+
+    :ivar clock: An ``IReactorTime`` provider used to schedule commits.
+
+    :ivar float max_latency: The greatest number of seconds to wait before
+        recording a change.
+
+    :ivar int operations: The number of changes requested so far.
+
+    :ivar int commits: The number of transactions used to record them.
+    """
+    _log = Logger()
+
+    store = attr.ib()
+    clock = attr.ib()
+    max_latency = attr.ib()
+
+    operations = attr.ib(default=0)
+    commits = attr.ib(default=0)
+
+    _discarded = attr.ib(default=attr.Factory(list))
+    _invalidated = attr.ib(default=attr.Factory(list))
+    _reset = attr.ib(default=attr.Factory(list))
+    _waiting = attr.ib(default=attr.Factory(list))
+    _commit_call = attr.ib(default=None)
+    _stopping = attr.ib(default=False)
+
+    def get_unblinded_tokens(self, count):
+        return self.store.get_unblinded_tokens(count)
+
+    def reserve_unblinded_tokens(self, count):
+        return self.store.reserve_unblinded_tokens(count)
+
+    def discard_unblinded_tokens(self, unblinded_tokens):
+        self._discarded.extend(unblinded_tokens)
+        return self._requested()
+
+    def invalidate_unblinded_tokens(self, reason, unblinded_tokens):
+        self._invalidated.append((reason, unblinded_tokens))
+        return self._requested()
+
+    def reset_unblinded_tokens(self, unblinded_tokens):
+        self._reset.extend(unblinded_tokens)
+        return self._requested()
+
+    def _requested(self):
+        """
+        Account for a newly requested change and arrange for it to be
+        recorded.
+
+        :return Deferred: A ``Deferred`` that fires when the change has been
+            recorded.
+        """
+        self.operations += 1
+        d = Deferred()
+        self._waiting.append(d)
+        if self._stopping:
+            self.commit()
+        elif self._commit_call is None:
+            self._commit_call = self.clock.callLater(self.max_latency, self.commit)
+        return d
+
+    def commit(self):
+        """
+        Record all of the changes requested so far in one transaction.
+
+        :return Deferred: A ``Deferred`` that fires when they have been
+            recorded.
+        """
+        if self._commit_call is not None:
+            if self._commit_call.active():
+                self._commit_call.cancel()
+            self._commit_call = None
+
+        waiting, self._waiting = self._waiting, []
+        discarded, self._discarded = self._discarded, []
+        invalidated, self._invalidated = self._invalidated, []
+        reset, self._reset = self._reset, []
+        if not waiting:
+            return succeed(None)
+
+        self.commits += 1
+        COMMITTED_PASS_STATES.log(
+            operations=len(waiting),
+            count=(
+                len(discarded) +
+                sum(len(tokens) for (reason, tokens) in invalidated) +
+                len(reset)
+            ),
+        )
+        d = maybeDeferred(
+            self.store.update_unblinded_tokens,
+            discarded,
+            invalidated,
+            reset,
+        )
+        def committed(result):
+            for w in waiting:
+                w.callback(None)
+        def failed(reason):
+            self._log.failure("Recording token state changes failed.", reason)
+            for w in waiting:
+                w.errback(reason)
+        d.addCallbacks(committed, failed)
+        return d
+
+    def stop(self):
+        """
+        Record all outstanding changes and record any changes requested later
+        without waiting.
+
+        :return Deferred: A ``Deferred`` that fires when the outstanding
+            changes have been recorded.
+        """
+        self._stopping = True
+        return self.commit()
+
+
+def _shard_holder(index):
+    """
+    :param int index: The position of a shard in ``ShardedTokenPool.shards``.
+
+    :return unicode: The identifier recorded by the main store for the
+        tokens moved to that shard.
+    """
+    return u"shard-{}".format(index)
+
+
+@attr.s
+class ShardedTokenPool(object):
+    """
+    A ``ShardedTokenPool`` spreads the tokens given out for spending over
+    several databases, each with its own connection and write lock, so that
+    concurrent spending operations do not all wait on one writer.
+
+    It offers the token-managing operations ``SpendingController`` and
+    ``TokenStateJournal`` need so it can be used in place of a
+    ``VoucherStore``.
+
+    Tokens enter a shard from the main store when the shard does not have
+    enough to satisfy a request.  They are moved ``batch_size`` (or the
+    request size, if larger) at a time using ``reserve_unblinded_tokens``
+    so they remain reserved in the main store, marked with the shard which
+    holds them, and are never given out from it again.  Requests are given
+    to the shards in turn.  A single request is always satisfied from a
+    single shard.  If the main store cannot refill a shard, the other shards
+    are tried before ``NotEnoughTokens`` is raised.
+
+    The main store keeps a row for each token in a shard until it is spent
+    or invalidated.  So its backups, token counts and token changes cover
+    the tokens in the shards too.  Spent and invalid tokens are removed from
+    the main store before the shard which gave them out.  Before the first
+    request is served, ``recover`` uses these rules to finish any move or
+    removal which was interrupted.
+
+    This means the shards only take giving tokens out and resetting them
+    off the main store.  Every spend or invalidation still writes to the
+    main store, and to a shard as well.  A ``TokenStateJournal`` in front of
+    the pool batches those writes.
+
+    :ivar store: The main ``VoucherStore`` (or ``AsyncVoucherStore``) from
+        which shards are refilled.
+
+    :ivar list shards: The stores holding tokens for spending.
+
+    :ivar int batch_size: The smallest number of tokens to move from the
+        main store to a shard at once.
+
+    :ivar int _next: The index of the shard to give the next request to.
+
+    :ivar dict _holders: A mapping from each token given out and not yet
+        spent, invalidated, or reset to the index in ``shards`` of the store
+        it came from.
+
+    :ivar bool _recovered: Whether ``recover`` has succeeded.
+
+    :ivar list[Deferred]|None _waiting: While ``recover`` is running, the
+        ``Deferred`` of each request waiting for it to finish.
+    """
+    store = attr.ib()
+    shards = attr.ib(validator=attr.validators.instance_of(list))
+    batch_size = attr.ib(validator=greater_than(0))
+
+    _next = attr.ib(default=0)
+    _holders = attr.ib(default=attr.Factory(dict))
+    _recovered = attr.ib(default=False)
+    _waiting = attr.ib(default=None)
+
+    def get_unblinded_tokens(self, count):
+        """
+        Get some unblinded tokens from the next shard.
+
+        :return Deferred[list[UnblindedToken]]: The tokens.  It fails with
+            ``NotEnoughTokens`` if no shard can supply all of them.
+        """
+        start = self._next
+        self._next = (start + 1) % len(self.shards)
+        order = list(
+            (start + n) % len(self.shards)
+            for n
+            in range(len(self.shards))
+        )
+        return then(
+            self._after_recovery(),
+            lambda ignored: self._get_from(order, count, True),
+        )
+
+    def _after_recovery(self):
+        """
+        Wait for ``recover`` to succeed, starting it if necessary.
+
+        :return: ``None`` if it has already succeeded.  Otherwise, a
+            ``Deferred`` which fires with ``None`` when it succeeds or fails
+            if it fails, in which case the next call starts it again.
+        """
+        if self._recovered:
+            return None
+        waiting = Deferred()
+        if self._waiting is None:
+            self._waiting = [waiting]
+            recovering = maybeDeferred(self.recover)
+            recovering.addBoth(self._recovery_finished)
+        else:
+            self._waiting.append(waiting)
+        return waiting
+
+    def _recovery_finished(self, result):
+        waiting, self._waiting = self._waiting, None
+        self._recovered = not isinstance(result, Failure)
+        for d in waiting:
+            d.callback(result)
+
+    def recover(self):
+        """
+        Reconcile each shard with the main store (see
+        ``VoucherStore.reconcile_shard``).  Tokens which were reserved for a
+        shard but not inserted into it are inserted and tokens which were
+        removed from the main store but not from the shard are discarded
+        from the shard.
+
+        :return Deferred: A ``Deferred`` which fires with ``None`` when every
+            shard has been reconciled.
+        """
+        d = gatherResults(
+            list(
+                maybeDeferred(self._recover_shard, index)
+                for index
+                in range(len(self.shards))
+            ),
+            consumeErrors=True,
+        )
+        d.addCallback(lambda ignored: None)
+        return d
+
+    def _recover_shard(self, index):
+        shard = self.shards[index]
+        # Read the shard first.  Anything the main store does after this
+        # read, it does before the shard.
+        def reconcile(backup):
+            return self.store.reconcile_shard(
+                _shard_holder(index),
+                backup[u"unblinded-tokens"],
+            )
+        def finish(result):
+            missing, used = result
+            return then(
+                shard.update_unblinded_tokens(used, [], []),
+                lambda ignored: shard.import_unblinded_tokens(missing),
+            )
+        return then(then(shard.backup(), reconcile), finish)
+
+    def _get_from(self, order, count, refill):
+        """
+        Get tokens from the first of some shards, refilling it from the main
+        store first if allowed and necessary, or from the others if it does
+        not have enough.
+
+        :param list[int] order: The indexes of the shards to try.
+        """
+        index = order[0]
+        shard = self.shards[index]
+        def not_enough(reason):
+            reason.trap(NotEnoughTokens)
+            if refill:
+                return then(
+                    self._refill(index, count),
+                    lambda ignored: self._get_from(order, count, False),
+                )
+            if len(order) > 1:
+                return self._get_from(order[1:], count, False)
+            return reason
+        d = maybeDeferred(shard.get_unblinded_tokens, count)
+        d.addCallbacks(self._given_out, not_enough, callbackArgs=(index,))
+        return d
+
+    def _refill(self, index, count):
+        """
+        Move tokens from the main store to a shard.
+        """
+        # If this is interrupted between the two transactions then
+        # ``recover`` finishes it.  Tokens already in the shard (put there
+        # by ``recover`` in another process, perhaps) are left alone.
+        return then(
+            self.store.reserve_unblinded_tokens(
+                max(self.batch_size, count),
+                _shard_holder(index),
+            ),
+            lambda reserved: self.shards[index].import_unblinded_tokens(
+                list(token.unblinded_token for token in reserved),
+            ),
+        )
+
+    def _given_out(self, unblinded_tokens, index):
+        for token in unblinded_tokens:
+            self._holders[token] = index
+        return unblinded_tokens
+
+    def _by_store(self, unblinded_tokens):
+        """
+        Group some tokens by the store which gave them out and forget where
+        they came from.  Tokens this pool did not give out are attributed to
+        the main store.
+
+        :return list[(store, list[UnblindedToken])]: The stores and their
+            tokens, in the order of ``shards`` followed by the main store.
+        """
+        stores = self.shards + [self.store]
+        groups = {}
+        for token in unblinded_tokens:
+            index = self._holders.pop(token, len(self.shards))
+            groups.setdefault(index, []).append(token)
+        return list(
+            (stores[index], groups[index])
+            for index
+            in sorted(groups)
+        )
+
+    def _each(self, unblinded_tokens, operation, main_first):
+        """
+        Perform an operation on each store for the tokens it gave out.
+
+        :param operation: A two-argument callable which performs the
+            operation with a store and some of its tokens.
+
+        :param bool main_first: If ``True``, the operation uses tokens up.
+            It is performed on the main store for all of the tokens, since
+            the main store keeps the tokens moved to shards, before it is
+            performed on the shards.
+
+        :return Deferred: A ``Deferred`` which fires with ``None`` when the
+            operation has been performed on every store involved.
+        """
+        groups = self._by_store(unblinded_tokens)
+        if main_first:
+            first = [(self.store, unblinded_tokens)]
+            groups = list(
+                (holder, tokens)
+                for (holder, tokens)
+                in groups
+                if holder is not self.store
+            )
+        else:
+            first = []
+        return self._in_turn([first, groups], operation)
+
+    def _in_turn(self, stages, operation):
+        """
+        Perform an operation on the stores of one stage after another, waiting
+        for each stage to finish before starting the next.
+
+        :param list[list[(store, args)]] stages: The stores and the
+            arguments to use with each, in stages.
+
+        :return Deferred: A ``Deferred`` which fires with ``None`` when the
+            operation has been performed for every stage.
+        """
+        def stage(ignored, pairs):
+            return gatherResults(
+                list(
+                    maybeDeferred(operation, holder, args)
+                    for (holder, args)
+                    in pairs
+                ),
+                consumeErrors=True,
+            )
+        d = succeed(None)
+        for pairs in stages:
+            d.addCallback(stage, pairs)
+        d.addCallback(lambda ignored: None)
+        return d
+
+    def reserve_unblinded_tokens(self, count):
+        """
+        Reserve tokens from the main store, as a ``TokenReservoir`` in front of
+        the pool would.  These bypass the shards.
+        """
+        return self.store.reserve_unblinded_tokens(count)
+
+    def discard_unblinded_tokens(self, unblinded_tokens):
+        return self._each(
+            unblinded_tokens,
+            lambda holder, tokens: holder.discard_unblinded_tokens(tokens),
+            True,
+        )
+
+    def invalidate_unblinded_tokens(self, reason, unblinded_tokens):
+        return self._each(
+            unblinded_tokens,
+            lambda holder, tokens: holder.invalidate_unblinded_tokens(reason, tokens),
+            True,
+        )
+
+    def reset_unblinded_tokens(self, unblinded_tokens):
+        # Tokens reset by a shard stay reserved for it in the main store.
+        return self._each(
+            unblinded_tokens,
+            lambda holder, tokens: holder.reset_unblinded_tokens(tokens),
+            False,
+        )
+
+    def update_unblinded_tokens(self, discarded, invalidated, reset):
+        """
+        Discard, invalidate and reset many unblinded tokens with one
+        transaction for each store involved.  See
+        ``VoucherStore.update_unblinded_tokens``.
+
+        The main store records the discarded and invalidated tokens from
+        every shard, and resets only its own tokens, before the shards
+        record their changes.
+        """
+        # Collect the changes for each shard as a list of arguments to its
+        # ``update_unblinded_tokens``, keeping the shards in order.
+        main_changes = (list(discarded), list(invalidated), [])
+        holders = []
+        changes = []
+        def add(position, tokens, wrap=lambda held: held):
+            for (holder, held) in self._by_store(tokens):
+                if holder is self.store:
+                    if position == 2:
+                        main_changes[position].extend(held)
+                    continue
+                if holder not in holders:
+                    holders.append(holder)
+                    changes.append(([], [], []))
+                changes[holders.index(holder)][position].extend(wrap(held))
+
+        add(0, discarded)
+        for (reason, tokens) in invalidated:
+            add(1, tokens, lambda held: [(reason, held)])
+        add(2, reset)
+
+        return self._in_turn(
+            [[(self.store, main_changes)], list(zip(holders, changes))],
+            lambda holder, args: holder.update_unblinded_tokens(*args),
+        )
+
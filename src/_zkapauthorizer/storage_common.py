@@ -24,6 +24,10 @@ from base64 import (
     b64encode,
 )
 
+from datetime import (
+    timedelta,
+)
+
 import attr
 
 from .validators import (
@@ -121,6 +125,120 @@ def get_configured_pass_value(node_config):
     ))
 
 
+def get_configured_database_thread(node_config):
+    """
+    Determine whether the configuration asks for database work to be done in
+    a dedicated thread instead of the reactor thread.
+
+    The value is read from the **database-thread** option of the
+    ZKAPAuthorizer plugin client section.  It is off if not configured.
+    """
+    section_name = u"storageclient.plugins.privatestorageio-zkapauthz-v1"
+    return node_config.get_config(
+        section=section_name,
+        option=u"database-thread",
+        default=False,
+        boolean=True,
+    )
+
+
+def get_configured_token_reservoir_size(node_config):
+    """
+    Determine the number of unblinded tokens the client should keep in memory
+    for spending.
+
+    The value is read from the **token-reservoir-size** option of the
+    ZKAPAuthorizer plugin client section.  ``0``, the default, means tokens
+    are taken directly from the database for each spending operation.
+    """
+    section_name = u"storageclient.plugins.privatestorageio-zkapauthz-v1"
+    return int(node_config.get_config(
+        section=section_name,
+        option=u"token-reservoir-size",
+        default=0,
+    ))
+
+
+def get_configured_token_reservoir_latency(node_config):
+    """
+    Determine the greatest number of seconds the client may wait before
+    recording spent tokens in the database.
+
+    The value is read from the **token-reservoir-latency** option of the
+    ZKAPAuthorizer plugin client section.
+    """
+    section_name = u"storageclient.plugins.privatestorageio-zkapauthz-v1"
+    return float(node_config.get_config(
+        section=section_name,
+        option=u"token-reservoir-latency",
+        default=1.0,
+    ))
+
+
+def get_configured_token_commit_latency(node_config):
+    """
+    Determine the greatest number of seconds the client may wait in order to
+    record changes to the state of several tokens in one database
+    transaction.
+
+    The value is read from the **token-commit-latency** option of the
+    ZKAPAuthorizer plugin client section.  ``0``, the default, means each
+    change is recorded in its own transaction as soon as it is made.
+    """
+    section_name = u"storageclient.plugins.privatestorageio-zkapauthz-v1"
+    return float(node_config.get_config(
+        section=section_name,
+        option=u"token-commit-latency",
+        default=0,
+    ))
+
+
+def get_configured_token_shards(node_config):
+    """
+    Determine the number of additional databases over which tokens for
+    spending should be spread.
+
+    The value is read from the **token-shards** option of the
+    ZKAPAuthorizer plugin client section.  ``0``, the default, means tokens
+    are spent directly from the node's main database.
+    """
+    section_name = u"storageclient.plugins.privatestorageio-zkapauthz-v1"
+    return int(node_config.get_config(
+        section=section_name,
+        option=u"token-shards",
+        default=0,
+    ))
+
+
+def get_configured_lease_maintenance_retention(node_config):
+    """
+    Determine how long the client should keep records of lease maintenance
+    runs.
+
+    The value is read from the **lease-maintenance-history-days** option of
+    the ZKAPAuthorizer plugin client section.  ``0`` means records are kept
+    forever.
+
+    :raise ValueError: If the value is negative.
+
+    :return timedelta|None: The retention period or ``None`` to keep records
+        forever.
+    """
+    section_name = u"storageclient.plugins.privatestorageio-zkapauthz-v1"
+    days = int(node_config.get_config(
+        section=section_name,
+        option=u"lease-maintenance-history-days",
+        default=730,
+    ))
+    if days < 0:
+        raise ValueError(
+            "lease-maintenance-history-days must not be negative, got {}".format(days),
+        )
+    if days == 0:
+        return None
+    return timedelta(days=days)
+
+
 def get_configured_lease_duration(node_config):
     """
     Just kidding.  Lease duration is hard-coded.
@@ -20,11 +20,16 @@ from __future__ import (
     absolute_import,
 )
 
+from time import (
+    tzset,
+)
+
 import attr
 
 from fixtures import (
     Fixture,
     TempDir,
+    EnvironmentVariable,
 )
 
 from twisted.python.filepath import (
@@ -65,6 +70,23 @@ class AnonymousStorageServer(Fixture):
         )
 
 
+@attr.s
+class LocalTimezone(Fixture):
+    """
+    Make local time that of the given timezone for as long as the fixture is
+    in use.
+
+    :ivar bytes tz: A value for the ``TZ`` environment variable, such as
+        ``b"EST+05"``.
+    """
+    tz = attr.ib()
+
+    def _setUp(self):
+        self.addCleanup(tzset)
+        self.useFixture(EnvironmentVariable(b"TZ", self.tz))
+        tzset()
+
+
 @attr.s
 class TemporaryVoucherStore(Fixture):
     """
@@ -0,0 +1,163 @@
+# Copyright 2020 PrivateStorage.io, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for ``_zkapauthorizer.backup``.
+"""
+
+from __future__ import (
+    absolute_import,
+)
+
+from io import (
+    BytesIO,
+)
+
+from testtools import (
+    TestCase,
+)
+from testtools.matchers import (
+    Equals,
+    MatchesStructure,
+    raises,
+)
+
+from hypothesis import (
+    given,
+)
+from hypothesis.strategies import (
+    lists,
+    binary,
+    text,
+    booleans,
+    integers,
+)
+
+from ..backup import (
+    TOKEN_SIZE,
+    BackupWriter,
+    write_backup,
+    read_header,
+    iter_tokens,
+    verify_backup,
+)
+
+
+def raw_tokens():
+    """
+    Build the raw bytes of unblinded tokens.
+    """
+    return binary(min_size=TOKEN_SIZE, max_size=TOKEN_SIZE)
+
+
+def _backup(tokens, public_keys, compress):
+    f = BytesIO()
+    write_backup(f, tokens, public_keys, compress)
+    return f.getvalue()
+
+
+class BackupTests(TestCase):
+    """
+    Tests for writing and reading binary backups.
+    """
+    @given(lists(raw_tokens()), lists(text(max_size=64), max_size=3), booleans())
+    def test_round_trip(self, tokens, public_keys, compress):
+        """
+        The header and tokens read from a backup are those which were written.
+        """
+        f = BytesIO(_backup(tokens, public_keys, compress))
+        header = verify_backup(f)
+        self.expectThat(
+            header,
+            MatchesStructure(
+                compressed=Equals(compress),
+                count=Equals(len(tokens)),
+                public_keys=Equals(public_keys),
+            ),
+        )
+        f.seek(0)
+        self.expectThat(
+            list(iter_tokens(f, read_header(f), chunk_size=7)),
+            Equals(tokens),
+        )
+
+    @given(lists(lists(raw_tokens(), max_size=5), max_size=5), booleans())
+    def test_writer(self, pieces, compress):
+        """
+        Writing the tokens a piece at a time with ``BackupWriter`` produces the
+        same backup as writing them all at once with ``write_backup``.
+        """
+        f = BytesIO()
+        writer = BackupWriter(f, [u"key"], compress)
+        for piece in pieces:
+            writer.write(piece)
+        writer.finish()
+        self.assertThat(
+            f.getvalue(),
+            Equals(_backup(
+                list(token for piece in pieces for token in piece),
+                [u"key"],
+                compress,
+            )),
+        )
+
+    @given(lists(raw_tokens()))
+    def test_uncompressed_size(self, tokens):
+        """
+        An uncompressed backup holds only the raw bytes of each token after
+        its header.
+        """
+        empty = _backup([], [], False)
+        self.assertThat(
+            len(_backup(tokens, [], False)),
+            Equals(len(empty) + TOKEN_SIZE * len(tokens)),
+        )
+
+    @given(lists(raw_tokens(), min_size=1), booleans(), integers(min_value=0))
+    def test_corrupt(self, tokens, compress, position):
+        """
+        ``verify_backup`` raises ``ValueError`` if any byte of the tokens is
+        changed.
+        """
+        header_size = len(_backup([], [], compress))
+        backup = bytearray(_backup(tokens, [], compress))
+        position = header_size + position % (len(backup) - header_size)
+        backup[position] ^= 0x01
+        self.assertThat(
+            lambda: verify_backup(BytesIO(bytes(backup))),
+            raises(ValueError),
+        )
+
+    @given(lists(raw_tokens(), min_size=1), integers(min_value=1))
+    def test_truncated(self, tokens, missing):
+        """
+        ``verify_backup`` raises ``ValueError`` if an uncompressed backup is cut
+        short.
+        """
+        backup = _backup(tokens, [], False)
+        backup = backup[:-(1 + (missing - 1) % len(backup))]
+        self.assertThat(
+            lambda: verify_backup(BytesIO(backup)),
+            raises(ValueError),
+        )
+
+    def test_not_a_backup(self):
+        """
+        ``read_header`` raises ``ValueError`` for something which is not a
+        backup.
+        """
+        self.assertThat(
+            lambda: read_header(BytesIO(b'{"unblinded-tokens": []}' * 4)),
+            raises(ValueError),
+        )
@@ -0,0 +1,86 @@
+# Copyright 2020 PrivateStorage.io, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for ``_zkapauthorizer.benchmark``.
+"""
+
+from testtools import (
+    TestCase,
+)
+from testtools.matchers import (
+    Equals,
+    GreaterThan,
+)
+
+from fixtures import (
+    TempDir,
+)
+
+from twisted.python.filepath import (
+    FilePath,
+)
+
+from ..benchmark import (
+    PROFILES,
+    spend_rate,
+    construction_rate,
+)
+
+
+class SpendRateTests(TestCase):
+    """
+    Tests for ``spend_rate``.
+    """
+    def test_rate(self):
+        """
+        ``spend_rate`` returns the number of spends performed per second of
+        elapsed time for each of the benchmarked profiles.
+        """
+        path = FilePath(self.useFixture(TempDir()).join(b"benchmark.sqlite3"))
+        for (description, profile) in PROFILES:
+            times = iter([10.0, 12.0])
+            self.expectThat(
+                spend_rate(path, profile, 10, clock=lambda: next(times)),
+                Equals(5.0),
+                description,
+            )
+
+    def test_real_clock(self):
+        """
+        With the real clock ``spend_rate`` returns a positive rate.
+        """
+        path = FilePath(self.useFixture(TempDir()).join(b"benchmark.sqlite3"))
+        self.assertThat(
+            spend_rate(path, PROFILES[0][1], 3),
+            GreaterThan(0),
+        )
+
+
+class ConstructionRateTests(TestCase):
+    """
+    Tests for ``construction_rate``.
+    """
+    def test_rate(self):
+        """
+        ``construction_rate`` returns the number of tokens constructed per
+        second of elapsed time with or without validation.
+        """
+        for trusted in [False, True]:
+            times = iter([10.0, 12.0])
+            self.expectThat(
+                construction_rate(10, trusted, clock=lambda: next(times)),
+                Equals(5.0),
+                repr(trusted),
+            )
@@ -29,6 +29,7 @@ from .._base64 import (
 
 from datetime import (
     datetime,
+    timedelta,
 )
 from json import (
     dumps,
@@ -36,6 +37,9 @@ from json import (
 from io import (
     BytesIO,
 )
+from functools import (
+    partial,
+)
 from urllib import (
     quote,
 )
@@ -50,8 +54,10 @@ from testtools.matchers import (
     MatchesPredicate,
     AllMatch,
     HasLength,
+    LessThan,
     IsInstance,
     ContainsDict,
+    MatchesDict,
     AfterPreprocessing,
     Equals,
     Always,
@@ -61,6 +67,7 @@ from testtools.matchers import (
 from testtools.twistedsupport import (
     CaptureTwistedLogs,
     succeeded,
+    has_no_result,
 )
 from testtools.content import (
     text_content,
@@ -76,10 +83,12 @@ from fixtures import (
 
 from hypothesis import (
     given,
+    assume,
     note,
 )
 from hypothesis.strategies import (
     one_of,
+    booleans,
     none,
     just,
     fixed_dictionaries,
@@ -110,6 +119,7 @@ from twisted.web.http import (
     OK,
     UNAUTHORIZED,
     NOT_FOUND,
+    NOT_MODIFIED,
     BAD_REQUEST,
     NOT_IMPLEMENTED,
 )
@@ -118,6 +128,7 @@ from twisted.web.http_headers import (
 )
 from twisted.web.resource import (
     IResource,
+    Resource,
     getChildForRequest,
 )
 from twisted.web.client import (
@@ -145,12 +156,19 @@ from ..model import (
     Unpaid,
     Error,
     VoucherStore,
+    SNAPSHOT_DB_NAME,
+    open_and_initialize,
     memory_connect,
 )
+from ..controller import (
+    DummyRedeemer,
+)
 from ..resource import (
     NUM_TOKENS,
     from_configuration,
     get_token_count,
+    _UnblindedTokenCollection,
+    _UnblindedTokenBackup,
 )
 
 from ..pricecalculator import (
@@ -166,6 +184,9 @@ from ..storage_common import (
     get_configured_lease_duration,
 )
 
+from .fixtures import (
+    ConfiglessMemoryVoucherStore,
+)
 from .strategies import (
     direct_tahoe_configs,
     tahoe_configs,
@@ -268,7 +289,7 @@ def invalid_bodies():
     )
 
 
-def root_from_config(config, now):
+def root_from_config(config, now, clock=None):
     """
     Create a client root resource from a Tahoe-LAFS configuration.
 
@@ -277,8 +298,13 @@ def root_from_config(config, now):
     :param now: A no-argument callable that returns the time of the call as a
         ``datetime`` instance.
 
+    :param clock: The ``IReactorTime`` to give to the resource or ``None``
+        for a new ``Clock``.
+
     :return IResource: The root client resource.
     """
+    if clock is None:
+        clock = Clock()
     return from_configuration(
         config,
         VoucherStore.from_node_config(
@@ -286,7 +312,7 @@ def root_from_config(config, now):
             now,
             memory_connect,
         ),
-        clock=Clock(),
+        clock=clock,
     )
 
 
@@ -531,7 +557,8 @@ class UnblindedTokenTests(TestCase):
             get_config,
             api_auth_token,
         )
-        root = root_from_config(config, datetime.now)
+        clock = Clock()
+        root = root_from_config(config, datetime.now, clock)
         agent = RequestTraversalAgent(root)
         data = BytesIO(dumps({u"unblinded-tokens": list(
             token.unblinded_token
@@ -546,10 +573,22 @@ class UnblindedTokenTests(TestCase):
             b"http://127.0.0.1/unblinded-token",
             data=data,
         )
+        clock.advance(0)
+        agent.flush()
         self.assertThat(
             requesting,
             succeeded(
-                ok_response(headers=application_json()),
+                MatchesAll(
+                    ok_response(headers=application_json()),
+                    AfterPreprocessing(
+                        json_content,
+                        succeeded(
+                            ContainsDict({
+                                u"imported": Equals(len(unblinded_tokens)),
+                            }),
+                        ),
+                    ),
+                ),
             ),
         )
 
@@ -564,6 +603,310 @@ class UnblindedTokenTests(TestCase):
             )),
         )
 
+    @given(
+        tahoe_configs(),
+        api_auth_tokens(),
+        lists(unblinded_tokens(), unique=True, min_size=1, max_size=100),
+    )
+    def test_post_get_response(self, get_config, api_auth_token, unblinded_tokens):
+        """
+        When the unblinded token collection receives a **POST** with the body
+        of a response to a **GET**, the other properties of the response are
+        ignored and the tokens in it are inserted into the system.
+        """
+        tokens = list(t.unblinded_token for t in unblinded_tokens)
+        root = root_from_config(
+            get_config_with_api_token(
+                self.useFixture(TempDir()),
+                get_config,
+                api_auth_token,
+            ),
+            datetime.now,
+        )
+        root.store.insert_unblinded_tokens(tokens)
+        requesting = authorized_request(
+            api_auth_token,
+            RequestTraversalAgent(root),
+            b"GET",
+            b"http://127.0.0.1/unblinded-token",
+        )
+        self.assertThat(
+            requesting,
+            succeeded(ok_response(headers=application_json())),
+        )
+        saved = []
+        readBody(requesting.result).addCallback(saved.append)
+        self.assertThat(saved, HasLength(1))
+
+        clock = Clock()
+        restored_root = root_from_config(
+            get_config_with_api_token(
+                self.useFixture(TempDir()),
+                get_config,
+                api_auth_token,
+            ),
+            datetime.now,
+            clock,
+        )
+        agent = RequestTraversalAgent(restored_root)
+        restoring = authorized_request(
+            api_auth_token,
+            agent,
+            b"POST",
+            b"http://127.0.0.1/unblinded-token",
+            data=BytesIO(saved[0]),
+        )
+        clock.advance(0)
+        agent.flush()
+        self.assertThat(
+            restoring,
+            succeeded(
+                MatchesAll(
+                    ok_response(headers=application_json()),
+                    AfterPreprocessing(
+                        json_content,
+                        succeeded(
+                            ContainsDict({
+                                u"imported": Equals(len(tokens)),
+                            }),
+                        ),
+                    ),
+                ),
+            ),
+        )
+        self.assertThat(
+            restored_root.store.backup()[u"unblinded-tokens"],
+            Equals(tokens),
+        )
+
+    def _store(self):
+        return self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        ).store
+
+    def _post_tokens(self, store, batch_size, body, query=b""):
+        """
+        **POST** a request body to an unblinded token collection which stores
+        tokens in batches of the given size.
+
+        :return: The ``Deferred`` result of the request.
+        """
+        root = Resource()
+        root.putChild(
+            b"unblinded-token",
+            _UnblindedTokenCollection(
+                store,
+                None,
+                uncooperator().cooperate,
+                batch_size,
+            ),
+        )
+        agent = RequestTraversalAgent(root)
+        requesting = agent.request(
+            b"POST",
+            b"http://127.0.0.1/unblinded-token" + query,
+            headers=Headers({u"content-type": [u"application/json"]}),
+            bodyProducer=FileBodyProducer(BytesIO(body), cooperator=uncooperator()),
+        )
+        return requesting
+
+    @given(
+        lists(unblinded_tokens(), unique=True, max_size=20),
+        integers(min_value=1, max_value=8),
+    )
+    def test_post_progress(self, unblinded_tokens, batch_size):
+        """
+        When the unblinded token collection receives a **POST**, the tokens are
+        stored in batches of the configured size and the response reports the
+        number of tokens stored after each batch.
+        """
+        tokens = list(t.unblinded_token for t in unblinded_tokens)
+        store = self._store()
+        requesting = self._post_tokens(
+            store,
+            batch_size,
+            dumps({u"unblinded-tokens": tokens}),
+        )
+        self.assertThat(
+            requesting,
+            succeeded(
+                MatchesAll(
+                    ok_response(headers=application_json()),
+                    AfterPreprocessing(
+                        json_content,
+                        succeeded(
+                            Equals({
+                                u"progress": list(
+                                    min(n + batch_size, len(tokens))
+                                    for n
+                                    in range(0, len(tokens), batch_size)
+                                ),
+                                u"imported": len(tokens),
+                            }),
+                        ),
+                    ),
+                ),
+            ),
+        )
+        self.assertThat(store.backup()[u"unblinded-tokens"], Equals(tokens))
+
+    @given(
+        lists(unblinded_tokens(), unique=True, min_size=2, max_size=20),
+        integers(min_value=1, max_value=8),
+        integers(min_value=0, max_value=8),
+    )
+    def test_post_resume(self, unblinded_tokens, batch_size, overlap):
+        """
+        When the unblinded token collection receives a **POST** with a **skip**
+        query argument, that many tokens from the start of the list are not
+        stored.  Tokens which are stored already are left alone so a restore
+        can be resumed from a position behind the progress actually made.
+        """
+        tokens = list(t.unblinded_token for t in unblinded_tokens)
+        stored = len(tokens) // 2
+        skip = max(0, stored - overlap)
+        store = self._store()
+        store.insert_unblinded_tokens(tokens[:stored])
+        requesting = self._post_tokens(
+            store,
+            batch_size,
+            dumps({u"unblinded-tokens": tokens}),
+            b"?skip={}".format(skip),
+        )
+        self.assertThat(
+            requesting,
+            succeeded(ok_response(headers=application_json())),
+        )
+        self.assertThat(store.backup()[u"unblinded-tokens"], Equals(tokens))
+
+    @given(
+        lists(unblinded_tokens(), unique=True, min_size=1, max_size=20),
+        integers(min_value=1, max_value=8),
+    )
+    def test_post_malformed(self, unblinded_tokens, batch_size):
+        """
+        When the unblinded token collection receives a **POST** with a body
+        which is cut off, the tokens before the damage are stored.  If none
+        were stored the response is **BAD REQUEST**.  Otherwise the response
+        reports the error and the number of tokens stored.
+        """
+        tokens = list(t.unblinded_token for t in unblinded_tokens)
+        body = dumps({u"unblinded-tokens": tokens})
+        # Cut the document off part way through the last token.
+        body = body[:-len(tokens[-1]) // 2]
+
+        store = self._store()
+        requesting = self._post_tokens(store, batch_size, body)
+        complete_batches = (len(tokens) - 1) // batch_size * batch_size
+        if complete_batches == 0:
+            expected_code = BAD_REQUEST
+        else:
+            expected_code = OK
+        self.assertThat(
+            requesting,
+            succeeded(
+                MatchesAll(
+                    match_response(expected_code, application_json()),
+                    AfterPreprocessing(
+                        json_content,
+                        succeeded(
+                            ContainsDict({
+                                u"imported": Equals(complete_batches),
+                                u"error": Equals(u"could not parse request body"),
+                            }),
+                        ),
+                    ),
+                ),
+            ),
+        )
+        self.assertThat(
+            store.backup()[u"unblinded-tokens"],
+            Equals(tokens[:complete_batches]),
+        )
+
+    @given(
+        lists(unblinded_tokens(), unique=True, min_size=1, max_size=20),
+        sampled_from([b"abc", b"-1", b""]),
+    )
+    def test_post_invalid_skip(self, unblinded_tokens, skip):
+        """
+        When the unblinded token collection receives a **POST** with a **skip**
+        query argument which is not a non-negative integer, the response is
+        **BAD REQUEST** and no tokens are stored.
+        """
+        tokens = list(t.unblinded_token for t in unblinded_tokens)
+        store = self._store()
+        requesting = self._post_tokens(
+            store,
+            1,
+            dumps({u"unblinded-tokens": tokens}),
+            b"?skip=" + skip,
+        )
+        self.assertThat(
+            requesting,
+            succeeded(bad_request_response()),
+        )
+        self.assertThat(store.backup()[u"unblinded-tokens"], Equals([]))
+
+    @given(
+        sampled_from([b"limit=some", b"limit=-1", b"cursor=first"]),
+    )
+    def test_get_invalid_query(self, query):
+        """
+        When the unblinded token collection receives a **GET** with a query
+        argument which cannot be interpreted, the response is **BAD
+        REQUEST**.
+        """
+        root = Resource()
+        root.putChild(
+            b"unblinded-token",
+            _UnblindedTokenCollection(self._store(), None),
+        )
+        self.assertThat(
+            RequestTraversalAgent(root).request(
+                b"GET",
+                b"http://127.0.0.1/unblinded-token?" + query,
+            ),
+            succeeded(bad_request_response()),
+        )
+
+    @given(
+        lists(unblinded_tokens(), unique=True, min_size=1, max_size=20),
+    )
+    def test_post_invalid_base64(self, unblinded_tokens):
+        """
+        When the unblinded token collection receives a **POST** with a token
+        which is not valid base64, the response is **BAD REQUEST** and says
+        so.
+        """
+        tokens = list(t.unblinded_token for t in unblinded_tokens)
+        # Incorrect padding.
+        tokens[-1] = tokens[-1][:-1]
+        store = self._store()
+        requesting = self._post_tokens(
+            store,
+            len(tokens),
+            dumps({u"unblinded-tokens": tokens}),
+        )
+        self.assertThat(
+            requesting,
+            succeeded(
+                MatchesAll(
+                    bad_request_response(application_json()),
+                    AfterPreprocessing(
+                        json_content,
+                        succeeded(
+                            ContainsDict({
+                                u"imported": Equals(0),
+                                u"error": Equals(u"could not decode unblinded token"),
+                            }),
+                        ),
+                    ),
+                ),
+            ),
+        )
+        self.assertThat(store.backup()[u"unblinded-tokens"], Equals([]))
+
     @given(
         tahoe_configs(),
         api_auth_tokens(),
@@ -607,8 +950,376 @@ class UnblindedTokenTests(TestCase):
             text_content(u"{}".format(vars(requesting.result))),
         )
         self.assertThat(
-            requesting,
-            succeeded_with_unblinded_tokens(num_tokens, num_tokens),
+            requesting,
+            succeeded_with_unblinded_tokens(num_tokens, num_tokens),
+        )
+
+    @given(
+        tahoe_configs(),
+        api_auth_tokens(),
+        vouchers(),
+        integers(min_value=0, max_value=10),
+        integers(min_value=0, max_value=10),
+        integers(min_value=0, max_value=10),
+    )
+    def test_get_inventory(self, get_config, api_auth_token, voucher, spent, invalid, in_use):
+        """
+        When the inventory child of the unblinded token collection receives a
+        **GET**, the response gives the number of tokens in each state.
+        """
+        config = get_config_with_api_token(
+            self.useFixture(TempDir()),
+            get_config,
+            api_auth_token,
+        )
+        root = root_from_config(config, datetime.now)
+        num_tokens = root.controller.num_redemption_groups + spent + invalid + in_use
+        self.assertThat(
+            root.controller.redeem(voucher, num_tokens),
+            succeeded(Always()),
+        )
+        store = root.controller.store
+        store.discard_unblinded_tokens(store.get_unblinded_tokens(spent))
+        store.invalidate_unblinded_tokens(
+            u"reason",
+            store.get_unblinded_tokens(invalid),
+        )
+        store.get_unblinded_tokens(in_use)
+
+        agent = RequestTraversalAgent(root)
+        requesting = authorized_request(
+            api_auth_token,
+            agent,
+            b"GET",
+            b"http://127.0.0.1/unblinded-token/inventory",
+        )
+        self.assertThat(
+            requesting,
+            succeeded(
+                MatchesAll(
+                    ok_response(headers=application_json()),
+                    AfterPreprocessing(
+                        json_content,
+                        succeeded(
+                            Equals({
+                                u"free": num_tokens - spent - invalid - in_use,
+                                u"in-use": in_use,
+                                u"reserved": 0,
+                                u"invalid": invalid,
+                                u"spent": spent,
+                            }),
+                        ),
+                    ),
+                ),
+            ),
+        )
+
+    @given(
+        tahoe_configs(),
+        api_auth_tokens(),
+        vouchers(),
+        maybe_extra_tokens(),
+    )
+    def test_get_backup(self, get_config, api_auth_token, voucher, extra_tokens):
+        """
+        When the backup child of the unblinded token collection receives a
+        **GET**, the response is written over time and holds every unblinded
+        token in the form accepted by a **POST** to the collection.
+        """
+        config = get_config_with_api_token(
+            self.useFixture(TempDir()),
+            get_config,
+            api_auth_token,
+        )
+        clock = Clock()
+        root = root_from_config(config, datetime.now, clock)
+        if extra_tokens is not None:
+            self.assertThat(
+                root.controller.redeem(
+                    voucher,
+                    root.controller.num_redemption_groups + extra_tokens,
+                ),
+                succeeded(Always()),
+            )
+
+        agent = RequestTraversalAgent(root)
+        requesting = authorized_request(
+            api_auth_token,
+            agent,
+            b"GET",
+            b"http://127.0.0.1/unblinded-token/backup",
+        )
+        # Nothing is written until the cooperator gets a chance to run.
+        self.assertThat(requesting, has_no_result())
+
+        clock.advance(0)
+        agent.flush()
+        self.assertThat(
+            requesting,
+            succeeded(
+                MatchesAll(
+                    ok_response(headers=application_json()),
+                    AfterPreprocessing(
+                        json_content,
+                        succeeded(
+                            Equals(root.controller.store.backup()),
+                        ),
+                    ),
+                ),
+            ),
+        )
+
+    @given(
+        lists(unblinded_tokens(), unique=True, max_size=20),
+        integers(min_value=1, max_value=8),
+        booleans(),
+    )
+    def test_binary_backup_pages(self, unblinded_tokens, page_size, compress):
+        """
+        The binary backup retrieved from the backup child of the unblinded
+        token collection is read from the store a page at a time and is the
+        same as the one written by ``VoucherStore.export_binary_backup``.
+        """
+        store = self._store()
+        store.insert_unblinded_tokens(list(
+            t.unblinded_token
+            for t
+            in unblinded_tokens
+        ))
+        clock = Clock()
+        root = Resource()
+        root.putChild(
+            b"backup",
+            _UnblindedTokenBackup(
+                store,
+                Cooperator(scheduler=partial(clock.callLater, 0)).cooperate,
+                page_size,
+            ),
+        )
+        agent = RequestTraversalAgent(root)
+        requesting = agent.request(
+            b"GET",
+            b"http://127.0.0.1/backup?format=binary&compress={}".format(
+                b"true" if compress else b"false",
+            ),
+        )
+        clock.advance(0)
+        agent.flush()
+        self.assertThat(requesting, succeeded(ok_response()))
+        reading = readBody(requesting.result)
+        agent.flush()
+        expected = BytesIO()
+        store.export_binary_backup(expected, compress)
+        self.assertThat(
+            reading,
+            succeeded(Equals(expected.getvalue())),
+        )
+
+    @given(
+        tahoe_configs(),
+        api_auth_tokens(),
+        vouchers(),
+        maybe_extra_tokens(),
+        booleans(),
+    )
+    def test_binary_backup_round_trip(self, get_config, api_auth_token, voucher, extra_tokens, compress):
+        """
+        A binary backup retrieved from the backup child of the unblinded token
+        collection can be **POST**\ ed to the unblinded token collection of
+        another node to restore the tokens.
+        """
+        clock = Clock()
+        root = root_from_config(
+            get_config_with_api_token(
+                self.useFixture(TempDir()),
+                get_config,
+                api_auth_token,
+            ),
+            datetime.now,
+            clock,
+        )
+        if extra_tokens is not None:
+            self.assertThat(
+                root.controller.redeem(
+                    voucher,
+                    root.controller.num_redemption_groups + extra_tokens,
+                ),
+                succeeded(Always()),
+            )
+
+        agent = RequestTraversalAgent(root)
+        requesting = authorized_request(
+            api_auth_token,
+            agent,
+            b"GET",
+            b"http://127.0.0.1/unblinded-token/backup?format=binary&compress={}".format(
+                b"true" if compress else b"false",
+            ),
+        )
+        clock.advance(0)
+        agent.flush()
+        self.assertThat(
+            requesting,
+            succeeded(
+                ok_response(
+                    headers=AfterPreprocessing(
+                        lambda h: h.getRawHeaders(u"content-type"),
+                        Equals([u"application/octet-stream"]),
+                    ),
+                ),
+            ),
+        )
+        backup = []
+        readBody(requesting.result).addCallback(backup.append)
+        self.assertThat(backup, HasLength(1))
+
+        restored_root = root_from_config(
+            get_config_with_api_token(
+                self.useFixture(TempDir()),
+                get_config,
+                api_auth_token,
+            ),
+            datetime.now,
+        )
+        restoring = authorized_request(
+            api_auth_token,
+            RequestTraversalAgent(restored_root),
+            b"POST",
+            b"http://127.0.0.1/unblinded-token",
+            data=BytesIO(backup[0]),
+            headers={u"content-type": [u"application/octet-stream"]},
+        )
+        self.assertThat(
+            restoring,
+            succeeded(ok_response(headers=application_json())),
+        )
+        self.assertThat(
+            restored_root.store.backup(),
+            Equals(root.store.backup()),
+        )
+
+    @given(
+        tahoe_configs(),
+        api_auth_tokens(),
+        binary(),
+    )
+    def test_post_invalid_binary_backup(self, get_config, api_auth_token, body):
+        """
+        When the unblinded token collection receives a **POST** with a binary
+        request body which is not a valid backup the response is **BAD
+        REQUEST**.
+        """
+        root = root_from_config(
+            get_config_with_api_token(
+                self.useFixture(TempDir()),
+                get_config,
+                api_auth_token,
+            ),
+            datetime.now,
+        )
+        restoring = authorized_request(
+            api_auth_token,
+            RequestTraversalAgent(root),
+            b"POST",
+            b"http://127.0.0.1/unblinded-token",
+            data=BytesIO(body),
+            headers={u"content-type": [u"application/octet-stream"]},
+        )
+        self.assertThat(
+            restoring,
+            succeeded(match_response(BAD_REQUEST, application_json())),
+        )
+
+    @given(
+        tahoe_configs(),
+        api_auth_tokens(),
+        vouchers(),
+        integers(min_value=0, max_value=10),
+    )
+    def test_token_changes(self, get_config, api_auth_token, voucher, spent):
+        """
+        Changes retrieved from the changes child of the unblinded token
+        collection can be **POST**\ ed to the changes child on another node
+        to bring it up to date, and a **DELETE** with the sequence number
+        prunes them.
+        """
+        def root():
+            return root_from_config(
+                get_config_with_api_token(
+                    self.useFixture(TempDir()),
+                    get_config,
+                    api_auth_token,
+                ),
+                datetime.now,
+            )
+
+        def request(root, method, url, data=None):
+            return authorized_request(
+                api_auth_token,
+                RequestTraversalAgent(root),
+                method,
+                b"http://127.0.0.1/unblinded-token/changes" + url,
+                data=data,
+            )
+
+        source = root()
+        target = root()
+        num_tokens = source.controller.num_redemption_groups + spent
+        self.assertThat(
+            source.controller.redeem(voucher, num_tokens),
+            succeeded(Always()),
+        )
+
+        changes = []
+        def sync(since):
+            getting = request(source, b"GET", b"?since={}".format(since))
+            getting.addCallback(readBody)
+            getting.addCallback(changes.append)
+            self.assertThat(getting, succeeded(Always()))
+            self.assertThat(
+                request(target, b"POST", b"", BytesIO(changes[-1])),
+                succeeded(ok_response(headers=application_json())),
+            )
+            self.assertThat(target.store.backup(), Equals(source.store.backup()))
+            return loads(changes[-1])[u"sequence"]
+
+        sequence = sync(0)
+        source.store.discard_unblinded_tokens(source.store.get_unblinded_tokens(spent))
+        sequence = sync(sequence)
+        self.assertThat(
+            request(source, b"DELETE", b"?through={}".format(sequence)),
+            succeeded(ok_response(headers=application_json())),
+        )
+        self.assertThat(
+            loads(changes[-1])[u"removed"],
+            HasLength(spent),
+        )
+
+    @given(
+        sampled_from([
+            (b"GET", b"?since=abc"),
+            (b"DELETE", b"?through=abc"),
+            (b"DELETE", b""),
+        ]),
+    )
+    def test_token_changes_invalid_query(self, method_and_query):
+        """
+        When the changes child of the unblinded token collection receives a
+        **GET** or **DELETE** with a query argument which is missing or not
+        an integer, the response is **BAD REQUEST**.
+        """
+        method, query = method_and_query
+        root = Resource()
+        root.putChild(
+            b"unblinded-token",
+            _UnblindedTokenCollection(self._store(), None),
+        )
+        self.assertThat(
+            RequestTraversalAgent(root).request(
+                method,
+                b"http://127.0.0.1/unblinded-token/changes" + query,
+            ),
+            succeeded(bad_request_response(application_json())),
         )
 
     @given(
@@ -721,6 +1432,68 @@ class UnblindedTokenTests(TestCase):
             ),
         )
 
+    @given(
+        tahoe_configs(),
+        api_auth_tokens(),
+        vouchers(),
+        integers(min_value=0, max_value=100),
+        integers(min_value=1, max_value=10),
+    )
+    def test_get_cursor(self, get_config, api_auth_token, voucher, extra_tokens, limit):
+        """
+        When the unblinded token collection receives a **GET** with a **limit**
+        query argument, the response includes a **next-cursor** which can be
+        given as the **cursor** query argument of another **GET** to retrieve
+        the following tokens.  Following the cursors retrieves every token
+        exactly once.
+        """
+        config = get_config_with_api_token(
+            self.useFixture(TempDir()),
+            get_config,
+            api_auth_token,
+        )
+        root = root_from_config(config, datetime.now)
+        num_tokens = root.controller.num_redemption_groups + extra_tokens
+        self.assertThat(
+            root.controller.redeem(voucher, num_tokens),
+            succeeded(Always()),
+        )
+
+        agent = RequestTraversalAgent(root)
+        def get_page(cursor):
+            url = b"http://127.0.0.1/unblinded-token?limit={}".format(limit)
+            if cursor is not None:
+                url += b"&cursor={}".format(cursor)
+            d = authorized_request(api_auth_token, agent, b"GET", url)
+            d.addCallback(readBody)
+            d.addCallback(loads)
+            pages = []
+            d.addCallback(pages.append)
+            self.assertThat(d, succeeded(Always()))
+            return pages[0]
+
+        tokens = []
+        cursor = None
+        for n in range(num_tokens // limit + 2):
+            page = get_page(cursor)
+            self.assertThat(
+                page[u"unblinded-tokens"],
+                MatchesAll(
+                    AfterPreprocessing(len, LessThan(limit + 1)),
+                    AllMatch(IsInstance(unicode)),
+                ),
+            )
+            tokens.extend(page[u"unblinded-tokens"])
+            cursor = page[u"next-cursor"]
+            if cursor is None:
+                break
+
+        self.assertThat(cursor, Is(None))
+        self.assertThat(
+            tokens,
+            Equals(root.store.backup()[u"unblinded-tokens"]),
+        )
+
     @given(
         tahoe_configs(),
         api_auth_tokens(),
@@ -928,6 +1701,244 @@ def matches_iso8601_datetime():
         ),
     )
 
+class LeaseMaintenanceHistoryTests(TestCase):
+    """
+    Tests relating to ``/lease-maintenance`` as implemented by the
+    ``_zkapauthorizer.resource`` module.
+    """
+    @given(tahoe_configs(), api_auth_tokens())
+    def test_get(self, get_config, api_auth_token):
+        """
+        The response to a **GET** describes the lease maintenance runs which
+        finished in the range of time given by the ``since`` and ``until``
+        query arguments, earliest first and at most ``limit`` of them.
+        """
+        config = get_config_with_api_token(
+            self.useFixture(TempDir()),
+            get_config,
+            api_auth_token,
+        )
+        now = [None]
+        root = root_from_config(config, lambda: now[0])
+        for day in range(1, 5):
+            now[0] = datetime(2020, 1, day)
+            activity = root.store.start_lease_maintenance()
+            activity.observe([root.store.pass_value], renewed=day % 2 == 0)
+            now[0] += timedelta(minutes=day)
+            activity.finish()
+
+        agent = RequestTraversalAgent(root)
+        d = authorized_request(
+            api_auth_token,
+            agent,
+            b"GET",
+            b"http://127.0.0.1/lease-maintenance"
+            b"?since=2020-01-02T00:00:00&until=2020-01-04T00:00:00",
+        )
+        self.assertThat(
+            d,
+            succeeded(
+                MatchesAll(
+                    ok_response(headers=application_json()),
+                    AfterPreprocessing(
+                        json_content,
+                        succeeded(Equals({
+                            u"history": [
+                                {
+                                    u"started": u"2020-01-02T00:00:00",
+                                    u"finished": u"2020-01-02T00:02:00",
+                                    u"duration": 120.0,
+                                    u"count": 1,
+                                    u"checked": 1,
+                                    u"renewed": 1,
+                                },
+                                {
+                                    u"started": u"2020-01-03T00:00:00",
+                                    u"finished": u"2020-01-03T00:03:00",
+                                    u"duration": 180.0,
+                                    u"count": 1,
+                                    u"checked": 1,
+                                    u"renewed": 0,
+                                },
+                            ],
+                        })),
+                    ),
+                ),
+            ),
+        )
+
+        d = authorized_request(
+            api_auth_token,
+            agent,
+            b"GET",
+            b"http://127.0.0.1/lease-maintenance?limit=1",
+        )
+        d.addCallback(readBody)
+        d.addCallback(
+            lambda body: list(
+                run[u"finished"]
+                for run
+                in loads(body)[u"history"]
+            ),
+        )
+        self.assertThat(
+            d,
+            succeeded(Equals([u"2020-01-01T00:01:00"])),
+        )
+
+    @given(tahoe_configs(), api_auth_tokens())
+    def test_get_with_timezone(self, get_config, api_auth_token):
+        """
+        The ``since`` and ``until`` query arguments may give a timezone.  The
+        runs are selected by the instants they give.
+        """
+        config = get_config_with_api_token(
+            self.useFixture(TempDir()),
+            get_config,
+            api_auth_token,
+        )
+        now = [None]
+        root = root_from_config(config, lambda: now[0])
+        for hour in range(4):
+            now[0] = datetime(2020, 1, 1, hour)
+            root.store.start_lease_maintenance().finish()
+
+        agent = RequestTraversalAgent(root)
+        d = authorized_request(
+            api_auth_token,
+            agent,
+            b"GET",
+            b"http://127.0.0.1/lease-maintenance"
+            # 01:00 and 03:00 UTC.
+            b"?since=2020-01-01T06:00:00%2B05:00&until=2019-12-31T22:00:00-05:00",
+        )
+        d.addCallback(readBody)
+        d.addCallback(
+            lambda body: list(
+                run[u"finished"]
+                for run
+                in loads(body)[u"history"]
+            ),
+        )
+        self.assertThat(
+            d,
+            succeeded(Equals([u"2020-01-01T01:00:00", u"2020-01-01T02:00:00"])),
+        )
+
+    @given(
+        tahoe_configs(),
+        api_auth_tokens(),
+        sampled_from([
+            b"since=yesterday",
+            b"until=2020-13-01T00:00:00",
+            b"limit=some",
+            b"limit=-1",
+        ]),
+    )
+    def test_get_invalid_query(self, get_config, api_auth_token, query):
+        """
+        A **GET** with a query argument which cannot be interpreted receives a
+        **BAD REQUEST** response.
+        """
+        config = get_config_with_api_token(
+            self.useFixture(TempDir()),
+            get_config,
+            api_auth_token,
+        )
+        root = root_from_config(config, datetime.utcnow)
+        agent = RequestTraversalAgent(root)
+        self.assertThat(
+            authorized_request(
+                api_auth_token,
+                agent,
+                b"GET",
+                b"http://127.0.0.1/lease-maintenance?" + query,
+            ),
+            succeeded(bad_request_response()),
+        )
+
+
+class SnapshotTests(TestCase):
+    """
+    Tests relating to ``/snapshot`` as implemented by the
+    ``_zkapauthorizer.resource`` module.
+    """
+    def setUp(self):
+        super(SnapshotTests, self).setUp()
+        self.useFixture(CaptureTwistedLogs())
+
+    @given(tahoe_configs(), api_auth_tokens(), vouchers())
+    def test_post(self, get_config, api_auth_token, voucher):
+        """
+        A **POST** to the snapshot resource writes a copy of the database next
+        to it and the response reports the progress of the copy.
+        """
+        config = get_config_with_api_token(
+            self.useFixture(TempDir()),
+            get_config,
+            api_auth_token,
+        )
+        clock = Clock()
+        # The snapshot is copied from the database file so the store cannot
+        # be in memory.
+        store = VoucherStore.from_node_config(config, datetime.now)
+        root = from_configuration(config, store, clock=clock)
+        self.assertThat(
+            root.controller.redeem(voucher, root.controller.num_redemption_groups),
+            succeeded(Always()),
+        )
+
+        agent = RequestTraversalAgent(root)
+        requesting = authorized_request(
+            api_auth_token,
+            agent,
+            b"POST",
+            b"http://127.0.0.1/snapshot",
+        )
+        # Let the copy run to completion.  Other calls scheduled for later
+        # are left alone.
+        while any(
+            call.getTime() <= clock.seconds()
+            for call
+            in clock.getDelayedCalls()
+        ):
+            clock.advance(0)
+        agent.flush()
+
+        target = store.database_path.sibling(SNAPSHOT_DB_NAME)
+        self.assertThat(
+            requesting,
+            succeeded(
+                MatchesAll(
+                    ok_response(headers=application_json()),
+                    AfterPreprocessing(
+                        json_content,
+                        succeeded(
+                            MatchesDict({
+                                u"progress": AfterPreprocessing(
+                                    lambda progress: progress[-1],
+                                    GreaterThan(0),
+                                ),
+                                u"rows": GreaterThan(0),
+                                u"path": Equals(target.path),
+                            }),
+                        ),
+                    ),
+                ),
+            ),
+        )
+        copy = VoucherStore(
+            store.pass_value,
+            target,
+            datetime.now,
+            open_and_initialize(target),
+        )
+        self.assertThat(
+            copy.backup(),
+            Equals(store.backup()),
+        )
+
+
 class VoucherTests(TestCase):
     """
     Tests relating to ``/voucher`` as implemented by the
@@ -1304,8 +2315,11 @@ class VoucherTests(TestCase):
                         ),
                     ).marshal()
                     for voucher
-                    in vouchers
+                    # All of the vouchers were created at the same time so
+                    # they are ordered by number.
+                    in sorted(vouchers)
                 ),
+                u"next-cursor": None,
             }),
         )
 
@@ -1337,11 +2351,195 @@ class VoucherTests(TestCase):
                         ),
                     ).marshal()
                     for voucher
-                    in vouchers
+                    # All of the vouchers were created at the same time so
+                    # they are ordered by number.
+                    in sorted(vouchers)
                 ),
+                u"next-cursor": None,
             }),
         )
 
+    @given(
+        direct_tahoe_configs(),
+        api_auth_tokens(),
+        datetimes(),
+        lists(vouchers(), unique=True),
+        integers(min_value=1, max_value=5),
+    )
+    def test_list_vouchers_paginated(self, config, api_auth_token, now, vouchers, limit):
+        """
+        A ``GET`` to the ``VoucherCollection`` with a ``limit`` query argument
+        returns at most that many vouchers and a cursor which can be used to
+        retrieve the next page.
+        """
+        agent = self._put_vouchers(config, api_auth_token, now, vouchers)
+
+        pages = []
+        url = b"http://127.0.0.1/voucher?limit={}".format(limit)
+        while True:
+            getting = authorized_request(api_auth_token, agent, b"GET", url)
+            self.assertThat(
+                getting,
+                succeeded(ok_response(headers=application_json())),
+            )
+            page = []
+            json_content(getting.result).addCallback(page.append)
+            self.assertThat(page, HasLength(1))
+            pages.append(page[0])
+            next_cursor = page[0][u"next-cursor"]
+            if next_cursor is None:
+                break
+            url = b"http://127.0.0.1/voucher?limit={}&cursor={}".format(
+                limit,
+                quote(next_cursor.encode("utf-8"), safe=b""),
+            )
+
+        self.expectThat(
+            list(
+                voucher[u"number"]
+                for page in pages
+                for voucher in page[u"vouchers"]
+            ),
+            Equals(sorted(vouchers)),
+        )
+        self.expectThat(
+            list(len(page[u"vouchers"]) for page in pages[:-1]),
+            AllMatch(Equals(limit)),
+        )
+
+    @given(
+        direct_tahoe_configs(),
+        api_auth_tokens(),
+        datetimes(),
+        lists(vouchers(), min_size=1, unique=True),
+    )
+    def test_list_vouchers_filtered(self, config, api_auth_token, now, vouchers):
+        """
+        A ``GET`` to the ``VoucherCollection`` with a ``state`` query argument
+        returns only vouchers in that state.
+        """
+        agent = self._put_vouchers(config, api_auth_token, now, vouchers)
+        for state, expected in [(b"redeemed", sorted(vouchers)), (b"pending", [])]:
+            getting = authorized_request(
+                api_auth_token,
+                agent,
+                b"GET",
+                b"http://127.0.0.1/voucher?state={}&order=-finished".format(state),
+            )
+            self.assertThat(
+                getting,
+                succeeded(
+                    MatchesAll(
+                        ok_response(headers=application_json()),
+                        AfterPreprocessing(
+                            json_content,
+                            succeeded(
+                                AfterPreprocessing(
+                                    lambda body: list(
+                                        voucher[u"number"]
+                                        for voucher
+                                        in body[u"vouchers"]
+                                    ),
+                                    # All of the vouchers finished at the same
+                                    # time so they are ordered by number.
+                                    Equals(list(reversed(expected))),
+                                ),
+                            ),
+                        ),
+                    ),
+                ),
+            )
+
+    @given(
+        direct_tahoe_configs(),
+        api_auth_tokens(),
+        datetimes(),
+        sampled_from([b"state=redeeming", b"order=number", b"limit=some", b"limit=-1"]),
+    )
+    def test_list_vouchers_invalid_query(self, config, api_auth_token, now, query):
+        """
+        A ``GET`` to the ``VoucherCollection`` with an unrecognized query
+        argument value receives a **BAD REQUEST** response.
+        """
+        agent = self._put_vouchers(config, api_auth_token, now, [])
+        getting = authorized_request(
+            api_auth_token,
+            agent,
+            b"GET",
+            b"http://127.0.0.1/voucher?" + query,
+        )
+        self.assertThat(
+            getting,
+            succeeded(bad_request_response()),
+        )
+
+    @given(
+        direct_tahoe_configs(),
+        api_auth_tokens(),
+        datetimes(),
+        vouchers(),
+        vouchers(),
+    )
+    def test_list_vouchers_not_modified(self, config, api_auth_token, now, voucher, another):
+        """
+        A ``GET`` to the ``VoucherCollection`` with an **If-None-Match** header
+        giving the **ETag** of an earlier response receives a **NOT
+        MODIFIED** response if no voucher has changed since then.
+        """
+        assume(voucher != another)
+        agent = self._put_vouchers(config, api_auth_token, now, [voucher])
+
+        def get(etag):
+            if etag is None:
+                headers = None
+            else:
+                headers = {u"if-none-match": [etag]}
+            return authorized_request(
+                api_auth_token,
+                agent,
+                b"GET",
+                b"http://127.0.0.1/voucher",
+                headers=headers,
+            )
+
+        getting = get(None)
+        self.assertThat(getting, succeeded(ok_response()))
+        [etag] = getting.result.headers.getRawHeaders(u"etag")
+
+        self.assertThat(get(etag), succeeded(match_response(NOT_MODIFIED, None)))
+
+        self._put_vouchers(config, api_auth_token, now, [another], agent)
+        self.assertThat(get(etag), succeeded(ok_response()))
+
+    def _put_vouchers(self, config, api_auth_token, now, vouchers, agent=None):
+        """
+        Redeem some vouchers using a new client root resource.
+
+        :return: An agent which issues requests to the root resource.
+        """
+        if agent is None:
+            add_api_token_to_config(
+                self.useFixture(TempDir()).join(b"tahoe"),
+                config,
+                api_auth_token,
+            )
+            agent = RequestTraversalAgent(root_from_config(config, lambda: now))
+        for voucher in vouchers:
+            putting = authorized_request(
+                api_auth_token,
+                agent,
+                b"PUT",
+                b"http://127.0.0.1/voucher",
+                data=BytesIO(dumps({u"voucher": voucher})),
+            )
+            self.assertThat(
+                putting,
+                succeeded(
+                    ok_response(),
+                ),
+            )
+        return agent
+
     def _test_list_vouchers(self, config, api_auth_token, now, vouchers, match_response_object):
         add_api_token_to_config(
             # Hypothesis causes our test case instances to be re-used many
@@ -50,6 +50,7 @@ from testtools.matchers import (
     HasLength,
     AfterPreprocessing,
     MatchesStructure,
+    MatchesListwise,
 )
 from testtools.twistedsupport import (
     succeeded,
@@ -76,6 +77,9 @@ from twisted.internet.defer import (
 from twisted.internet.task import (
     Clock,
 )
+from twisted.logger import (
+    Logger,
+)
 from twisted.web.iweb import (
     IAgent,
 )
@@ -122,6 +126,7 @@ from ..controller import (
 )
 
 from ..model import (
+    VoucherStore,
     UnblindedToken,
     Pending as model_Pending,
     Redeeming as model_Redeeming,
@@ -461,6 +466,54 @@ class PaymentControllerTests(TestCase):
             )),
         )
 
+    @given(tahoe_configs(), dummy_ristretto_keys(), datetimes(), vouchers())
+    def test_redeemed_despite_vacuum_failure(self, get_config, public_key, now, voucher):
+        """
+        A ``Voucher`` is marked as redeemed after ``IRedeemer.redeem`` succeeds
+        even if vacuuming the database afterwards fails.  The failure is
+        logged.
+        """
+        events = []
+        self.patch(PaymentController, "_log", Logger(observer=events.append))
+        store = self.useFixture(TemporaryVoucherStore(get_config, lambda: now)).store
+
+        def vacuum(self, pages=None):
+            raise Exception("The vacuum is broken.")
+        self.patch(VoucherStore, "vacuum", vacuum)
+
+        controller = PaymentController(
+            store,
+            DummyRedeemer(public_key),
+            default_token_count=100,
+            clock=Clock(),
+        )
+        self.assertThat(
+            controller.redeem(voucher),
+            succeeded(Always()),
+        )
+        self.expectThat(
+            store.get(voucher).state,
+            Equals(model_Redeemed(
+                finished=now,
+                token_count=100,
+                public_key=public_key,
+            )),
+        )
+        self.expectThat(
+            list(
+                event[u"log_failure"].value
+                for event
+                in events
+                if u"log_failure" in event
+            ),
+            MatchesListwise([
+                MatchesAll(
+                    IsInstance(Exception),
+                    AfterPreprocessing(str, Equals("The vacuum is broken.")),
+                ),
+            ]),
+        )
+
     @given(tahoe_configs(), datetimes(), vouchers())
     def test_double_spent_after_double_spend(self, get_config, now, voucher):
         """
@@ -530,6 +583,39 @@ class PaymentControllerTests(TestCase):
             IsInstance(model_Redeemed),
         )
 
+    def test_pending_check_failure_logged(self):
+        """
+        If ``PaymentController`` cannot read the pending vouchers from the
+        store when it is created, the failure is logged.
+        """
+        events = []
+        self.patch(PaymentController, "_log", Logger(observer=events.append))
+
+        class FailingStore(object):
+            def list_pending(self):
+                return fail(Exception("The store is broken."))
+
+        PaymentController(
+            FailingStore(),
+            DummyRedeemer(),
+            default_token_count=100,
+            clock=Clock(),
+        )
+        self.assertThat(
+            list(
+                event[u"log_failure"].value
+                for event
+                in events
+                if u"log_failure" in event
+            ),
+            MatchesListwise([
+                MatchesAll(
+                    IsInstance(Exception),
+                    AfterPreprocessing(str, Equals("The store is broken.")),
+                ),
+            ]),
+        )
+
     @given(
         tahoe_configs(),
         clocks(),
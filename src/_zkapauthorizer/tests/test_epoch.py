@@ -0,0 +1,93 @@
+# Copyright 2020 PrivateStorage.io, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for ``_zkapauthorizer._epoch``.
+"""
+
+from __future__ import (
+    absolute_import,
+)
+
+from datetime import (
+    datetime,
+    timedelta,
+)
+
+from testtools import (
+    TestCase,
+)
+from testtools.matchers import (
+    Equals,
+)
+
+from hypothesis import (
+    given,
+)
+from hypothesis.strategies import (
+    datetimes,
+    timedeltas,
+)
+
+from .._epoch import (
+    datetime_to_epoch,
+    epoch_to_datetime,
+)
+
+
+class EpochTests(TestCase):
+    """
+    Tests for ``datetime_to_epoch`` and ``epoch_to_datetime``.
+    """
+    @given(datetimes())
+    def test_roundtrip(self, when):
+        """
+        Times round-trip through ``datetime_to_epoch`` and
+        ``epoch_to_datetime``.
+        """
+        self.assertThat(
+            epoch_to_datetime(datetime_to_epoch(when)),
+            Equals(when),
+        )
+
+    @given(datetimes(), timedeltas(min_value=timedelta(0)))
+    def test_ordered(self, when, delta):
+        """
+        The difference between the numbers representing two times is the
+        number of microseconds between them.
+        """
+        try:
+            later = when + delta
+        except OverflowError:
+            later = datetime.max
+        self.assertThat(
+            datetime_to_epoch(later) - datetime_to_epoch(when),
+            Equals(
+                ((later - when).days * 86400 + (later - when).seconds) * 1000000 +
+                (later - when).microseconds
+            ),
+        )
+
+    def test_epoch(self):
+        """
+        The epoch is represented by zero and each microsecond after it by one
+        more.
+        """
+        self.assertThat(
+            list(
+                datetime_to_epoch(datetime(1970, 1, 1, 0, 0, 0, n))
+                for n
+                in range(3)
+            ),
+            Equals([0, 1, 2]),
+        )
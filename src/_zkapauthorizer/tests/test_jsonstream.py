@@ -0,0 +1,160 @@
+# Copyright 2020 PrivateStorage.io, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for ``_zkapauthorizer._jsonstream``.
+"""
+
+from __future__ import (
+    absolute_import,
+)
+
+from io import (
+    BytesIO,
+)
+from json import (
+    dumps,
+)
+
+from testtools import (
+    TestCase,
+)
+from testtools.matchers import (
+    Equals,
+    raises,
+)
+
+from hypothesis import (
+    given,
+)
+from hypothesis.strategies import (
+    lists,
+    text,
+    integers,
+    floats,
+    one_of,
+    sampled_from,
+)
+
+from .._jsonstream import (
+    iter_array,
+)
+
+
+def array_elements():
+    """
+    Build values which can be the elements of a JSON array.
+    """
+    return one_of(
+        text(),
+        integers(),
+        floats(allow_nan=False, allow_infinity=False),
+    )
+
+
+class IterArrayTests(TestCase):
+    """
+    Tests for ``iter_array``.
+    """
+    @given(
+        lists(array_elements()),
+        integers(min_value=1, max_value=16),
+        sampled_from([None, 2]),
+        sampled_from([False, True]),
+    )
+    def test_elements(self, elements, chunk_size, indent, ensure_ascii):
+        """
+        ``iter_array`` produces the elements of the array regardless of how
+        the document is formatted or split into chunks.
+        """
+        document = dumps(
+            {u"key": elements},
+            indent=indent,
+            ensure_ascii=ensure_ascii,
+        )
+        if isinstance(document, unicode):
+            document = document.encode("utf-8")
+        self.assertThat(
+            list(iter_array(BytesIO(document).read, u"key", chunk_size)),
+            Equals(elements),
+        )
+
+    @given(
+        lists(text(), min_size=1),
+        integers(min_value=1, max_value=16),
+    )
+    def test_truncated(self, elements, chunk_size):
+        """
+        ``iter_array`` raises ``ValueError`` if the document ends early.
+        """
+        document = dumps({u"key": elements})[:-1]
+        self.assertThat(
+            lambda: list(iter_array(BytesIO(document).read, u"key", chunk_size)),
+            raises(ValueError),
+        )
+
+    @given(
+        lists(array_elements()),
+        lists(array_elements()),
+        lists(array_elements()),
+        integers(min_value=1, max_value=16),
+    )
+    def test_other_properties(self, before, elements, after, chunk_size):
+        """
+        ``iter_array`` skips properties other than the expected one, wherever
+        they are in the object.
+        """
+        document = u"{{{}, {}, {}, {}}}".format(
+            dumps(u"before") + u": " + dumps({u"values": before}),
+            dumps(u"key") + u": " + dumps(elements),
+            dumps(u"after") + u": " + dumps(after),
+            dumps(u"total") + u": 3",
+        ).encode("utf-8")
+        self.assertThat(
+            list(iter_array(BytesIO(document).read, u"key", chunk_size)),
+            Equals(elements),
+        )
+
+    def test_repeated_key(self):
+        """
+        ``iter_array`` raises ``ValueError`` if the expected property appears
+        more than once.
+        """
+        document = b'{"key": [1], "key": [2]}'
+        self.assertThat(
+            lambda: list(iter_array(BytesIO(document).read, u"key")),
+            raises(ValueError),
+        )
+
+    def test_wrong_key(self):
+        """
+        ``iter_array`` raises ``ValueError`` if the object has no property with
+        the expected name.
+        """
+        document = dumps({u"other": []})
+        self.assertThat(
+            lambda: list(iter_array(BytesIO(document).read, u"key")),
+            raises(ValueError),
+        )
+
+    def test_extra_data(self):
+        """
+        ``iter_array`` raises ``ValueError`` if anything other than whitespace
+        follows the object.
+        """
+        document = dumps({u"key": [1]}) + b" []"
+        self.assertThat(
+            lambda: list(iter_array(BytesIO(document).read, u"key")),
+            raises(ValueError),
+        )
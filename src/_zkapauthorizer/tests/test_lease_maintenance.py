@@ -46,6 +46,7 @@ from testtools.matchers import (
 )
 from testtools.twistedsupport import (
     succeeded,
+    failed,
 )
 from fixtures import (
     TempDir,
@@ -74,6 +75,7 @@ from twisted.internet.task import (
 )
 from twisted.internet.defer import (
     succeed,
+    fail,
     maybeDeferred,
 )
 from twisted.application.service import (
@@ -107,10 +109,14 @@ from .strategies import (
     node_hierarchies,
 )
 
+from .. import (
+    lease_maintenance,
+)
 from ..lease_maintenance import (
     NoopMaintenanceObserver,
     MemoryMaintenanceObserver,
     lease_maintenance_service,
+    needs_lease_renew,
     maintain_leases_from_root,
     visit_storage_indexes_from_root,
     renew_leases,
@@ -494,6 +500,143 @@ class RenewLeasesTests(TestCase):
         )
 
 
+    @given(storage_brokers(clocks()), lists(leaf_nodes(), min_size=1))
+    def test_interrupted(self, storage_broker, nodes):
+        """
+        If ``renew_leases`` fails part of the way through then the observer is
+        flushed but not finished.
+        """
+        class BrokenStorageServer(object):
+            def stat_shares(self, storage_indexes):
+                return fail(Exception("Server went away"))
+
+        storage_broker = DummyStorageBroker(
+            storage_broker.clock,
+            storage_broker.get_connected_servers() + [
+                DummyServer(BrokenStorageServer()),
+            ],
+        )
+        secret_holder = SecretHolder(b"\0" * CRYPTO_VAL_SIZE, b"\1" * CRYPTO_VAL_SIZE)
+        observer = MemoryMaintenanceObserver()
+
+        def visit_assets(visit):
+            for node in nodes:
+                visit(node.get_storage_index())
+            return succeed(None)
+
+        d = renew_leases(
+            visit_assets,
+            storage_broker,
+            secret_holder,
+            timedelta(days=3),
+            lambda: observer,
+            lambda: datetime.utcfromtimestamp(storage_broker.clock.seconds()),
+        )
+        self.expectThat(
+            d,
+            failed(AfterPreprocessing(
+                lambda f: f.getErrorMessage(),
+                Equals("Server went away"),
+            )),
+        )
+        self.expectThat(observer.flushed, Equals(True))
+        self.expectThat(observer.finished, Equals(False))
+
+    @given(storage_brokers(clocks()), lists(leaf_nodes(), min_size=1))
+    def test_interrupted_flush_fails(self, storage_broker, nodes):
+        """
+        If ``renew_leases`` fails part of the way through and then flushing the
+        observer fails too, the flush failure is logged and ``renew_leases``
+        fails with the original error.
+        """
+        class BrokenStorageServer(object):
+            def stat_shares(self, storage_indexes):
+                return fail(Exception("Server went away"))
+
+        class BrokenObserver(MemoryMaintenanceObserver):
+            def flush(self):
+                return fail(Exception("Database went away"))
+
+        logged = []
+        self.patch(
+            lease_maintenance,
+            "err",
+            lambda reason, why: logged.append((reason.value, why)),
+        )
+
+        storage_broker = DummyStorageBroker(
+            storage_broker.clock,
+            storage_broker.get_connected_servers() + [
+                DummyServer(BrokenStorageServer()),
+            ],
+        )
+        secret_holder = SecretHolder(b"\0" * CRYPTO_VAL_SIZE, b"\1" * CRYPTO_VAL_SIZE)
+        observer = BrokenObserver()
+
+        def visit_assets(visit):
+            for node in nodes:
+                visit(node.get_storage_index())
+            return succeed(None)
+
+        d = renew_leases(
+            visit_assets,
+            storage_broker,
+            secret_holder,
+            timedelta(days=3),
+            lambda: observer,
+            lambda: datetime.utcfromtimestamp(storage_broker.clock.seconds()),
+        )
+        self.expectThat(
+            d,
+            failed(AfterPreprocessing(
+                lambda f: f.getErrorMessage(),
+                Equals("Server went away"),
+            )),
+        )
+        self.expectThat(
+            list(str(exc) for (exc, why) in logged),
+            Equals(["Database went away"]),
+        )
+        self.expectThat(observer.finished, Equals(False))
+
+    @given(storage_brokers(clocks()), lists(leaf_nodes()))
+    def test_renewals_observed(self, storage_broker, nodes):
+        """
+        ``renew_leases`` tells the observer which of the storage indexes it
+        finds had their leases renewed.
+        """
+        secret_holder = SecretHolder(b"\0" * CRYPTO_VAL_SIZE, b"\1" * CRYPTO_VAL_SIZE)
+        min_lease_remaining = timedelta(days=3)
+        now = datetime.utcfromtimestamp(storage_broker.clock.seconds())
+        observer = MemoryMaintenanceObserver()
+
+        storage_indexes = set(node.get_storage_index() for node in nodes)
+        expected = sum(
+            needs_lease_renew(min_lease_remaining, stat, now)
+            for server in storage_broker.get_connected_servers()
+            for (storage_index, stat) in server.get_storage_server().buckets.items()
+            if storage_index in storage_indexes
+        )
+
+        def visit_assets(visit):
+            for storage_index in storage_indexes:
+                visit(storage_index)
+            return succeed(None)
+
+        self.assertThat(
+            renew_leases(
+                visit_assets,
+                storage_broker,
+                secret_holder,
+                min_lease_remaining,
+                lambda: observer,
+                lambda: now,
+            ),
+            succeeded(Always()),
+        )
+        self.assertThat(observer.renewed, Equals(expected))
+
+
 class MaintainLeasesFromRootTests(TestCase):
     """
     Tests for ``maintain_leases_from_root``.
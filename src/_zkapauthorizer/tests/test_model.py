@@ -24,6 +24,12 @@ from __future__ import (
 from os import (
     mkdir,
 )
+from sys import (
+    executable,
+)
+from subprocess import (
+    Popen,
+)
 from errno import (
     EACCES,
 )
@@ -31,7 +37,20 @@ from datetime import (
     datetime,
     timedelta,
 )
+from base64 import (
+    b64encode,
+    urlsafe_b64encode,
+)
+from io import (
+    BytesIO,
+)
 
+import attr
+
+from sqlite3 import (
+    Binary,
+    connect,
+)
 from unittest import (
     skipIf,
 )
@@ -40,6 +59,7 @@ from testtools import (
     TestCase,
 )
 from testtools.matchers import (
+    AllMatch,
     Always,
     HasLength,
     AfterPreprocessing,
@@ -48,6 +68,11 @@ from testtools.matchers import (
     Equals,
     Raises,
     IsInstance,
+    LessThan,
+    GreaterThan,
+    MatchesDict,
+    ContainsDict,
+    Not,
 )
 from testtools.twistedsupport import (
     succeeded,
@@ -57,6 +82,10 @@ from fixtures import (
     TempDir,
 )
 
+from eliot.testing import (
+    LoggedAction,
+)
+
 from hypothesis import (
     note,
     given,
@@ -78,40 +107,77 @@ from hypothesis.strategies import (
     timedeltas,
     integers,
     randoms,
+    just,
+    none,
+    one_of,
+    sampled_from,
 )
 
 from twisted.python.runtime import (
     platform,
 )
+from twisted.python.filepath import (
+    FilePath,
+)
+from twisted.internet.defer import (
+    maybeDeferred,
+)
 
 from ..model import (
     StoreOpenError,
     NotEnoughTokens,
     VoucherStore,
+    AsyncVoucherStore,
+    StorageProfile,
+    open_and_initialize,
     Voucher,
     Pending,
     DoubleSpend,
     Redeemed,
     LeaseMaintenanceActivity,
+    UnblindedToken,
+    RandomToken,
+    Pass,
     memory_connect,
+    _trusted,
+)
+from .._base64 import (
+    b64_to_blob,
+)
+from ..schema import (
+    _UPGRADES,
+    get_schema_version,
+    get_schema_upgrades,
+    run_schema_upgrades,
 )
 from ..controller import (
     DummyRedeemer,
+    dummy_random_tokens,
 )
 from .strategies import (
     tahoe_configs,
+    direct_tahoe_configs,
     vouchers,
     voucher_objects,
     voucher_counters,
     random_tokens,
     unblinded_tokens,
+    zkaps,
     posix_safe_datetimes,
     dummy_ristretto_keys,
     pass_counts,
+    client_dummyredeemer_configurations,
+)
+from ..eliot import (
+    FULL_VACUUM,
+)
+from .eliot import (
+    capture_logging,
 )
 from .fixtures import (
     TemporaryVoucherStore,
     ConfiglessMemoryVoucherStore,
+    LocalTimezone,
 )
 from .matchers import (
     raises,
@@ -262,6 +328,241 @@ class VoucherStoreTests(TestCase):
             )),
         )
 
+    @given(tahoe_configs(), datetimes(), lists(vouchers(), unique=True), data())
+    def test_list_pending(self, get_config, now, vouchers, data):
+        """
+        ``VoucherStore.list_pending`` returns a ``list`` containing a
+        ``Voucher`` object for each voucher previously added which has not
+        finished redemption.
+        """
+        tokens = iter(data.draw(
+            lists(
+                random_tokens(),
+                unique=True,
+                min_size=len(vouchers),
+                max_size=len(vouchers),
+            ),
+        ))
+        double_spent = data.draw(
+            lists(booleans(), min_size=len(vouchers), max_size=len(vouchers)),
+        )
+        store = self.useFixture(TemporaryVoucherStore(get_config, lambda: now)).store
+        for voucher, spent in zip(vouchers, double_spent):
+            store.add(
+                voucher,
+                expected_tokens=1,
+                counter=0,
+                get_tokens=lambda: [next(tokens)],
+            )
+            if spent:
+                store.mark_voucher_double_spent(voucher)
+
+        self.assertThat(
+            store.list_pending(),
+            Equals(list(
+                Voucher(number, expected_tokens=1, created=now)
+                for (number, spent)
+                # All of the vouchers were added at the same time so they
+                # are ordered by number.
+                in sorted(zip(vouchers, double_spent))
+                if not spent
+            )),
+        )
+
+    @given(
+        lists(
+            tuples(
+                vouchers(),
+                integers(min_value=0, max_value=5),
+                one_of(none(), integers(min_value=0, max_value=5)),
+            ),
+            unique_by=lambda t: t[0],
+        ),
+        sampled_from([None, u"pending", u"double-spend"]),
+        sampled_from([u"created", u"finished"]),
+        booleans(),
+        integers(min_value=1, max_value=5),
+    )
+    def test_list_page(self, vouchers, state, order, descending, limit):
+        """
+        Reading every page from ``VoucherStore.list_page`` gives the vouchers
+        in the selected state ordered by the selected time and then by
+        number, with vouchers which have not finished first.
+        """
+        epoch = datetime(2020, 1, 1)
+        times = []
+        store = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), lambda: times[-1]),
+        ).store
+        for (number, created, finished) in vouchers:
+            times.append(epoch + timedelta(seconds=created))
+            store.add(number, 1, 0, lambda: [])
+            if finished is not None:
+                times.append(epoch + timedelta(seconds=finished))
+                store.mark_voucher_double_spent(number)
+
+        def position(voucher):
+            if order == u"created":
+                return (voucher.created, voucher.number)
+            finished = getattr(voucher.state, "finished", None)
+            return (finished is not None, finished, voucher.number)
+
+        expected = sorted(
+            (
+                voucher
+                for voucher
+                in store.list()
+                if state is None or voucher.state.to_json_v1()[u"name"] == state
+            ),
+            key=position,
+            reverse=descending,
+        )
+
+        pages = []
+        after = None
+        while True:
+            page = store.list_page(state, order, descending, after, limit)
+            pages.append(page)
+            if len(page) < limit:
+                break
+            after = page[-1].number
+
+        self.expectThat(
+            list(voucher for page in pages for voucher in page),
+            Equals(expected),
+        )
+        self.expectThat(
+            list(len(page) for page in pages[:-1]),
+            AllMatch(Equals(limit)),
+        )
+
+    def test_list_page_invalid(self):
+        """
+        ``VoucherStore.list_page`` raises ``ValueError`` for an unrecognized
+        state or order and ``KeyError`` for a cursor which is not a known
+        voucher.
+        """
+        store = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        ).store
+        self.expectThat(
+            lambda: store.list_page(state=u"redeeming"),
+            raises(ValueError),
+        )
+        self.expectThat(
+            lambda: store.list_page(order=u"number"),
+            raises(ValueError),
+        )
+        self.expectThat(
+            lambda: store.list_page(after=u"unknown"),
+            raises(KeyError),
+        )
+
+    def test_vouchers_version(self):
+        """
+        ``VoucherStore.vouchers_version`` changes when a voucher is added or
+        changed and otherwise stays the same.
+        """
+        store = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        ).store
+        voucher = urlsafe_b64encode(b"\0" * 32).decode("ascii")
+        versions = [store.vouchers_version()]
+        store.add(voucher, 1, 0, lambda: [])
+        versions.append(store.vouchers_version())
+        store.list()
+        versions.append(store.vouchers_version())
+        store.mark_voucher_double_spent(voucher)
+        versions.append(store.vouchers_version())
+        self.assertThat(
+            versions,
+            MatchesAll(
+                AfterPreprocessing(lambda v: v[1] != v[0], Equals(True)),
+                AfterPreprocessing(lambda v: v[2] == v[1], Equals(True)),
+                AfterPreprocessing(lambda v: v[3] != v[2], Equals(True)),
+            ),
+        )
+
+    def test_upgrade_replaces_referenced_tables(self):
+        """
+        ``open_and_initialize`` can upgrade a database in which rows refer to
+        rows of a table which the upgrade replaces.
+        """
+        # Times written before the upgrade are local.
+        self.useFixture(LocalTimezone(b"EST+05"))
+        path = FilePath(self.useFixture(TempDir()).join(b"store.sqlite3"))
+        number = urlsafe_b64encode(b"\0" * 32).decode("ascii")
+        conn = connect(path.path)
+        with conn:
+            cursor = conn.cursor()
+            upgrades = list(get_schema_upgrades(get_schema_version(cursor)))
+            # Stop short of the upgrade which replaces [vouchers].
+            run_schema_upgrades(upgrades[:upgrades.index(_UPGRADES[13][0])], cursor)
+            cursor.execute(
+                """
+                INSERT INTO [vouchers] ([number], [created]) VALUES (?, ?)
+                """,
+                (number, u"2020-01-01 00:00:00"),
+            )
+            cursor.execute(
+                """
+                INSERT INTO [tokens] ([text], [voucher], [counter]) VALUES (?, ?, ?)
+                """,
+                (Binary(b"x" * 32), number, 0),
+            )
+        conn.close()
+
+        store = VoucherStore(
+            1000000,
+            path,
+            datetime.now,
+            open_and_initialize(path),
+        )
+        self.assertThat(
+            store.get(number),
+            Equals(Voucher(number, expected_tokens=32768, created=datetime(2020, 1, 1, 5))),
+        )
+        self.assertThat(
+            store._connection.execute("PRAGMA foreign_key_check").fetchall(),
+            Equals([]),
+        )
+
+    def test_add_cost_independent_of_vouchers(self):
+        """
+        The cost of ``VoucherStore.add`` for a redemption group does not depend
+        on how many other vouchers have been added.
+        """
+        configless = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        )
+        store = configless.store
+        numbers = list(
+            urlsafe_b64encode(u"{:0>32}".format(n).encode("ascii")).decode("ascii")
+            for n
+            in range(201)
+        )
+        def add(number):
+            return store.add(
+                number,
+                expected_tokens=10,
+                counter=0,
+                get_tokens=lambda: dummy_random_tokens(
+                    Voucher(number, expected_tokens=10),
+                    0,
+                    10,
+                ),
+            )
+
+        add(numbers[0])
+        few_vouchers = vm_steps(store._connection, lambda: add(numbers[0]))
+        for number in numbers[1:]:
+            add(number)
+        many_vouchers = vm_steps(store._connection, lambda: add(numbers[0]))
+        self.assertThat(
+            many_vouchers,
+            LessThan(few_vouchers * 2),
+        )
+
     @skipIf(platform.isWindows(), "Hard to prevent directory creation on Windows")
     @given(tahoe_configs(), datetimes())
     def test_uncreateable_store_directory(self, get_config, now):
@@ -329,6 +630,27 @@ class VoucherStoreTests(TestCase):
             raises(StoreOpenError),
         )
 
+    @given(
+        tahoe_configs(
+            client_dummyredeemer_configurations().map(
+                lambda config: dict(config, **{u"lease-maintenance-history-days": u"-1"}),
+            ),
+        ),
+        datetimes(),
+    )
+    def test_negative_lease_maintenance_retention(self, get_config, now):
+        """
+        ``VoucherStore.from_node_config`` raises ``ValueError`` if the node is
+        configured to keep lease maintenance records for a negative number of
+        days.
+        """
+        tempdir = self.useFixture(TempDir())
+        config = get_config(tempdir.join(b"node"), b"tub.port")
+        self.assertThat(
+            lambda: VoucherStore.from_node_config(config, lambda: now),
+            raises(ValueError),
+        )
+
     @given(tahoe_configs(), vouchers(), dummy_ristretto_keys(), datetimes(), data())
     def test_spend_order_equals_backup_order(self, get_config, voucher_value, public_key, now, data):
         """
@@ -416,6 +738,86 @@ class VoucherStoreTests(TestCase):
         )
 
 
+class StorageProfileTests(TestCase):
+    """
+    Tests for ``StorageProfile``.
+    """
+    @given(direct_tahoe_configs())
+    def test_default(self, node_config):
+        """
+        ``StorageProfile.from_node_config`` returns the default profile if no
+        storage profile options are configured.
+        """
+        self.assertThat(
+            StorageProfile.from_node_config(node_config),
+            Equals(StorageProfile()),
+        )
+
+    @given(
+        direct_tahoe_configs(just({
+            u"redeemer": u"dummy",
+            u"database-journal-mode": u"DELETE",
+            u"database-synchronous": u"normal",
+            u"database-mmap-size": u"1048576",
+            u"database-cache-size": u"-4000",
+        })),
+    )
+    def test_configured(self, node_config):
+        """
+        ``StorageProfile.from_node_config`` reads each setting from the
+        plugin's client section.
+        """
+        self.assertThat(
+            StorageProfile.from_node_config(node_config),
+            Equals(StorageProfile(
+                journal_mode=u"delete",
+                synchronous=u"normal",
+                mmap_size=2 ** 20,
+                cache_size=-4000,
+            )),
+        )
+
+    @given(
+        direct_tahoe_configs(just({
+            u"redeemer": u"dummy",
+            u"database-journal-mode": u"off",
+        })),
+    )
+    def test_unsafe_journal_mode(self, node_config):
+        """
+        ``StorageProfile.from_node_config`` raises ``ValueError`` if a journal
+        mode which can corrupt the database is configured.
+        """
+        self.assertThat(
+            lambda: StorageProfile.from_node_config(node_config),
+            raises(ValueError),
+        )
+
+    def test_applied(self):
+        """
+        ``open_and_initialize`` configures the connection according to the
+        given profile.
+        """
+        path = FilePath(self.useFixture(TempDir()).join(b"store.sqlite3"))
+        conn = open_and_initialize(
+            path,
+            profile=StorageProfile(synchronous=u"normal", cache_size=-1234),
+        )
+        self.expectThat(
+            conn.execute("PRAGMA journal_mode").fetchall(),
+            Equals([(u"wal",)]),
+        )
+        self.expectThat(
+            conn.execute("PRAGMA synchronous").fetchall(),
+            # NORMAL
+            Equals([(1,)]),
+        )
+        self.expectThat(
+            conn.execute("PRAGMA cache_size").fetchall(),
+            Equals([(-1234,)]),
+        )
+
+
 class UnblindedTokenStateMachine(RuleBasedStateMachine):
     """
     Transition rules for a state machine corresponding to the state of
@@ -426,10 +828,11 @@ class UnblindedTokenStateMachine(RuleBasedStateMachine):
         super(UnblindedTokenStateMachine, self).__init__()
         self.case = case
         self.redeemer = DummyRedeemer()
+        # Time only passes when reservations are allowed to expire.
+        self.now = datetime.utcnow()
         self.configless = ConfiglessMemoryVoucherStore(
             self.redeemer,
-            # Time probably not actually relevant to this state machine.
-            datetime.now,
+            lambda: self.now,
         )
         self.configless.setUp()
 
@@ -537,23 +940,12 @@ class UnblindedTokenStateMachine(RuleBasedStateMachine):
         self.invalid.extend(to_invalidate)
 
     @rule()
-    def discard_ephemeral_state(self):
+    def expire_reservations(self):
         """
-        Reset all state that cannot outlive a single process, simulating a
-        restart.
-
-        XXX We have to reach into the guts of ``VoucherStore`` to do this
-        because we're using an in-memory database.  We can't just open a new
-        ``VoucherStore``. :/ Perhaps we should use an on-disk database...  Or
-        maybe this is a good argument for using an explicitly attached
-        temporary database instead of the built-in ``temp`` database.
+        Let enough time pass for the reservations of all in-use tokens to
+        expire, as happens when the process holding them goes away.
         """
-        with self.configless.store._connection:
-            self.configless.store._connection.execute(
-                """
-                DELETE FROM [in-use]
-                """,
-            )
+        self.now += self.configless.store.reservation_lease
         self.available += len(self.using)
         del self.using[:]
 
@@ -661,6 +1053,8 @@ class LeaseMaintenanceTests(TestCase):
                 started,
                 passes_required,
                 finished,
+                len(sizes),
+                0,
             )
 
         self.assertThat(
@@ -668,6 +1062,196 @@ class LeaseMaintenanceTests(TestCase):
             Equals(expected),
         )
 
+    def _recorded(self, store):
+        """
+        :return list[(int, bool)]: The pass count of each lease maintenance
+            run recorded in the database and whether the run has finished.
+        """
+        return list(
+            (count, finished is not None)
+            for (count, finished)
+            in store._connection.execute(
+                """
+                SELECT [count], [finished] FROM [lease-maintenance-spending] ORDER BY [id]
+                """,
+            )
+        )
+
+    def test_observations_batched(self):
+        """
+        ``LeaseMaintenance.observe`` holds observations in memory until
+        ``flush_every`` of them have been made.  ``flush`` and ``finish``
+        record any which are being held.
+        """
+        store = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        ).store
+        x = store.start_lease_maintenance()
+        x.flush_every = 3
+
+        x.observe([store.pass_value])
+        x.observe([store.pass_value])
+        self.expectThat(self._recorded(store), Equals([(0, False)]))
+        x.observe([store.pass_value])
+        self.expectThat(self._recorded(store), Equals([(3, False)]))
+        x.observe([store.pass_value])
+        x.flush()
+        self.expectThat(self._recorded(store), Equals([(4, False)]))
+        x.observe([store.pass_value])
+        x.finish()
+        self.expectThat(self._recorded(store), Equals([(5, True)]))
+
+    def test_observations_flushed_after_interval(self):
+        """
+        ``LeaseMaintenance.observe`` records the observations held in memory
+        once ``flush_interval`` has passed since they were last recorded.
+        """
+        now = [datetime(2020, 1, 1)]
+        store = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), lambda: now[0]),
+        ).store
+        x = store.start_lease_maintenance()
+
+        x.observe([store.pass_value])
+        self.expectThat(self._recorded(store), Equals([(0, False)]))
+        now[0] += x.flush_interval
+        x.observe([store.pass_value])
+        self.expectThat(self._recorded(store), Equals([(2, False)]))
+
+    def _run(self, store, now, started, finished, renewed):
+        """
+        Record a lease maintenance run which observes one share of each of the
+        given sizes.
+
+        :param list[datetime] now: A one-element list holding the time
+            ``store`` considers current.
+
+        :param list[bool] renewed: Whether the lease on each share observed
+            is renewed.
+        """
+        now[0] = started
+        x = store.start_lease_maintenance()
+        for r in renewed:
+            x.observe([store.pass_value], r)
+        now[0] = finished
+        x.finish()
+
+    def test_history(self):
+        """
+        ``VoucherStore.get_lease_maintenance_history`` returns the runs which
+        finished in the given range of time, earliest first, with the number
+        of storage indexes checked and renewed during each.
+        """
+        now = [None]
+        store = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), lambda: now[0]),
+        ).store
+        day = timedelta(days=1)
+        start = datetime(2020, 1, 1)
+        for n in range(5):
+            self._run(
+                store,
+                now,
+                start + n * day,
+                start + n * day + timedelta(hours=n),
+                [True] * n + [False],
+            )
+
+        expected = list(
+            LeaseMaintenanceActivity(
+                start + n * day,
+                n + 1,
+                start + n * day + timedelta(hours=n),
+                n + 1,
+                n,
+            )
+            for n
+            in range(5)
+        )
+        self.expectThat(
+            store.get_lease_maintenance_history(),
+            Equals(expected),
+        )
+        self.expectThat(
+            store.get_lease_maintenance_history(
+                since=start + day,
+                until=start + 3 * day + timedelta(hours=3),
+            ),
+            Equals(expected[1:3]),
+        )
+        self.expectThat(
+            store.get_lease_maintenance_history(since=start + 2 * day, limit=2),
+            Equals(expected[2:4]),
+        )
+        self.expectThat(
+            list(activity.duration for activity in expected),
+            Equals(list(timedelta(hours=n) for n in range(5))),
+        )
+
+    def test_history_excludes_unfinished(self):
+        """
+        ``VoucherStore.get_lease_maintenance_history`` does not include runs
+        which have not finished.
+        """
+        store = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        ).store
+        store.start_lease_maintenance().observe([store.pass_value])
+        self.assertThat(
+            store.get_lease_maintenance_history(),
+            Equals([]),
+        )
+
+    def test_prune_history(self):
+        """
+        ``VoucherStore.prune_lease_maintenance_history`` deletes the runs which
+        finished before the given time and the unfinished runs which started
+        before it.
+        """
+        now = [datetime(2020, 1, 1)]
+        store = attr.evolve(
+            self.useFixture(
+                ConfiglessMemoryVoucherStore(DummyRedeemer(), lambda: now[0]),
+            ).store,
+            lease_maintenance_retention=None,
+        )
+        # An abandoned run.
+        store.start_lease_maintenance()
+        for n in range(1, 4):
+            when = datetime(2020, 1, 1 + 2 * n)
+            self._run(store, now, when, when, [])
+        store.prune_lease_maintenance_history(datetime(2020, 1, 6))
+
+        self.expectThat(
+            list(a.finished for a in store.get_lease_maintenance_history()),
+            Equals([datetime(2020, 1, 7)]),
+        )
+        self.expectThat(
+            self._recorded(store),
+            Equals([(0, True)]),
+        )
+
+    def test_retention(self):
+        """
+        ``VoucherStore.start_lease_maintenance`` deletes the runs which finished
+        more than ``lease_maintenance_retention`` ago.
+        """
+        now = [None]
+        store = attr.evolve(
+            self.useFixture(
+                ConfiglessMemoryVoucherStore(DummyRedeemer(), lambda: now[0]),
+            ).store,
+            lease_maintenance_retention=timedelta(days=10),
+        )
+        start = datetime(2020, 1, 1)
+        for n in range(4):
+            self._run(store, now, start + n * timedelta(days=6), start + n * timedelta(days=6), [])
+
+        self.assertThat(
+            list(a.finished for a in store.get_lease_maintenance_history()),
+            Equals([start + timedelta(days=12), start + timedelta(days=18)]),
+        )
+
 
 class VoucherTests(TestCase):
     """
@@ -683,33 +1267,118 @@ class VoucherTests(TestCase):
             Equals(reference),
         )
 
-
-def paired_tokens(data, sizes=integers(min_value=1, max_value=1000)):
-    """
-    Draw two lists of the same length, one of random tokens and one of
-    unblinded tokens.
-
-    :rtype: ([RandomTokens], [UnblindedTokens])
-    """
-    num_tokens = data.draw(sizes)
-    r = data.draw(lists(
-        random_tokens(),
-        min_size=num_tokens,
-        max_size=num_tokens,
-        unique=True,
-    ))
-    u = data.draw(lists(
-        unblinded_tokens(),
-        min_size=num_tokens,
-        max_size=num_tokens,
-        unique=True,
-    ))
-    return r, u
+    @given(voucher_objects())
+    def test_trusted(self, reference):
+        """
+        ``Voucher.trusted`` creates a ``Voucher`` equal to the one the
+        validating initializer creates from the same values.
+        """
+        self.assertThat(
+            Voucher.trusted(
+                reference.number,
+                reference.expected_tokens,
+                reference.created,
+                reference.state,
+            ),
+            Equals(reference),
+        )
 
 
-class UnblindedTokenStoreTests(TestCase):
+class TrustedConstructionTests(TestCase):
     """
-    Tests for ``UnblindedToken``-related functionality of ``VoucherStore``.
+    Tests for the ``trusted`` constructors of ``UnblindedToken``,
+    ``RandomToken``, and ``Pass``.
+    """
+    @given(unblinded_tokens(), random_tokens(), zkaps())
+    def test_equal(self, unblinded_token, random_token, zkap):
+        """
+        The ``trusted`` constructor of each class creates an instance equal to
+        the one the validating initializer creates from the same values.
+        """
+        self.expectThat(
+            UnblindedToken.trusted(unblinded_token.unblinded_token),
+            Equals(unblinded_token),
+        )
+        self.expectThat(
+            RandomToken.trusted(random_token.token_value),
+            Equals(random_token),
+        )
+        self.expectThat(
+            Pass.trusted(zkap.preimage, zkap.signature),
+            Equals(zkap),
+        )
+
+    def test_unvalidated(self):
+        """
+        The ``trusted`` constructors do not validate their arguments but the
+        initializers still do.
+        """
+        self.expectThat(
+            lambda: UnblindedToken(u"x"),
+            raises(TypeError),
+        )
+        self.expectThat(
+            UnblindedToken.trusted(u"x").unblinded_token,
+            Equals(u"x"),
+        )
+        self.expectThat(
+            RandomToken.trusted(u"x").token_value,
+            Equals(u"x"),
+        )
+        self.expectThat(
+            Pass.trusted(u"x", u"y").pass_text,
+            Equals(u"x y"),
+        )
+
+    def test_frozen(self):
+        """
+        Instances created by the ``trusted`` constructors are as immutable as
+        any others.
+        """
+        token = UnblindedToken.trusted(u"x")
+        def mutate():
+            token.unblinded_token = u"y"
+        self.assertThat(
+            mutate,
+            raises(attr.exceptions.FrozenInstanceError),
+        )
+
+    def test_missing_values(self):
+        """
+        ``_trusted`` refuses to create an instance with some attributes unset.
+        """
+        self.assertThat(
+            lambda: _trusted(Pass, u"x"),
+            raises(TypeError),
+        )
+
+
+def paired_tokens(data, sizes=integers(min_value=1, max_value=1000)):
+    """
+    Draw two lists of the same length, one of random tokens and one of
+    unblinded tokens.
+
+    :rtype: ([RandomTokens], [UnblindedTokens])
+    """
+    num_tokens = data.draw(sizes)
+    r = data.draw(lists(
+        random_tokens(),
+        min_size=num_tokens,
+        max_size=num_tokens,
+        unique=True,
+    ))
+    u = data.draw(lists(
+        unblinded_tokens(),
+        min_size=num_tokens,
+        max_size=num_tokens,
+        unique=True,
+    ))
+    return r, u
+
+
+class UnblindedTokenStoreTests(TestCase):
+    """
+    Tests for ``UnblindedToken``-related functionality of ``VoucherStore``.
     """
     @given(
         tahoe_configs(),
@@ -803,6 +1472,80 @@ class UnblindedTokenStoreTests(TestCase):
             ),
         )
 
+    @given(
+        tahoe_configs(),
+        datetimes(),
+        vouchers(),
+        dummy_ristretto_keys(),
+        booleans(),
+        data(),
+    )
+    def test_random_tokens_discarded(self, get_config, now, voucher_value, public_key, completed, data):
+        """
+        The random tokens for a redemption group are discarded when the unblinded
+        tokens resulting from the group are stored.
+        """
+        random, unblinded = paired_tokens(data)
+        store = self.useFixture(TemporaryVoucherStore(get_config, lambda: now)).store
+        store.add(voucher_value, len(random), 0, lambda: random)
+        store.insert_unblinded_tokens_for_voucher(voucher_value, public_key, unblinded, completed)
+
+        cursor = store._connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM [tokens]")
+        self.assertThat(
+            cursor.fetchall(),
+            Equals([(0,)]),
+        )
+
+    @given(
+        tahoe_configs(),
+        datetimes(),
+        vouchers(),
+        dummy_ristretto_keys(),
+        data(),
+    )
+    def test_vacuum(self, get_config, now, voucher_value, public_key, data):
+        """
+        ``VoucherStore.vacuum`` releases the space freed by discarded rows.
+        """
+        random, unblinded = paired_tokens(data)
+        store = self.useFixture(TemporaryVoucherStore(get_config, lambda: now)).store
+        store.add(voucher_value, len(random), 0, lambda: random)
+        store.insert_unblinded_tokens_for_voucher(voucher_value, public_key, unblinded, True)
+        store.discard_unblinded_tokens(unblinded)
+        self.assertThat(
+            store.vacuum(),
+            Equals(0),
+        )
+
+    @capture_logging(lambda self, logger: logger.validate())
+    def test_enable_incremental_vacuum(self, logger):
+        """
+        ``VoucherStore.enable_incremental_vacuum`` rewrites a database which
+        does not use incremental vacuuming, once, so that it does.
+        ``VoucherStore.vacuum`` leaves such a database alone.
+        """
+        store = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.utcnow),
+        ).store
+        store._connection.execute("PRAGMA auto_vacuum = NONE")
+        store._connection.execute("VACUUM")
+
+        def auto_vacuum():
+            [(mode,)] = store._connection.execute("PRAGMA auto_vacuum").fetchall()
+            return mode
+
+        self.expectThat(auto_vacuum(), Equals(0))
+        store.vacuum()
+        self.expectThat(auto_vacuum(), Equals(0))
+        self.expectThat(store.enable_incremental_vacuum(), Equals(True))
+        self.expectThat(store.enable_incremental_vacuum(), Equals(False))
+        self.expectThat(auto_vacuum(), Equals(2))
+        self.expectThat(
+            LoggedAction.of_type(logger.messages, FULL_VACUUM),
+            HasLength(1),
+        )
+
     @given(
         tahoe_configs(),
         datetimes(),
@@ -908,6 +1651,745 @@ class UnblindedTokenStoreTests(TestCase):
         )
 
 
+    def test_invalidate_cost_independent_of_history(self):
+        """
+        The cost of ``invalidate_unblinded_tokens`` depends on the number of
+        tokens being invalidated, not on the number of tokens which have been
+        invalidated before.
+        """
+        configless = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        )
+        store = configless.store
+        tokens = dummy_unblinded_tokens(20)
+        store.insert_unblinded_tokens(list(t.unblinded_token for t in tokens))
+
+        def invalidate(tokens):
+            return vm_steps(
+                store._connection,
+                lambda: store.invalidate_unblinded_tokens(u"reason", tokens),
+            )
+
+        short_history = invalidate(tokens[:10])
+
+        # Record a long history of invalid tokens, as there may be after the
+        # issuer rotates its key.
+        with store._connection:
+            store._connection.executemany(
+                """
+                INSERT INTO [invalid-unblinded-tokens] VALUES (?, ?)
+                """,
+                list(
+                    (Binary(b"history-{:0>88}".format(n)), u"reason")
+                    for n
+                    in range(100000)
+                ),
+            )
+
+        long_history = invalidate(tokens[10:])
+        self.assertThat(
+            long_history,
+            LessThan(short_history * 2),
+        )
+
+    def test_get_unblinded_token_page(self):
+        """
+        ``get_unblinded_token_page`` returns tokens in the order they will be
+        used, starting after the given key, and the cost of reading a page
+        does not depend on how many tokens come before it.
+        """
+        configless = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        )
+        store = configless.store
+        tokens = list(t.unblinded_token for t in dummy_unblinded_tokens(1000))
+        store.insert_unblinded_tokens(tokens)
+
+        first_page = store.get_unblinded_token_page(None, 10)
+        self.expectThat(
+            list(token for (key, token) in first_page),
+            Equals(tokens[:10]),
+        )
+        second_page = store.get_unblinded_token_page(first_page[-1][0], 10)
+        self.expectThat(
+            list(token for (key, token) in second_page),
+            Equals(tokens[10:20]),
+        )
+
+        early = vm_steps(
+            store._connection,
+            lambda: store.get_unblinded_token_page(first_page[-1][0], 10),
+        )
+        [(last_key, ignored)] = store.get_unblinded_token_page(980, 1)
+        late = vm_steps(
+            store._connection,
+            lambda: store.get_unblinded_token_page(last_key - 10, 10),
+        )
+        self.expectThat(late, LessThan(early * 2))
+
+    @given(integers(min_value=0, max_value=50), integers(min_value=1, max_value=20))
+    def test_unblinded_token_pages(self, num_tokens, page_size):
+        """
+        Reading every page with ``get_unblinded_token_page`` produces the same
+        tokens in the same order as ``backup`` regardless of the page size.
+        """
+        configless = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        )
+        store = configless.store
+        store.insert_unblinded_tokens(list(
+            token.unblinded_token
+            for token
+            in dummy_unblinded_tokens(num_tokens)
+        ))
+        tokens = []
+        after = None
+        while True:
+            page = store.get_unblinded_token_page(after, page_size)
+            for (after, token) in page:
+                tokens.append(token)
+            if len(page) < page_size:
+                break
+        self.assertThat(
+            tokens,
+            Equals(store.backup()[u"unblinded-tokens"]),
+        )
+
+    @given(integers(min_value=0, max_value=50), booleans())
+    def test_binary_backup_round_trip(self, num_tokens, compress):
+        """
+        Tokens exported with ``export_binary_backup`` are stored in the same
+        order by ``import_binary_backup``.
+        """
+        tokens = list(t.unblinded_token for t in dummy_unblinded_tokens(num_tokens))
+        source = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        ).store
+        source.insert_unblinded_tokens(tokens)
+        backup = BytesIO()
+        source.export_binary_backup(backup, compress)
+
+        target = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        ).store
+        backup.seek(0)
+        header = target.import_binary_backup(backup, batch_size=7)
+        self.expectThat(header.count, Equals(num_tokens))
+        self.expectThat(
+            target.backup()[u"unblinded-tokens"],
+            Equals(tokens),
+        )
+
+    def test_binary_backup_corrupt(self):
+        """
+        ``import_binary_backup`` raises ``ValueError`` and stores nothing if
+        the backup does not match its checksum.
+        """
+        source = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        ).store
+        source.insert_unblinded_tokens(list(
+            t.unblinded_token
+            for t
+            in dummy_unblinded_tokens(20)
+        ))
+        backup = BytesIO()
+        source.export_binary_backup(backup)
+        corrupt = bytearray(backup.getvalue())
+        corrupt[-1] ^= 0x01
+
+        target = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        ).store
+        self.expectThat(
+            lambda: target.import_binary_backup(BytesIO(bytes(corrupt)), batch_size=7),
+            raises(ValueError),
+        )
+        self.expectThat(
+            target.backup()[u"unblinded-tokens"],
+            Equals([]),
+        )
+
+    def test_snapshot(self):
+        """
+        ``VoucherStore.snapshot`` writes a copy of the database as it was when
+        the copy began, even if the store is changed between steps.
+        """
+        tempdir = self.useFixture(TempDir())
+        path = FilePath(tempdir.join(b"store.sqlite3"))
+        store = VoucherStore(
+            1000000,
+            path,
+            datetime.now,
+            open_and_initialize(path),
+        )
+        tokens = list(t.unblinded_token for t in dummy_unblinded_tokens(50))
+        store.insert_unblinded_tokens(tokens[:40])
+        expected = store.backup()
+
+        target = FilePath(tempdir.join(b"snapshot.sqlite3"))
+        steps = store.snapshot(target, rows_per_step=7)
+        copied, total = next(steps)
+        # The store can still be written while the copy is in progress.
+        store.insert_unblinded_tokens(tokens[40:])
+        progress = list(steps)
+
+        self.expectThat(
+            progress[-1],
+            Equals((total, total)),
+        )
+        self.expectThat(
+            list(copied for (copied, total) in progress),
+            Equals(sorted(copied for (copied, total) in progress)),
+        )
+        copy = VoucherStore(
+            1000000,
+            target,
+            datetime.now,
+            open_and_initialize(target),
+        )
+        self.expectThat(
+            copy.backup(),
+            Equals(expected),
+        )
+        self.expectThat(
+            store.backup()[u"unblinded-tokens"],
+            Equals(tokens),
+        )
+
+    def test_snapshot_in_memory(self):
+        """
+        ``VoucherStore.snapshot`` raises ``ValueError`` for a store which is
+        only held in memory.
+        """
+        store = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        ).store
+        target = FilePath(self.useFixture(TempDir()).join(b"snapshot.sqlite3"))
+        self.expectThat(
+            lambda: store.snapshot(target),
+            raises(ValueError),
+        )
+        self.expectThat(
+            target.exists(),
+            Equals(False),
+        )
+
+    @given(
+        integers(min_value=0, max_value=20),
+        integers(min_value=0, max_value=20),
+        integers(min_value=0, max_value=20),
+        integers(min_value=0, max_value=20),
+    )
+    def test_token_changes(self, first, spent, invalid, second):
+        """
+        Applying the changes from ``get_token_changes`` to a store which was
+        brought up to date by applying the earlier changes brings it up to
+        date again.
+        """
+        tokens = list(
+            t.unblinded_token
+            for t
+            in dummy_unblinded_tokens(first + second)
+        )
+        source = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        ).store
+        target = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        ).store
+
+        source.insert_unblinded_tokens(tokens[:first])
+        changes = source.get_token_changes(0)
+        target.apply_token_changes(changes)
+        self.expectThat(target.backup(), Equals(source.backup()))
+
+        spent = min(spent, first)
+        invalid = min(invalid, first - spent)
+        source.discard_unblinded_tokens(source.get_unblinded_tokens(spent))
+        source.invalidate_unblinded_tokens(
+            u"reason",
+            source.get_unblinded_tokens(invalid),
+        )
+        source.insert_unblinded_tokens(tokens[first:])
+        more_changes = source.get_token_changes(changes[u"sequence"])
+        self.expectThat(
+            more_changes,
+            MatchesDict({
+                u"sequence": GreaterThan(changes[u"sequence"] - 1),
+                u"complete": Equals(False),
+                u"inserted": Equals(tokens[first:]),
+                u"removed": AfterPreprocessing(
+                    sorted,
+                    Equals(sorted(tokens[:spent + invalid])),
+                ),
+            }),
+        )
+        target.apply_token_changes(more_changes)
+        self.expectThat(target.backup(), Equals(source.backup()))
+
+    def test_vacuum_forgets_old_token_changes(self):
+        """
+        ``VoucherStore.vacuum`` forgets removals made more than
+        ``token_changes_retention`` changes ago.
+        """
+        tokens = list(t.unblinded_token for t in dummy_unblinded_tokens(10))
+        store = attr.evolve(
+            self.useFixture(
+                ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+            ).store,
+            token_changes_retention=4,
+        )
+        store.insert_unblinded_tokens(tokens[:5])
+        store.discard_unblinded_tokens(store.get_unblinded_tokens(2))
+        early = store.get_token_changes(0)
+        store.insert_unblinded_tokens(tokens[5:7])
+        recent = store.get_token_changes(0)
+        store.vacuum()
+
+        # The removals are not yet old enough to forget.
+        self.expectThat(
+            store.get_token_changes(early[u"sequence"]),
+            ContainsDict({u"complete": Equals(False)}),
+        )
+
+        store.insert_unblinded_tokens(tokens[7:])
+        store.vacuum()
+
+        self.expectThat(
+            store.get_token_changes(early[u"sequence"]),
+            ContainsDict({
+                u"complete": Equals(True),
+                u"inserted": Equals(tokens[2:]),
+                u"removed": Equals([]),
+            }),
+        )
+        self.expectThat(
+            store.get_token_changes(recent[u"sequence"]),
+            ContainsDict({
+                u"complete": Equals(False),
+                u"inserted": Equals(tokens[7:]),
+            }),
+        )
+
+    def test_pruned_token_changes(self):
+        """
+        After ``prune_token_changes``, ``get_token_changes`` for an earlier
+        sequence number gives every token and says it has done so.
+        """
+        tokens = list(t.unblinded_token for t in dummy_unblinded_tokens(10))
+        store = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        ).store
+        store.insert_unblinded_tokens(tokens[:5])
+        store.discard_unblinded_tokens(store.get_unblinded_tokens(2))
+        changes = store.get_token_changes(0)
+        store.insert_unblinded_tokens(tokens[5:])
+        store.prune_token_changes(changes[u"sequence"])
+
+        self.expectThat(
+            store.get_token_changes(0),
+            MatchesDict({
+                u"sequence": Equals(changes[u"sequence"] + 5),
+                u"complete": Equals(True),
+                u"inserted": Equals(tokens[2:]),
+                u"removed": Equals([]),
+            }),
+        )
+        self.expectThat(
+            store.get_token_changes(changes[u"sequence"]),
+            MatchesDict({
+                u"sequence": Equals(changes[u"sequence"] + 5),
+                u"complete": Equals(False),
+                u"inserted": Equals(tokens[5:]),
+                u"removed": Equals([]),
+            }),
+        )
+
+        target = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        ).store
+        target.insert_unblinded_tokens(tokens[:1])
+        target.apply_token_changes(store.get_token_changes(0))
+        self.expectThat(target.backup(), Equals(store.backup()))
+
+    def test_get_unblinded_tokens_cost_independent_of_in_use(self):
+        """
+        The cost of ``get_unblinded_tokens`` does not depend on how many other
+        tokens are already in use.
+        """
+        configless = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        )
+        store = configless.store
+        store.insert_unblinded_tokens(list(
+            token.unblinded_token
+            for token
+            in dummy_unblinded_tokens(1000)
+        ))
+
+        store.get_unblinded_tokens(10)
+        few_in_use = vm_steps(
+            store._connection,
+            lambda: store.get_unblinded_tokens(1),
+        )
+        store.get_unblinded_tokens(900)
+        many_in_use = vm_steps(
+            store._connection,
+            lambda: store.get_unblinded_tokens(1),
+        )
+        self.assertThat(
+            many_in_use,
+            LessThan(few_in_use * 2),
+        )
+
+    def _shared_store(self, path, get_now):
+        """
+        Open a store on an on-disk database which other stores may also have
+        open, as several processes sharing a node directory would.
+
+        :return VoucherStore: The store.
+        """
+        store = VoucherStore(
+            pass_value=2 ** 15,
+            database_path=path,
+            now=get_now,
+            connection=open_and_initialize(path),
+        )
+        self.addCleanup(store._connection.close)
+        return store
+
+    def _shared_stores(self, count, get_now):
+        """
+        Open several stores on one new on-disk database.
+
+        :return list[VoucherStore]: The stores.
+        """
+        path = FilePath(self.useFixture(TempDir()).join(b"shared.sqlite3"))
+        return list(self._shared_store(path, get_now) for n in range(count))
+
+    def test_shared_reservations(self):
+        """
+        Tokens put in use by one store are not given out by another store
+        sharing its database, even one opened afterwards, until the
+        reservation expires.
+        """
+        now = [datetime(2020, 1, 1)]
+        first, second = self._shared_stores(2, lambda: now[0])
+        self.expectThat(first.owner, Not(Equals(second.owner)))
+        tokens = dummy_unblinded_tokens(4)
+        first.insert_unblinded_tokens(list(t.unblinded_token for t in tokens))
+
+        in_use = first.get_unblinded_tokens(2)
+        self.expectThat(second.get_unblinded_tokens(2), Equals(tokens[2:]))
+
+        third = self._shared_store(first.database_path, lambda: now[0])
+        self.expectThat(
+            lambda: third.get_unblinded_tokens(1),
+            raises(NotEnoughTokens),
+        )
+
+        now[0] += first.reservation_lease
+        self.expectThat(third.get_unblinded_tokens(4), Equals(in_use + tokens[2:]))
+
+    def test_reset_reservations(self):
+        """
+        Tokens which are reset are no longer held by the store which put them
+        in use and another store may give them out at once.
+        """
+        now = [datetime(2020, 1, 1)]
+        first, second = self._shared_stores(2, lambda: now[0])
+        tokens = dummy_unblinded_tokens(1)
+        first.insert_unblinded_tokens(list(t.unblinded_token for t in tokens))
+        first.reset_unblinded_tokens(first.get_unblinded_tokens(1))
+        self.assertThat(second.get_unblinded_tokens(1), Equals(tokens))
+
+    def test_abandoned_reservations(self):
+        """
+        Opening the database frees tokens put in use by a process on this host
+        which has exited, without waiting for their reservations to expire.
+        Tokens put in use by a process which is still running or by one on
+        another host are left in use.
+        """
+        now = [datetime(2020, 1, 1)]
+        [store] = self._shared_stores(1, lambda: now[0])
+        tokens = dummy_unblinded_tokens(3)
+        store.insert_unblinded_tokens(list(t.unblinded_token for t in tokens))
+        store.get_unblinded_tokens(3)
+
+        exited = Popen([executable, "-c", ""])
+        exited.wait()
+        host, pid, ident = store.owner.split(u"/")
+        with store._connection:
+            store._connection.executemany(
+                """
+                UPDATE [unblinded-tokens] SET [owner] = ? WHERE [token] = ?
+                """,
+                [
+                    (
+                        u"/".join([host, unicode(exited.pid), ident]),
+                        b64_to_blob(tokens[0].unblinded_token),
+                    ),
+                    (
+                        u"/".join([u"elsewhere", unicode(exited.pid), ident]),
+                        b64_to_blob(tokens[1].unblinded_token),
+                    ),
+                ],
+            )
+
+        reopened = self._shared_store(store.database_path, lambda: now[0])
+        self.expectThat(reopened.get_unblinded_tokens(1), Equals(tokens[:1]))
+        self.expectThat(
+            lambda: reopened.get_unblinded_tokens(1),
+            raises(NotEnoughTokens),
+        )
+
+
+    def test_abandoned_reserved_tokens(self):
+        """
+        Opening the database frees tokens reserved for a store in a process on
+        this host which has exited.  Tokens reserved for a token shard are
+        left reserved.
+        """
+        now = [datetime(2020, 1, 1)]
+        [store] = self._shared_stores(1, lambda: now[0])
+        tokens = dummy_unblinded_tokens(4)
+        store.insert_unblinded_tokens(list(t.unblinded_token for t in tokens))
+        store.reserve_unblinded_tokens(3)
+        store.reserve_unblinded_tokens(1, u"shard-0")
+
+        exited = Popen([executable, "-c", ""])
+        exited.wait()
+        host, pid, ident = store.owner.split(u"/")
+        with store._connection:
+            store._connection.execute(
+                """
+                UPDATE [unblinded-tokens] SET [owner] = ? WHERE [owner] = ?
+                """,
+                (u"/".join([host, unicode(exited.pid), ident]), store.owner),
+            )
+
+        reopened = self._shared_store(store.database_path, lambda: now[0])
+        self.expectThat(reopened.get_unblinded_tokens(3), Equals(tokens[:3]))
+        self.expectThat(
+            lambda: reopened.get_unblinded_tokens(1),
+            raises(NotEnoughTokens),
+        )
+
+class AsyncVoucherStoreTests(TestCase):
+    """
+    Tests for ``AsyncVoucherStore``.
+    """
+    def setUp(self):
+        super(AsyncVoucherStoreTests, self).setUp()
+        self.calls = []
+
+    def _run(self, f, *a, **kw):
+        """
+        Run a store operation immediately, recording that it was run.
+        """
+        self.calls.append(f)
+        return maybeDeferred(f, *a, **kw)
+
+    @given(
+        tahoe_configs(),
+        datetimes(),
+        vouchers(),
+        dummy_ristretto_keys(),
+        data(),
+    )
+    def test_unblinded_tokens_round_trip(self, get_config, now, voucher_value, public_key, data):
+        """
+        Unblinded tokens added through ``AsyncVoucherStore`` can later be
+        retrieved through it and all of the database work is done using the
+        runner it was given.
+        """
+        del self.calls[:]
+        random_tokens, unblinded_tokens = paired_tokens(data)
+        store = AsyncVoucherStore(
+            self.useFixture(TemporaryVoucherStore(get_config, lambda: now)).store,
+            self._run,
+        )
+        self.assertThat(
+            store.add(voucher_value, len(random_tokens), 0, lambda: random_tokens),
+            succeeded(Always()),
+        )
+        self.assertThat(
+            store.insert_unblinded_tokens_for_voucher(
+                voucher_value,
+                public_key,
+                unblinded_tokens,
+                True,
+            ),
+            succeeded(Always()),
+        )
+        self.assertThat(
+            store.get_unblinded_tokens(len(unblinded_tokens)),
+            succeeded(
+                AfterPreprocessing(set, Equals(set(unblinded_tokens))),
+            ),
+        )
+        self.assertThat(
+            store.get(voucher_value),
+            succeeded(
+                MatchesStructure(
+                    number=Equals(voucher_value),
+                    state=IsInstance(Redeemed),
+                ),
+            ),
+        )
+        self.assertThat(self.calls, HasLength(4))
+
+    @given(
+        tahoe_configs(),
+        posix_safe_datetimes(),
+        lists(integers(min_value=1, max_value=2 ** 16 - 1)),
+    )
+    def test_lease_maintenance_activity(self, get_config, now, sizes):
+        """
+        Lease maintenance activity recorded through ``AsyncVoucherStore`` is
+        reported by its ``get_latest_lease_maintenance_activity``.
+        """
+        store = AsyncVoucherStore(
+            self.useFixture(TemporaryVoucherStore(get_config, lambda: now)).store,
+            self._run,
+        )
+        maintenance = []
+        self.assertThat(
+            store.start_lease_maintenance().addCallback(maintenance.append),
+            succeeded(Always()),
+        )
+        [x] = maintenance
+        for size in sizes:
+            self.assertThat(
+                x.observe([size * store.pass_value]),
+                succeeded(Always()),
+            )
+        self.assertThat(x.finish(), succeeded(Always()))
+        self.assertThat(
+            store.get_latest_lease_maintenance_activity(),
+            succeeded(
+                Equals(LeaseMaintenanceActivity(now, sum(sizes), now, len(sizes), 0)),
+            ),
+        )
+
+    def test_lease_maintenance_batched(self):
+        """
+        Observations made through ``AsyncLeaseMaintenance`` are held in memory
+        and only written to the database, using the runner the store was
+        given, as often as the underlying ``LeaseMaintenance`` allows.
+        """
+        store = AsyncVoucherStore(
+            self.useFixture(
+                ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.utcnow),
+            ).store,
+            self._run,
+        )
+        maintenance = []
+        self.assertThat(
+            store.start_lease_maintenance().addCallback(maintenance.append),
+            succeeded(Always()),
+        )
+        [x] = maintenance
+        x._maintenance.flush_every = 3
+        del self.calls[:]
+
+        for _ in range(2):
+            self.assertThat(x.observe([store.pass_value]), succeeded(Always()))
+        self.expectThat(self.calls, Equals([]))
+        for _ in range(2):
+            self.assertThat(x.observe([store.pass_value]), succeeded(Always()))
+        self.expectThat(self.calls, Equals([x._maintenance.record]))
+        self.assertThat(x.flush(), succeeded(Always()))
+        self.assertThat(x.observe([store.pass_value]), succeeded(Always()))
+        self.assertThat(x.finish(), succeeded(Always()))
+        self.expectThat(
+            self.calls,
+            Equals([
+                x._maintenance.record,
+                x._maintenance.record,
+                x._maintenance.record_finish,
+            ]),
+        )
+        self.assertThat(
+            store.get_latest_lease_maintenance_activity(),
+            succeeded(AfterPreprocessing(
+                lambda activity: (activity.passes_required, activity.checked),
+                Equals((5, 5)),
+            )),
+        )
+
+    def test_snapshot(self):
+        """
+        Each step of a copy made by ``AsyncVoucherStore.snapshot`` is made using
+        the runner the store was given.
+        """
+        tempdir = self.useFixture(TempDir())
+        path = FilePath(tempdir.join(b"store.sqlite3"))
+        store = AsyncVoucherStore(
+            VoucherStore(1000000, path, datetime.utcnow, open_and_initialize(path)),
+            self._run,
+        )
+        tokens = list(t.unblinded_token for t in dummy_unblinded_tokens(20))
+        self.assertThat(store.insert_unblinded_tokens(tokens), succeeded(Always()))
+
+        target = FilePath(tempdir.join(b"snapshot.sqlite3"))
+        snapshotting = store.snapshot(target, rows_per_step=7)
+        self.assertThat(snapshotting, succeeded(Always()))
+        del self.calls[:]
+        progress = []
+        for step in snapshotting.result:
+            step.addCallback(progress.append)
+
+        self.expectThat(progress[-1], Equals(None))
+        self.expectThat(progress[-2][0], Equals(progress[-2][1]))
+        self.expectThat(self.calls, AllMatch(Equals(next)))
+        self.expectThat(self.calls, HasLength(len(progress)))
+        copy = VoucherStore(1000000, target, datetime.utcnow, open_and_initialize(target))
+        self.expectThat(copy.backup()[u"unblinded-tokens"], Equals(tokens))
+
+
+def dummy_unblinded_tokens(count):
+    """
+    Make some syntactically valid but otherwise meaningless unblinded tokens.
+
+    :param int count: The number of tokens to make.
+
+    :return list[UnblindedToken]: The tokens.
+    """
+    return list(
+        UnblindedToken(
+            b64encode(u"{:0>96}".format(n).encode("ascii")).decode("ascii"),
+        )
+        for n
+        in range(count)
+    )
+
+
+def vm_steps(connection, f):
+    """
+    Count the SQLite3 virtual machine instructions executed while calling a
+    function.  This gives a measure of the cost of database operations which
+    does not vary with the speed or load of the machine running the test.
+
+    :param connection: The SQLite3 connection the function will use.
+
+    :param f: A no-argument callable to call.
+
+    :return int: The number of instructions executed.
+    """
+    steps = [0]
+    def step():
+        steps[0] += 1
+        return 0
+    connection.set_progress_handler(step, 1)
+    try:
+        f()
+    finally:
+        connection.set_progress_handler(None, 1)
+    return steps[0]
+
+
 def store_for_test(testcase, get_config, get_now):
     """
     Create a ``VoucherStore`` in a temporary directory associated with the
@@ -49,6 +49,7 @@ from testtools.matchers import (
     ContainsDict,
     MatchesStructure,
     IsInstance,
+    Is,
 )
 from testtools.twistedsupport import (
     succeeded,
@@ -103,6 +104,9 @@ from twisted.test.proto_helpers import (
 from twisted.internet.task import (
     Clock,
 )
+from twisted.internet.testing import (
+    MemoryReactorClock,
+)
 from twisted.web.resource import (
     IResource,
 )
@@ -112,14 +116,19 @@ from twisted.plugins.zkapauthorizer import (
 
 from ..spending import (
     GET_PASSES,
+    TokenReservoir,
+    TokenStateJournal,
+    ShardedTokenPool,
 )
 
 from ..foolscap import (
     RIPrivacyPassAuthorizedStorageServer,
 )
 from ..model import (
+    SHARD_DB_NAME,
     NotEnoughTokens,
     VoucherStore,
+    AsyncVoucherStore,
 )
 from ..controller import (
     IssuerConfigurationMismatch,
@@ -556,6 +565,208 @@ class ClientResourceTests(TestCase):
             Provides([IResource]),
         )
 
+    @given(
+        tahoe_configs(
+            client_dummyredeemer_configurations().map(
+                lambda config: dict(config, **{u"database-thread": u"true"}),
+            ),
+        ),
+    )
+    def test_database_thread(self, get_config):
+        """
+        If the **database-thread** option is set then ``get_client_resource``
+        gives the resource a store which does its work in a dedicated thread
+        and delivers the results to the given reactor.
+        """
+        tempdir = self.useFixture(TempDir())
+        nodedir = tempdir.join(b"node")
+        config = get_config(nodedir, b"tub.port")
+        reactor = _ThreadResultReactor()
+        try:
+            storage_server.get_client_resource(config, reactor=reactor)
+            store = storage_server._get_store(config)
+            listing = store.list()
+        finally:
+            # Stop the database thread, waiting for the work given to it.
+            for (f, a, kw) in reactor.triggers[u"during"][u"shutdown"]:
+                f(*a, **kw)
+        reactor.deliver()
+        self.expectThat(store, IsInstance(AsyncVoucherStore))
+        self.expectThat(listing, succeeded(Equals([])))
+
+
+class _ThreadResultReactor(MemoryReactorClock):
+    """
+    A reactor which holds on to the calls made to it from other threads until
+    ``deliver`` is called.
+    """
+    def __init__(self):
+        MemoryReactorClock.__init__(self)
+        self._from_thread = []
+
+    def callFromThread(self, f, *a, **kw):
+        self._from_thread.append((f, a, kw))
+
+    def deliver(self):
+        while self._from_thread:
+            (f, a, kw) = self._from_thread.pop(0)
+            f(*a, **kw)
+
+
+class TokenSourceTests(TestCase):
+    """
+    Tests for the object from which the plugin's storage clients take tokens
+    to spend.
+    """
+    def _token_source(self, get_config, reactor):
+        """
+        :return: The token source for a new node with the given configuration.
+        """
+        tempdir = self.useFixture(TempDir())
+        nodedir = tempdir.join(b"node")
+        config = get_config(nodedir, b"tub.port")
+        return config, storage_server._get_token_source(config, reactor)
+
+    def _shutdown_triggers(self, reactor):
+        """
+        :return list: The functions called before the reactor shuts down, in
+            order.
+        """
+        return list(
+            f
+            for (f, a, kw)
+            in reactor.triggers.get(u"before", {}).get(u"shutdown", [])
+        )
+
+    @given(tahoe_configs(client_dummyredeemer_configurations()))
+    def test_store(self, get_config):
+        """
+        If none of the token spending options are set then the token source is
+        the node's store and nothing needs to be done at shutdown.
+        """
+        reactor = MemoryReactorClock()
+        config, source = self._token_source(get_config, reactor)
+        self.expectThat(source, Is(storage_server._get_store(config)))
+        self.expectThat(self._shutdown_triggers(reactor), Equals([]))
+
+    @given(
+        tahoe_configs(
+            client_dummyredeemer_configurations().map(
+                lambda config: dict(config, **{
+                    u"token-reservoir-size": u"10",
+                    u"token-reservoir-latency": u"2.5",
+                }),
+            ),
+        ),
+    )
+    def test_reservoir(self, get_config):
+        """
+        If the **token-reservoir-size** option is set then the token source is
+        a ``TokenReservoir`` in front of the node's store which reserves that
+        many tokens at a time and records spending at least as often as
+        **token-reservoir-latency** says.  It records its outstanding
+        spending before shutdown.
+        """
+        reactor = MemoryReactorClock()
+        config, source = self._token_source(get_config, reactor)
+        self.expectThat(source, IsInstance(TokenReservoir))
+        self.expectThat(source.store, Is(storage_server._get_store(config)))
+        self.expectThat(source.clock, Is(reactor))
+        self.expectThat(source.batch_size, Equals(10))
+        self.expectThat(source.max_latency, Equals(2.5))
+        self.expectThat(self._shutdown_triggers(reactor), Equals([source.stop]))
+        self.expectThat(
+            storage_server._get_token_source(config, reactor),
+            Is(source),
+        )
+
+    @given(
+        tahoe_configs(
+            client_dummyredeemer_configurations().map(
+                lambda config: dict(config, **{u"token-commit-latency": u"0.5"}),
+            ),
+        ),
+    )
+    def test_journal(self, get_config):
+        """
+        If the **token-commit-latency** option is set then the token source is
+        a ``TokenStateJournal`` in front of the node's store which waits that
+        long to group changes together.  It records its outstanding changes
+        before shutdown.
+        """
+        reactor = MemoryReactorClock()
+        config, source = self._token_source(get_config, reactor)
+        self.expectThat(source, IsInstance(TokenStateJournal))
+        self.expectThat(source.store, Is(storage_server._get_store(config)))
+        self.expectThat(source.clock, Is(reactor))
+        self.expectThat(source.max_latency, Equals(0.5))
+        self.expectThat(self._shutdown_triggers(reactor), Equals([source.stop]))
+        self.expectThat(
+            storage_server._get_token_source(config, reactor),
+            Is(source),
+        )
+
+    @given(
+        tahoe_configs(
+            client_dummyredeemer_configurations().map(
+                lambda config: dict(config, **{u"token-shards": u"3"}),
+            ),
+        ),
+    )
+    def test_shards(self, get_config):
+        """
+        If the **token-shards** option is set then the token source is a
+        ``ShardedTokenPool`` in front of the node's main store with that many
+        shards, each in its own database file in the node's private
+        directory.  Nothing needs to be done at shutdown.
+        """
+        reactor = MemoryReactorClock()
+        config, source = self._token_source(get_config, reactor)
+        self.expectThat(source, IsInstance(ShardedTokenPool))
+        self.expectThat(source.store, Is(storage_server._get_store(config)))
+        self.expectThat(
+            list(shard.database_path for shard in source.shards),
+            Equals(list(
+                FilePath(config.get_private_path(SHARD_DB_NAME.format(n)))
+                for n
+                in range(3)
+            )),
+        )
+        self.expectThat(self._shutdown_triggers(reactor), Equals([]))
+        self.expectThat(
+            storage_server._get_token_source(config, reactor),
+            Is(source),
+        )
+
+    @given(
+        tahoe_configs(
+            client_dummyredeemer_configurations().map(
+                lambda config: dict(config, **{
+                    u"token-shards": u"2",
+                    u"token-commit-latency": u"0.5",
+                    u"token-reservoir-size": u"10",
+                }),
+            ),
+        ),
+    )
+    def test_shards_behind_journal_and_reservoir(self, get_config):
+        """
+        A token reservoir and a token state journal are put in front of the
+        shards.  Each records its outstanding changes before shutdown, the
+        journal after the reservoir has handed its changes on.
+        """
+        reactor = MemoryReactorClock()
+        config, reservoir = self._token_source(get_config, reactor)
+        self.expectThat(reservoir, IsInstance(TokenReservoir))
+        journal = reservoir.store
+        self.expectThat(journal, IsInstance(TokenStateJournal))
+        self.expectThat(journal.store, IsInstance(ShardedTokenPool))
+        self.expectThat(journal.store.shards, HasLength(2))
+        self.expectThat(
+            self._shutdown_triggers(reactor),
+            Equals([journal.stop, reservoir.stop]),
+        )
+
 
 SERVERS_YAML = b"""
 storage:
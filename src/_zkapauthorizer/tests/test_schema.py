@@ -26,11 +26,160 @@ from testtools import (
 )
 from testtools.matchers import (
     Equals,
+    AfterPreprocessing,
 )
 
+from eliot.testing import (
+    LoggedMessage,
+)
+
+from base64 import (
+    b64encode,
+)
+from datetime import (
+    datetime,
+)
+from sqlite3 import (
+    connect,
+)
+
+from .._epoch import (
+    datetime_to_epoch,
+)
+from ..eliot import (
+    SCHEMA_UPGRADED,
+    SCHEMA_UPGRADE_PROGRESS,
+)
 from ..schema import (
     _UPGRADES,
+    SCHEMA_VERSION,
+    get_schema_version,
+    get_schema_upgrades,
+    run_schema_upgrades,
+    initialize_schema,
+    create_latest_schema,
+    _copy_rows,
+)
+from .eliot import (
+    capture_logging,
 )
+from .fixtures import (
+    LocalTimezone,
+)
+
+
+def upgraded_to(version):
+    """
+    Create an in-memory database with the schema upgraded to exactly the given
+    version.
+
+    :param int version: The version of the schema to create.
+
+    :return: A two-tuple of a connection to the database and a cursor for it.
+    """
+    conn = connect(":memory:")
+    cursor = conn.cursor()
+    upgrades = list(get_schema_upgrades(get_schema_version(cursor)))
+    # Each version contributes its own statements plus one more to
+    # increment the version.
+    num_statements = sum(len(_UPGRADES[n]) + 1 for n in range(version))
+    run_schema_upgrades(upgrades[:num_statements], cursor)
+    return conn, cursor
+
+def describe_schema(cursor):
+    """
+    Describe the tables, columns, indexes, triggers, and rows of a database
+    in a way which does not depend on how they were created.
+
+    :return dict: The description.
+    """
+    cursor.execute(
+        """
+        SELECT [type], [name], [sql] FROM [sqlite_master]
+        WHERE [name] NOT LIKE "sqlite_%"
+        """,
+    )
+    objects = cursor.fetchall()
+    description = {}
+    for (kind, name, sql) in objects:
+        if kind == u"table":
+            cursor.execute("PRAGMA table_info([{}])".format(name))
+            columns = cursor.fetchall()
+            cursor.execute("SELECT * FROM [{}]".format(name))
+            rows = cursor.fetchall()
+            description[(kind, name)] = (columns, sorted(rows))
+        elif kind == u"index":
+            cursor.execute("PRAGMA index_info([{}])".format(name))
+            description[(kind, name)] = cursor.fetchall()
+        else:
+            description[(kind, name)] = u" ".join(sql.split())
+    return description
+
+
+class InitializeTests(TestCase):
+    """
+    Tests for ``initialize_schema`` and ``create_latest_schema``.
+    """
+    def test_latest_schema(self):
+        """
+        ``create_latest_schema`` creates the same schema, with the same initial
+        rows, as applying every upgrade does.
+        """
+        upgraded, upgraded_cursor = upgraded_to(SCHEMA_VERSION)
+        created = connect(":memory:")
+        created_cursor = created.cursor()
+        create_latest_schema(created_cursor)
+        self.assertThat(
+            describe_schema(created_cursor),
+            Equals(describe_schema(upgraded_cursor)),
+        )
+
+    def test_new(self):
+        """
+        ``initialize_schema`` gives a new database the latest schema and
+        records its version in ``user_version``.
+        """
+        conn = connect(":memory:")
+        cursor = conn.cursor()
+        initialize_schema(cursor)
+        self.expectThat(get_schema_version(cursor), Equals(SCHEMA_VERSION))
+        self.expectThat(
+            cursor.execute("PRAGMA user_version").fetchall(),
+            Equals([(SCHEMA_VERSION,)]),
+        )
+
+    def test_old(self):
+        """
+        ``initialize_schema`` upgrades a database with an old schema to the
+        latest version.
+        """
+        conn, cursor = upgraded_to(5)
+        initialize_schema(cursor)
+        self.expectThat(get_schema_version(cursor), Equals(SCHEMA_VERSION))
+        self.expectThat(
+            cursor.execute("PRAGMA user_version").fetchall(),
+            Equals([(SCHEMA_VERSION,)]),
+        )
+
+    def test_current(self):
+        """
+        ``initialize_schema`` recognizes a database which is up to date from
+        its ``user_version`` without reading anything else.
+        """
+        conn = connect(":memory:")
+        cursor = conn.cursor()
+        initialize_schema(cursor)
+        cursor.execute("DROP TABLE [version]")
+        initialize_schema(cursor)
+        self.assertThat(
+            cursor.execute(
+                """
+                SELECT COUNT(*) FROM [sqlite_master] WHERE [name] = "version"
+                """,
+            ).fetchall(),
+            Equals([(0,)]),
+        )
+
 
 class UpgradeTests(TestCase):
     def test_consistency(self):
@@ -41,3 +190,364 @@ class UpgradeTests(TestCase):
             list(_UPGRADES.keys()),
             Equals(list(range(len(_UPGRADES)))),
         )
+
+    def test_tokens_to_blobs(self):
+        """
+        The upgrade from version 6 converts base64 encoded tokens into BLOBs of
+        the raw token bytes, preserving their order and state.
+        """
+        raw = list(
+            u"{:0>96}".format(n).encode("ascii")
+            for n
+            in range(3)
+        )
+        encoded = list(b64encode(r).decode("ascii") for r in raw)
+        conn, cursor = upgraded_to(6)
+        cursor.execute(
+            """
+            INSERT INTO [vouchers] ([number], [created]) VALUES (?, ?)
+            """,
+            (u"voucher", u"2020-01-01 00:00:00"),
+        )
+        cursor.executemany(
+            """
+            INSERT INTO [tokens] ([text], [voucher], [counter]) VALUES (?, ?, ?)
+            """,
+            list((token, u"voucher", 0) for token in encoded),
+        )
+        cursor.executemany(
+            """
+            INSERT INTO [unblinded-tokens] ([token], [state]) VALUES (?, ?)
+            """,
+            [(encoded[0], u"free"), (encoded[1], u"in-use")],
+        )
+        cursor.execute(
+            """
+            INSERT INTO [invalid-unblinded-tokens] ([token], [reason]) VALUES (?, ?)
+            """,
+            (encoded[2], u"reason"),
+        )
+
+        run_schema_upgrades(get_schema_upgrades(6), cursor)
+
+        cursor.execute("SELECT [text] FROM [tokens] ORDER BY [rowid]")
+        self.assertThat(
+            list(bytes(text) for (text,) in cursor.fetchall()),
+            Equals(raw),
+        )
+        cursor.execute("SELECT [token], [state] FROM [unblinded-tokens] ORDER BY [id]")
+        self.assertThat(
+            list((bytes(token), state) for (token, state) in cursor.fetchall()),
+            Equals([(raw[0], u"free"), (raw[1], u"in-use")]),
+        )
+        cursor.execute("SELECT [token], [reason] FROM [invalid-unblinded-tokens]")
+        self.assertThat(
+            list((bytes(token), reason) for (token, reason) in cursor.fetchall()),
+            Equals([(raw[2], u"reason")]),
+        )
+
+    def test_token_inventory(self):
+        """
+        The upgrade from version 9 counts the tokens already present in each
+        state and the counts are kept current as tokens change state.
+        """
+        conn, cursor = upgraded_to(9)
+        cursor.executemany(
+            """
+            INSERT INTO [unblinded-tokens] ([token], [state]) VALUES (?, ?)
+            """,
+            [(b"a", u"free"), (b"b", u"free"), (b"c", u"in-use"), (b"d", u"reserved")],
+        )
+        cursor.execute(
+            """
+            INSERT INTO [invalid-unblinded-tokens] ([token], [reason]) VALUES (?, ?)
+            """,
+            (b"e", u"reason"),
+        )
+
+        run_schema_upgrades(get_schema_upgrades(9), cursor)
+
+        def inventory():
+            cursor.execute("SELECT [state], [count] FROM [token-inventory]")
+            return dict(cursor.fetchall())
+
+        self.assertThat(
+            inventory(),
+            Equals({
+                u"free": 2,
+                u"in-use": 1,
+                u"reserved": 1,
+                u"invalid": 1,
+                u"spent": 0,
+            }),
+        )
+
+        cursor.execute(
+            """
+            INSERT INTO [unblinded-tokens] ([token]) VALUES (?)
+            """,
+            (b"f",),
+        )
+        cursor.execute(
+            """
+            UPDATE [unblinded-tokens] SET [state] = "in-use" WHERE [token] = ?
+            """,
+            (b"a",),
+        )
+        cursor.execute(
+            """
+            DELETE FROM [unblinded-tokens] WHERE [token] = ?
+            """,
+            (b"c",),
+        )
+        self.assertThat(
+            inventory(),
+            Equals({
+                u"free": 2,
+                u"in-use": 1,
+                u"reserved": 1,
+                u"invalid": 1,
+                u"spent": 0,
+            }),
+        )
+
+    def test_token_changes(self):
+        """
+        The upgrade from version 10 records every token already present as
+        inserted, in the order they will be used, and afterwards each
+        insertion or removal of a token replaces that token's record with
+        one at the end of the sequence.
+        """
+        conn, cursor = upgraded_to(10)
+        cursor.executemany(
+            """
+            INSERT INTO [unblinded-tokens] ([token]) VALUES (?)
+            """,
+            [(b"a",), (b"b",), (b"c",)],
+        )
+
+        run_schema_upgrades(get_schema_upgrades(10), cursor)
+
+        def changes():
+            cursor.execute(
+                """
+                SELECT [token], [present] FROM [token-changes] ORDER BY [sequence]
+                """,
+            )
+            return list((bytes(token), present) for (token, present) in cursor.fetchall())
+
+        self.assertThat(
+            changes(),
+            Equals([(b"a", 1), (b"b", 1), (b"c", 1)]),
+        )
+
+        cursor.execute(
+            """
+            DELETE FROM [unblinded-tokens] WHERE [token] = ?
+            """,
+            (b"a",),
+        )
+        cursor.execute(
+            """
+            INSERT INTO [unblinded-tokens] ([token]) VALUES (?)
+            """,
+            (b"d",),
+        )
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO [unblinded-tokens] ([token]) VALUES (?)
+            """,
+            (b"b",),
+        )
+        self.assertThat(
+            changes(),
+            Equals([(b"b", 1), (b"c", 1), (b"a", 0), (b"d", 1)]),
+        )
+
+        # A token which was removed can be inserted again, even by a
+        # statement which ignores conflicts.
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO [unblinded-tokens] ([token]) VALUES (?)
+            """,
+            (b"a",),
+        )
+        self.assertThat(
+            changes(),
+            Equals([(b"b", 1), (b"c", 1), (b"d", 1), (b"a", 1)]),
+        )
+
+    def test_epoch_times(self):
+        """
+        The upgrade from version 13 converts the times of vouchers and of lease
+        maintenance activity, which were written in local time, to integer
+        numbers of microseconds since the epoch.
+        """
+        # Five hours behind UTC and with no daylight saving time.
+        self.useFixture(LocalTimezone(b"EST+05"))
+        conn, cursor = upgraded_to(13)
+        cursor.executemany(
+            """
+            INSERT INTO [vouchers] ([number], [created], [state], [finished]) VALUES (?, ?, ?, ?)
+            """,
+            [
+                (u"a", u"2020-01-02 03:04:05.678901", u"pending", None),
+                (u"b", u"1970-01-01 00:00:01", u"redeemed", u"1970-01-01 00:00:02"),
+            ],
+        )
+        cursor.execute(
+            """
+            INSERT INTO [lease-maintenance-spending] ([started], [finished], [count])
+            VALUES (?, ?, ?)
+            """,
+            (u"1970-01-01 00:00:03", u"1970-01-01 00:00:04.5", 7),
+        )
+
+        run_schema_upgrades(get_schema_upgrades(13), cursor)
+
+        cursor.execute(
+            """
+            SELECT [number], [created], [state], [finished] FROM [vouchers] ORDER BY [number]
+            """,
+        )
+        self.assertThat(
+            cursor.fetchall(),
+            Equals([
+                (u"a", datetime_to_epoch(datetime(2020, 1, 2, 8, 4, 5, 678901)), u"pending", None),
+                (u"b", 18001000000, u"redeemed", 18002000000),
+            ]),
+        )
+        cursor.execute(
+            """
+            SELECT [started], [finished], [count] FROM [lease-maintenance-spending]
+            """,
+        )
+        self.assertThat(
+            cursor.fetchall(),
+            Equals([(18003000000, 18004500000, 7)]),
+        )
+
+    def test_vouchers_state_index(self):
+        """
+        The upgrade from version 11 adds the index used to find vouchers in one
+        state and no later upgrade removes it.  No index is added only to be
+        dropped again.
+        """
+        def indexes(version):
+            conn, cursor = upgraded_to(version)
+            cursor.execute("PRAGMA index_list([vouchers])")
+            return set(
+                name
+                for (seq, name, unique, origin, partial)
+                in cursor.fetchall()
+                if origin == u"c"
+            )
+        self.expectThat(indexes(11), Equals(set()))
+        for version in range(12, SCHEMA_VERSION + 1):
+            self.expectThat(
+                indexes(version),
+                AfterPreprocessing(
+                    lambda names: (u"vouchers-state-created" in names, u"vouchers-state" in names),
+                    Equals((True, False)),
+                ),
+            )
+
+    def test_reservation_expiry(self):
+        """
+        The upgrade from version 14 gives tokens already in use a reservation
+        which has already expired and gives other tokens none.
+        """
+        conn, cursor = upgraded_to(14)
+        cursor.executemany(
+            """
+            INSERT INTO [unblinded-tokens] ([token], [state]) VALUES (?, ?)
+            """,
+            [(b"a", u"free"), (b"b", u"in-use"), (b"c", u"reserved")],
+        )
+
+        run_schema_upgrades(get_schema_upgrades(14), cursor)
+
+        cursor.execute(
+            """
+            SELECT [token], [state], [owner], [expires] FROM [unblinded-tokens] ORDER BY [id]
+            """,
+        )
+        self.assertThat(
+            list((bytes(token), state, owner, expires) for (token, state, owner, expires) in cursor.fetchall()),
+            Equals([
+                (b"a", u"free", None, None),
+                (b"b", u"in-use", None, 0),
+                (b"c", u"reserved", None, None),
+            ]),
+        )
+
+    def test_lease_maintenance_counts(self):
+        """
+        The upgrade from version 15 leaves the numbers of storage indexes
+        checked and renewed unknown for lease maintenance runs which are
+        already recorded.
+        """
+        conn, cursor = upgraded_to(15)
+        cursor.execute(
+            """
+            INSERT INTO [lease-maintenance-spending] ([started], [finished], [count])
+            VALUES (?, ?, ?)
+            """,
+            (3000000, 4500000, 7),
+        )
+
+        run_schema_upgrades(get_schema_upgrades(15), cursor)
+
+        cursor.execute(
+            """
+            SELECT [started], [finished], [count], [checked], [renewed]
+            FROM [lease-maintenance-spending]
+            """,
+        )
+        self.assertThat(
+            cursor.fetchall(),
+            Equals([(3000000, 4500000, 7, None, None)]),
+        )
+
+    @capture_logging(lambda self, logger: logger.validate())
+    def test_progress(self, logger):
+        """
+        Each upgraded version is logged and so is the progress of copying
+        rows in batches.
+        """
+        conn, cursor = upgraded_to(0)
+        cursor.execute("CREATE TABLE [a] ([x])")
+        cursor.execute("CREATE TABLE [b] ([x])")
+        cursor.executemany("INSERT INTO [a] VALUES (?)", list((n,) for n in range(5)))
+
+        _copy_rows(
+            u"a",
+            "SELECT [x] FROM [a] ORDER BY [x]",
+            "INSERT INTO [b] VALUES (?)",
+            lambda (x,): (x * 2,),
+            batch_size=2,
+        )(cursor)
+        run_schema_upgrades(get_schema_upgrades(0), cursor)
+
+        self.expectThat(
+            cursor.execute("SELECT [x] FROM [b] ORDER BY [x]").fetchall(),
+            Equals([(0,), (2,), (4,), (6,), (8,)]),
+        )
+        self.expectThat(
+            LoggedMessage.of_type(logger.messages, SCHEMA_UPGRADE_PROGRESS)[:3],
+            AfterPreprocessing(
+                lambda logged: list(
+                    (m.message[u"rows"], m.message[u"total"])
+                    for m
+                    in logged
+                ),
+                Equals([(2, 5), (4, 5), (5, 5)]),
+            ),
+        )
+        self.expectThat(
+            LoggedMessage.of_type(logger.messages, SCHEMA_UPGRADED),
+            AfterPreprocessing(
+                lambda logged: list(m.message[u"version"] for m in logged),
+                Equals(list(range(1, SCHEMA_VERSION + 1))),
+            ),
+        )
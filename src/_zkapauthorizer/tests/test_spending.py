@@ -16,6 +16,10 @@
 Tests for ``_zkapauthorizer.spending``.
 """
 
+from datetime import (
+    datetime,
+)
+
 from testtools import (
     TestCase,
 )
@@ -26,9 +30,27 @@ from testtools.matchers import (
     MatchesStructure,
     HasLength,
     AfterPreprocessing,
+    AllMatch,
+    ContainsDict,
 )
 from testtools.twistedsupport import (
     succeeded,
+    failed,
+    has_no_result,
+)
+
+from fixtures import (
+    TempDir,
+)
+
+from twisted.python.filepath import (
+    FilePath,
+)
+from twisted.internet.task import (
+    Clock,
+)
+from twisted.internet.defer import (
+    maybeDeferred,
 )
 
 from hypothesis import (
@@ -38,25 +60,38 @@ from hypothesis.strategies import (
     integers,
     randoms,
     data,
+    lists,
 )
 
 from .strategies import (
     vouchers,
     pass_counts,
     posix_safe_datetimes,
+    unblinded_tokens,
 )
 from .matchers import (
     Provides,
+    raises,
 )
 from .fixtures import (
     ConfiglessMemoryVoucherStore,
 )
+from ..model import (
+    AsyncVoucherStore,
+    VoucherStore,
+    NotEnoughTokens,
+    open_and_initialize,
+)
 from ..controller import (
     DummyRedeemer,
 )
 from ..spending import (
     IPassGroup,
     SpendingController,
+    TokenReservoir,
+    TokenStateJournal,
+    ShardedTokenPool,
+    _shard_holder,
 )
 
 class PassGroupTests(TestCase):
@@ -97,6 +132,42 @@ class PassGroupTests(TestCase):
             ),
         )
 
+    @given(vouchers(), pass_counts(), posix_safe_datetimes())
+    def test_get_async(self, voucher, num_passes, now):
+        """
+        If ``SpendingController`` is given a store which returns ``Deferred``
+        results then ``IPassFactory.get`` returns a ``Deferred`` which fires
+        with an ``IPassGroup`` provider containing the requested number of
+        passes.
+        """
+        configless = self.useFixture(
+            ConfiglessMemoryVoucherStore(
+                DummyRedeemer(),
+                lambda: now,
+            ),
+        )
+        self.assertThat(
+            configless.redeem(voucher, num_passes),
+            succeeded(Always()),
+        )
+
+        pass_factory = SpendingController.for_store(
+            tokens_to_passes=configless.redeemer.tokens_to_passes,
+            store=AsyncVoucherStore(configless.store, maybeDeferred),
+        )
+
+        self.assertThat(
+            pass_factory.get(u"message", num_passes),
+            succeeded(
+                MatchesAll(
+                    Provides([IPassGroup]),
+                    MatchesStructure(
+                        passes=HasLength(num_passes),
+                    ),
+                ),
+            ),
+        )
+
     def _test_token_group_operation(
             self,
             operation,
@@ -209,3 +280,453 @@ class PassGroupTests(TestCase):
             random,
             data,
         )
+
+
+class TokenReservoirTests(TestCase):
+    """
+    Tests for ``TokenReservoir``.
+    """
+    def _store(self, tokens, path=None):
+        """
+        Open a store in a new temporary directory, or at an existing location,
+        and insert some tokens into it.
+        """
+        if path is None:
+            path = FilePath(self.useFixture(TempDir()).join(b"store.sqlite3"))
+        store = VoucherStore(
+            pass_value=2 ** 15,
+            database_path=path,
+            now=datetime.now,
+            connection=open_and_initialize(path),
+        )
+        store.insert_unblinded_tokens(list(t.unblinded_token for t in tokens))
+        return store
+
+    @given(lists(unblinded_tokens(), min_size=6, max_size=20, unique=True))
+    def test_reserves_batches(self, tokens):
+        """
+        ``TokenReservoir.get_unblinded_tokens`` reserves a whole batch of tokens
+        from the store and gives them out in the order they were inserted.
+        """
+        store = self._store(tokens)
+        reservoir = TokenReservoir(store, Clock(), batch_size=5)
+
+        self.expectThat(reservoir.get_unblinded_tokens(2), Equals(tokens[:2]))
+        self.expectThat(reservoir.get_unblinded_tokens(3), Equals(tokens[2:5]))
+        # Only tokens beyond the first batch are still free in the store.
+        self.expectThat(
+            store.get_unblinded_tokens(len(tokens) - 5),
+            Equals(tokens[5:]),
+        )
+        self.expectThat(
+            lambda: reservoir.get_unblinded_tokens(1),
+            raises(NotEnoughTokens),
+        )
+
+    @given(lists(unblinded_tokens(), min_size=10, max_size=20, unique=True))
+    def test_spending_written_later(self, tokens):
+        """
+        Tokens given to ``TokenReservoir.discard_unblinded_tokens`` are
+        discarded from the store after ``max_latency`` seconds or as soon as a
+        batch of them has been spent, whichever is first.
+        """
+        store = self._store(tokens)
+        clock = Clock()
+        reservoir = TokenReservoir(store, clock, batch_size=5, max_latency=3)
+
+        def stored():
+            return len(store.backup()[u"unblinded-tokens"])
+
+        reservoir.discard_unblinded_tokens(reservoir.get_unblinded_tokens(2))
+        self.expectThat(stored(), Equals(len(tokens)))
+        clock.advance(3)
+        self.expectThat(stored(), Equals(len(tokens) - 2))
+
+        reservoir.discard_unblinded_tokens(reservoir.get_unblinded_tokens(5))
+        self.expectThat(stored(), Equals(len(tokens) - 7))
+        self.expectThat(clock.getDelayedCalls(), Equals([]))
+
+    @given(lists(unblinded_tokens(), min_size=10, max_size=20, unique=True))
+    def test_reset(self, tokens):
+        """
+        Tokens given to ``TokenReservoir.reset_unblinded_tokens`` are given out
+        again before any others.
+        """
+        store = self._store(tokens)
+        reservoir = TokenReservoir(store, Clock(), batch_size=5)
+
+        reservoir.reset_unblinded_tokens(reservoir.get_unblinded_tokens(3))
+        self.assertThat(reservoir.get_unblinded_tokens(4), Equals(tokens[:4]))
+
+    @given(lists(unblinded_tokens(), min_size=10, max_size=20, unique=True))
+    def test_unrecorded_spending_not_reused(self, tokens):
+        """
+        If the store is opened again without the reservoir having recorded
+        spending, while the process the reservoir is in may still be running,
+        then none of the tokens which the reservoir reserved are given out
+        again.
+        """
+        store = self._store(tokens)
+        reservoir = TokenReservoir(store, Clock(), batch_size=5)
+        reservoir.discard_unblinded_tokens(reservoir.get_unblinded_tokens(2))
+        store._connection.close()
+
+        store = self._store([], store.database_path)
+        self.expectThat(
+            store.get_unblinded_tokens(len(tokens) - 5),
+            Equals(tokens[5:]),
+        )
+        self.expectThat(
+            lambda: store.get_unblinded_tokens(1),
+            raises(NotEnoughTokens),
+        )
+
+    @given(lists(unblinded_tokens(), min_size=10, max_size=20, unique=True))
+    def test_stop(self, tokens):
+        """
+        ``TokenReservoir.stop`` records outstanding spending and returns tokens
+        which were not given out to the store.
+        """
+        store = self._store(tokens)
+        reservoir = TokenReservoir(store, Clock(), batch_size=5)
+        reservoir.discard_unblinded_tokens(reservoir.get_unblinded_tokens(2))
+        reservoir.stop()
+
+        self.assertThat(
+            store.get_unblinded_tokens(len(tokens) - 2),
+            Equals(tokens[2:]),
+        )
+
+
+class TokenStateJournalTests(TestCase):
+    """
+    Tests for ``TokenStateJournal``.
+    """
+    @given(lists(unblinded_tokens(), min_size=6, max_size=20, unique=True))
+    def test_coalesced(self, tokens):
+        """
+        Changes requested within ``max_latency`` seconds of each other are
+        recorded together in one transaction after at most that long.
+        """
+        store = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        ).store
+        store.insert_unblinded_tokens(list(t.unblinded_token for t in tokens))
+        clock = Clock()
+        journal = TokenStateJournal(store, clock, max_latency=2)
+
+        results = [
+            journal.discard_unblinded_tokens(journal.get_unblinded_tokens(2)),
+            journal.invalidate_unblinded_tokens(
+                u"reason",
+                journal.get_unblinded_tokens(1),
+            ),
+            journal.reset_unblinded_tokens(journal.get_unblinded_tokens(3)),
+        ]
+        self.expectThat(
+            store.backup()[u"unblinded-tokens"],
+            HasLength(len(tokens)),
+        )
+        self.expectThat(results, AllMatch(has_no_result()))
+
+        clock.advance(2)
+        self.expectThat(results, AllMatch(succeeded(Always())))
+        self.expectThat(
+            store.backup()[u"unblinded-tokens"],
+            Equals(list(t.unblinded_token for t in tokens[3:])),
+        )
+        # The reset tokens are free again.
+        self.expectThat(
+            store.get_unblinded_tokens(len(tokens) - 3),
+            Equals(tokens[3:]),
+        )
+        self.expectThat(
+            journal,
+            MatchesStructure(
+                operations=Equals(3),
+                commits=Equals(1),
+            ),
+        )
+
+    @given(lists(unblinded_tokens(), min_size=4, max_size=20, unique=True))
+    def test_stop(self, tokens):
+        """
+        ``TokenStateJournal.stop`` records outstanding changes and later changes
+        are recorded immediately.
+        """
+        store = self.useFixture(
+            ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+        ).store
+        store.insert_unblinded_tokens(list(t.unblinded_token for t in tokens))
+        journal = TokenStateJournal(store, Clock(), max_latency=2)
+
+        first = journal.discard_unblinded_tokens(journal.get_unblinded_tokens(1))
+        self.expectThat(journal.stop(), succeeded(Always()))
+        self.expectThat(first, succeeded(Always()))
+        self.expectThat(
+            journal.discard_unblinded_tokens(journal.get_unblinded_tokens(1)),
+            succeeded(Always()),
+        )
+        self.expectThat(
+            store.backup()[u"unblinded-tokens"],
+            HasLength(len(tokens) - 2),
+        )
+
+
+class ShardedTokenPoolTests(TestCase):
+    """
+    Tests for ``ShardedTokenPool``.
+    """
+    def _pool(self, tokens, shards, batch_size):
+        """
+        Create a pool with a main store holding some tokens and some empty
+        shards.
+        """
+        def store():
+            return self.useFixture(
+                ConfiglessMemoryVoucherStore(DummyRedeemer(), datetime.now),
+            ).store
+        main = store()
+        main.insert_unblinded_tokens(list(t.unblinded_token for t in tokens))
+        return ShardedTokenPool(
+            main,
+            list(store() for n in range(shards)),
+            batch_size,
+        )
+
+    def _get(self, pool, count):
+        """
+        Get some tokens from a pool.
+
+        :return list[UnblindedToken]: The tokens.
+        """
+        result = []
+        pool.get_unblinded_tokens(count).addCallback(result.extend)
+        self.assertThat(result, HasLength(count))
+        return result
+
+    def _held(self, store):
+        """
+        :return list[unicode]: The tokens a store still has.
+        """
+        return store.backup()[u"unblinded-tokens"]
+
+    @given(lists(unblinded_tokens(), min_size=8, max_size=20, unique=True))
+    def test_round_robin(self, tokens):
+        """
+        ``ShardedTokenPool.get_unblinded_tokens`` gives requests to each shard
+        in turn and moves a batch of tokens from the main store to a shard
+        which does not have enough.
+        """
+        pool = self._pool(tokens, shards=2, batch_size=3)
+        self.expectThat(pool.get_unblinded_tokens(2), succeeded(Equals(tokens[:2])))
+        self.expectThat(pool.get_unblinded_tokens(2), succeeded(Equals(tokens[3:5])))
+        self.expectThat(pool.get_unblinded_tokens(1), succeeded(Equals(tokens[2:3])))
+        self.expectThat(
+            list(self._held(shard) for shard in pool.shards),
+            Equals([
+                list(t.unblinded_token for t in tokens[:3]),
+                list(t.unblinded_token for t in tokens[3:6]),
+            ]),
+        )
+        # Moved tokens are never given out by the main store.
+        self.expectThat(
+            pool.store.get_unblinded_tokens(len(tokens) - 6),
+            Equals(tokens[6:]),
+        )
+
+    @given(lists(unblinded_tokens(), min_size=3, max_size=3, unique=True))
+    def test_not_enough(self, tokens):
+        """
+        If the main store cannot refill a shard then another shard is used.
+        If none has enough, the result fails with ``NotEnoughTokens``.
+        """
+        pool = self._pool(tokens, shards=2, batch_size=3)
+        self.expectThat(pool.get_unblinded_tokens(1), succeeded(Equals(tokens[:1])))
+        self.expectThat(pool.get_unblinded_tokens(2), succeeded(Equals(tokens[1:])))
+        self.expectThat(
+            pool.get_unblinded_tokens(1),
+            failed(AfterPreprocessing(lambda f: f.type, Equals(NotEnoughTokens))),
+        )
+
+    @given(lists(unblinded_tokens(), min_size=8, max_size=20, unique=True))
+    def test_routing(self, tokens):
+        """
+        Tokens are discarded, invalidated and reset in the shard which gave
+        them out.
+        """
+        pool = self._pool(tokens, shards=2, batch_size=4)
+        first = self._get(pool, 3)
+        second = self._get(pool, 3)
+
+        self.expectThat(
+            pool.discard_unblinded_tokens(first[:1] + second[:1]),
+            succeeded(Equals(None)),
+        )
+        self.expectThat(
+            pool.invalidate_unblinded_tokens(u"reason", first[1:2] + second[1:2]),
+            succeeded(Equals(None)),
+        )
+        self.expectThat(
+            pool.reset_unblinded_tokens(first[2:] + second[2:]),
+            succeeded(Equals(None)),
+        )
+        self.expectThat(
+            list(self._held(shard) for shard in pool.shards),
+            Equals([
+                list(t.unblinded_token for t in tokens[2:4]),
+                list(t.unblinded_token for t in tokens[6:8]),
+            ]),
+        )
+        self.expectThat(
+            pool.shards[0].get_unblinded_tokens(2),
+            Equals(tokens[2:4]),
+        )
+
+    @given(lists(unblinded_tokens(), min_size=8, max_size=20, unique=True))
+    def test_update(self, tokens):
+        """
+        ``ShardedTokenPool.update_unblinded_tokens`` records each change in the
+        shard which gave out the token.
+        """
+        pool = self._pool(tokens, shards=2, batch_size=4)
+        first = self._get(pool, 3)
+        second = self._get(pool, 3)
+
+        self.expectThat(
+            pool.update_unblinded_tokens(
+                first[:1] + second[:1],
+                [(u"reason", first[1:2] + second[1:2])],
+                first[2:] + second[2:],
+            ),
+            succeeded(Equals(None)),
+        )
+        self.expectThat(
+            list(self._held(shard) for shard in pool.shards),
+            Equals([
+                list(t.unblinded_token for t in tokens[2:4]),
+                list(t.unblinded_token for t in tokens[6:8]),
+            ]),
+        )
+        self.expectThat(
+            pool.shards[1].get_unblinded_tokens(2),
+            Equals(tokens[6:8]),
+        )
+
+    def _restarted(self, pool):
+        """
+        :return ShardedTokenPool: A new pool using the same stores, as after a
+            restart.
+        """
+        return ShardedTokenPool(pool.store, pool.shards, pool.batch_size)
+
+    @given(lists(unblinded_tokens(), min_size=8, max_size=20, unique=True))
+    def test_main_store_accounting(self, tokens):
+        """
+        The main store keeps the tokens moved to shards until they are spent or
+        invalidated so its backup, token counts and token changes cover the
+        shards.
+        """
+        pool = self._pool(tokens, shards=2, batch_size=4)
+        first = self._get(pool, 3)
+        second = self._get(pool, 3)
+        since = pool.store.get_token_changes(0)[u"sequence"]
+
+        self.expectThat(
+            pool.update_unblinded_tokens(
+                first[:1],
+                [(u"reason", second[:1])],
+                first[1:] + second[1:],
+            ),
+            succeeded(Equals(None)),
+        )
+        used = first[:1] + second[:1]
+        self.expectThat(
+            self._held(pool.store),
+            Equals(list(t.unblinded_token for t in tokens if t not in used)),
+        )
+        self.expectThat(
+            pool.store.inventory(),
+            ContainsDict({
+                u"free": Equals(len(tokens) - 8),
+                u"reserved": Equals(6),
+                u"invalid": Equals(1),
+                u"spent": Equals(1),
+            }),
+        )
+        self.expectThat(
+            pool.store.get_token_changes(since)[u"removed"],
+            Equals(list(t.unblinded_token for t in used)),
+        )
+
+    @given(lists(unblinded_tokens(), min_size=8, max_size=20, unique=True))
+    def test_recover_interrupted_move(self, tokens):
+        """
+        Tokens reserved for a shard by a move which stopped before inserting
+        them into the shard are inserted when the pool is next used.
+        """
+        pool = self._pool(tokens, shards=2, batch_size=3)
+        pool.store.reserve_unblinded_tokens(3, _shard_holder(0))
+
+        pool = self._restarted(pool)
+        self.expectThat(pool.get_unblinded_tokens(2), succeeded(Equals(tokens[:2])))
+        self.expectThat(
+            self._held(pool.shards[0]),
+            Equals(list(t.unblinded_token for t in tokens[:3])),
+        )
+        # The shard did not need to be refilled.
+        self.expectThat(
+            pool.store.inventory()[u"free"],
+            Equals(len(tokens) - 3),
+        )
+
+    @given(lists(unblinded_tokens(), min_size=8, max_size=20, unique=True))
+    def test_recover_interrupted_removal(self, tokens):
+        """
+        Tokens removed from the main store by a spend which stopped before
+        removing them from the shard are removed from the shard when the pool
+        is next used rather than being given out again.
+        """
+        pool = self._pool(tokens, shards=1, batch_size=4)
+        given = self._get(pool, 2)
+        # Only the first of the two transactions is done.
+        pool.store.discard_unblinded_tokens(given)
+
+        pool = self._restarted(pool)
+        self.expectThat(pool.get_unblinded_tokens(2), succeeded(Equals(tokens[2:4])))
+        self.expectThat(
+            self._held(pool.shards[0]),
+            Equals(list(t.unblinded_token for t in tokens[2:4])),
+        )
+
+    @given(lists(unblinded_tokens(), min_size=8, max_size=20, unique=True))
+    def test_recover_unrecorded_holder(self, tokens):
+        """
+        Tokens a shard has which the main store reserved without recording a
+        holder are taken to be held by the shard and are removed from the main
+        store when they are spent.
+        """
+        pool = self._pool(tokens, shards=1, batch_size=4)
+        moved = pool.store.reserve_unblinded_tokens(4)
+        pool.shards[0].insert_unblinded_tokens(
+            list(t.unblinded_token for t in moved),
+        )
+        with pool.store._connection:
+            pool.store._connection.execute(
+                """
+                UPDATE [unblinded-tokens] SET [owner] = NULL WHERE [state] = "reserved"
+                """,
+            )
+
+        pool = self._restarted(pool)
+        spent = self._get(pool, 2)
+        self.expectThat(spent, Equals(tokens[:2]))
+        self.expectThat(pool.discard_unblinded_tokens(spent), succeeded(Equals(None)))
+        self.expectThat(
+            self._held(pool.store),
+            Equals(list(t.unblinded_token for t in tokens[2:])),
+        )
+        self.expectThat(
+            self._held(pool.shards[0]),
+            Equals(list(t.unblinded_token for t in tokens[2:4])),
+        )
@@ -41,6 +41,7 @@ from testtools.matchers import (
 from testtools.twistedsupport import (
     succeeded,
     failed,
+    has_no_result,
 )
 
 from hypothesis import (
@@ -51,6 +52,7 @@ from hypothesis.strategies import (
 )
 
 from twisted.internet.defer import (
+    Deferred,
     succeed,
     fail,
 )
@@ -240,6 +242,47 @@ class CallWithPassesTests(TestCase):
             ),
         )
 
+    @given(pass_counts())
+    def test_wait_for_invalidation(self, num_passes):
+        """
+        ``call_with_passes`` waits for rejected passes to be marked invalid
+        before it tries calling the given method again.
+        """
+        passes = pass_factory(integer_passes(num_passes * 2))
+        recording = []
+        mark_invalid = passes._mark_invalid
+
+        def slow_mark_invalid(reason, rejected):
+            mark_invalid(reason, rejected)
+            d = Deferred()
+            recording.append(d)
+            return d
+        passes._mark_invalid = slow_mark_invalid
+
+        calls = []
+
+        def reject_first_call(group):
+            calls.append(group.passes)
+            if len(calls) == 1:
+                _ValidationResult(
+                    valid=[],
+                    signature_check_failed=list(range(num_passes)),
+                ).raise_for(num_passes)
+            return None
+
+        result = call_with_passes(
+            reject_first_call,
+            num_passes,
+            partial(passes.get, u"message"),
+        )
+        self.expectThat(result, has_no_result())
+        self.expectThat(calls, HasLength(1))
+        self.expectThat(recording, HasLength(1))
+
+        recording[0].callback(None)
+        self.expectThat(result, succeeded(Always()))
+        self.expectThat(calls, HasLength(2))
+
     @given(pass_counts())
     def test_pass_through_too_few_passes(self, num_passes):
         """